@@ -0,0 +1,218 @@
+import numpy as np
+import pandas as pd
+
+# Esquema mínimo de la base fuente (Rapidos_FuriososBD) que usan las consultas de etl/extract.py
+SOURCE_DDL = {
+    'departamento': """
+    CREATE TABLE departamento (
+        departamento_id INTEGER PRIMARY KEY,
+        nombre VARCHAR(100)
+    )""",
+    'ciudad': """
+    CREATE TABLE ciudad (
+        ciudad_id INTEGER PRIMARY KEY,
+        nombre VARCHAR(100),
+        departamento_id INTEGER
+    )""",
+    'tipo_cliente': """
+    CREATE TABLE tipo_cliente (
+        tipo_cliente_id INTEGER PRIMARY KEY,
+        nombre VARCHAR(100)
+    )""",
+    'cliente': """
+    CREATE TABLE cliente (
+        cliente_id INTEGER PRIMARY KEY,
+        nombre VARCHAR(255),
+        nit_cliente VARCHAR(50),
+        tipo_cliente_id INTEGER,
+        sector VARCHAR(100),
+        email VARCHAR(255),
+        telefono VARCHAR(50),
+        direccion TEXT,
+        nombre_contacto VARCHAR(255),
+        ciudad_id INTEGER
+    )""",
+    'clientes_mensajeroaquitoy': """
+    CREATE TABLE clientes_mensajeroaquitoy (
+        id INTEGER PRIMARY KEY,
+        fecha_entrada DATE,
+        fecha_salida DATE,
+        ciudad_operacion_id INTEGER,
+        activo BOOLEAN
+    )""",
+    'sede': """
+    CREATE TABLE sede (
+        sede_id INTEGER PRIMARY KEY,
+        nombre VARCHAR(255),
+        direccion TEXT,
+        ciudad_id INTEGER
+    )""",
+    'mensajeria_estado': """
+    CREATE TABLE mensajeria_estado (
+        id INTEGER PRIMARY KEY,
+        nombre VARCHAR(100),
+        descripcion TEXT
+    )""",
+    'mensajeria_servicio': """
+    CREATE TABLE mensajeria_servicio (
+        id INTEGER PRIMARY KEY,
+        cliente_id INTEGER,
+        mensajero_id INTEGER
+    )""",
+    'mensajeria_estadosservicio': """
+    CREATE TABLE mensajeria_estadosservicio (
+        id BIGINT PRIMARY KEY,
+        servicio_id INTEGER,
+        estado_id INTEGER,
+        fecha DATE,
+        hora TIME
+    )""",
+    'mensajeria_novedadesservicio': """
+    CREATE TABLE mensajeria_novedadesservicio (
+        id INTEGER PRIMARY KEY,
+        tipo_novedad_id INTEGER,
+        descripcion TEXT,
+        fecha_novedad TIMESTAMP,
+        mensajero_id INTEGER
+    )""",
+}
+
+ESTADOS = ['Iniciado', 'Con mensajero asignado', 'Novedad', 'Recogido', 'Entregado', 'Cerrado']
+SECTORES = ['Salud', 'Comercio', 'Servicios', 'Industria', 'Educación']
+TIPOS_CLIENTE = ['Persona natural', 'Empresa', 'Gobierno']
+NOVEDADES = ['Dirección errada', 'Cliente ausente', 'Paquete dañado', 'Retraso por tráfico']
+
+# Posiciones posibles de los estados de un servicio: 1, 2, hasta 3 novedades, 4, 5, 6
+PLANTILLA_ESTADOS = np.array([1, 2, 3, 3, 3, 4, 5, 6])
+
+
+def _textos(prefijo: str, ids: np.ndarray) -> pd.Series:
+    return prefijo + pd.Series(ids).astype(str)
+
+
+def generate_source(n_servicios: int, seed: int = 0) -> dict[str, pd.DataFrame]:
+    """
+    Genera datos sintéticos con el esquema de la base fuente
+    La generación es vectorizada para poder llegar a escalas de millones de servicios
+    Args:
+        n_servicios: Cantidad de servicios a generar
+        seed: Semilla del generador aleatorio
+    Returns:
+        dict: {tabla: DataFrame} con una entrada por tabla de SOURCE_DDL
+    """
+    rng = np.random.default_rng(seed)
+    n_clientes = max(10, n_servicios // 1000)
+    n_mensajeros = max(5, n_servicios // 500)
+    n_novedades = max(1, n_servicios // 10)
+    n_ciudades = 20
+
+    tablas = {}
+    tablas['departamento'] = pd.DataFrame({
+        'departamento_id': np.arange(1, 6),
+        'nombre': _textos('Departamento ', np.arange(1, 6))
+    })
+    ciudades = np.arange(1, n_ciudades + 1)
+    tablas['ciudad'] = pd.DataFrame({
+        'ciudad_id': ciudades,
+        'nombre': _textos('Ciudad ', ciudades),
+        'departamento_id': rng.integers(1, 6, n_ciudades)
+    })
+    tablas['tipo_cliente'] = pd.DataFrame({
+        'tipo_cliente_id': np.arange(1, len(TIPOS_CLIENTE) + 1),
+        'nombre': TIPOS_CLIENTE
+    })
+
+    clientes = np.arange(1, n_clientes + 1)
+    tablas['cliente'] = pd.DataFrame({
+        'cliente_id': clientes,
+        'nombre': _textos('Cliente ', clientes),
+        'nit_cliente': _textos('900', clientes),
+        'tipo_cliente_id': rng.integers(1, len(TIPOS_CLIENTE) + 1, n_clientes),
+        'sector': np.array(SECTORES)[rng.integers(0, len(SECTORES), n_clientes)],
+        'email': _textos('cliente', clientes) + '@correo.com',
+        'telefono': _textos('300', clientes),
+        'direccion': _textos('Calle ', clientes),
+        'nombre_contacto': _textos('Contacto ', clientes),
+        'ciudad_id': rng.integers(1, n_ciudades + 1, n_clientes)
+    })
+    # El ETL cruza dim_cliente.cliente_id con dim_sede.sede_id: una sede por cliente
+    tablas['sede'] = pd.DataFrame({
+        'sede_id': clientes,
+        'nombre': _textos('Sede ', clientes),
+        'direccion': _textos('Carrera ', clientes),
+        'ciudad_id': rng.integers(1, n_ciudades + 1, n_clientes)
+    })
+
+    mensajeros = np.arange(1, n_mensajeros + 1)
+    entrada = pd.Timestamp('2022-01-01') + pd.to_timedelta(rng.integers(0, 365, n_mensajeros), unit='D')
+    activo = rng.random(n_mensajeros) < 0.85
+    salida = pd.Series(entrada + pd.to_timedelta(rng.integers(30, 700, n_mensajeros), unit='D')).where(~activo)
+    tablas['clientes_mensajeroaquitoy'] = pd.DataFrame({
+        'id': mensajeros,
+        'fecha_entrada': pd.Series(entrada).dt.date,
+        'fecha_salida': salida.dt.date,
+        'ciudad_operacion_id': rng.integers(1, n_ciudades + 1, n_mensajeros),
+        'activo': activo
+    })
+
+    tablas['mensajeria_estado'] = pd.DataFrame({
+        'id': np.arange(1, len(ESTADOS) + 1),
+        'nombre': ESTADOS,
+        'descripcion': ['Servicio ' + estado.lower() for estado in ESTADOS]
+    })
+
+    servicios = np.arange(1, n_servicios + 1)
+    tablas['mensajeria_servicio'] = pd.DataFrame({
+        'id': servicios,
+        'cliente_id': rng.integers(1, n_clientes + 1, n_servicios),
+        'mensajero_id': pd.array(rng.integers(1, n_mensajeros + 1, n_servicios), dtype='Int64')
+    })
+    sin_mensajero = rng.random(n_servicios) < 0.03
+    tablas['mensajeria_servicio'].loc[sin_mensajero, 'mensajero_id'] = pd.NA
+
+    tablas['mensajeria_estadosservicio'] = _generate_estados(rng, n_servicios)
+
+    novedades = np.arange(1, n_novedades + 1)
+    tablas['mensajeria_novedadesservicio'] = pd.DataFrame({
+        'id': novedades,
+        'tipo_novedad_id': rng.integers(1, len(NOVEDADES) + 1, n_novedades),
+        'descripcion': np.array(NOVEDADES)[rng.integers(0, len(NOVEDADES), n_novedades)],
+        'fecha_novedad': pd.Timestamp('2023-01-01') + pd.to_timedelta(
+            rng.integers(0, 730 * 86400, n_novedades), unit='s'),
+        'mensajero_id': rng.integers(1, n_mensajeros + 1, n_novedades)
+    })
+    return tablas
+
+
+def _generate_estados(rng: np.random.Generator, n_servicios: int) -> pd.DataFrame:
+    """
+    Genera los cambios de estado de cada servicio en orden cronológico
+    Cada servicio avanza hasta un nivel (iniciado ... cerrado) y puede tener de 0 a 3 novedades
+    """
+    nivel = rng.choice([1, 2, 3, 4, 5], n_servicios, p=[0.02, 0.03, 0.05, 0.10, 0.80])
+    cantidad_novedades = rng.choice([0, 1, 2, 3], n_servicios, p=[0.70, 0.20, 0.07, 0.03])
+
+    # Máscara servicio x posición de PLANTILLA_ESTADOS
+    mascara = np.zeros((n_servicios, len(PLANTILLA_ESTADOS)), dtype=bool)
+    mascara[:, 0] = True
+    mascara[:, 1] = nivel >= 2
+    for j in range(3):
+        mascara[:, 2 + j] = (nivel >= 2) & (cantidad_novedades > j)
+    mascara[:, 5] = nivel >= 3
+    mascara[:, 6] = nivel >= 4
+    mascara[:, 7] = nivel >= 5
+
+    fila, posicion = np.nonzero(mascara)
+    inicio = rng.integers(0, 730 * 86400, n_servicios)
+    pasos = rng.exponential(1800, (n_servicios, len(PLANTILLA_ESTADOS))).astype('int64')
+    pasos[:, 0] = 0
+    segundos = inicio[:, None] + np.cumsum(pasos, axis=1)
+
+    instante = pd.Timestamp('2023-01-01') + pd.to_timedelta(segundos[fila, posicion], unit='s')
+    return pd.DataFrame({
+        'id': np.arange(1, len(fila) + 1),
+        'servicio_id': fila + 1,
+        'estado_id': PLANTILLA_ESTADOS[posicion],
+        'fecha': instante.normalize(),
+        'hora': instante.strftime('%H:%M:%S')
+    })
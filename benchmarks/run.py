@@ -0,0 +1,275 @@
+"""
+Benchmark del ETL completo con datos sintéticos
+
+Genera la base fuente con benchmarks.datagen a distintas escalas y mide tiempo (wall y CPU),
+memoria pico (tracemalloc) y filas de cada función de extract/transform/load.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.run --scales 10k 100k
+    python -m benchmarks.run --scales 10k 1M --postgres bench_config.yml --output resultados.json
+    python -m benchmarks.run --scales 10k --baseline resultados.json
+
+Sin --postgres se usa SQLite en memoria como sustituto de la fuente y de la bodega: las
+consultas de extracción son las mismas y la carga se mide con to_sql. Con --postgres se usa
+un archivo con el formato de config.yml; las bases fuente y bodega indicadas se SOBRESCRIBEN.
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+import yaml
+from sqlalchemy import create_engine, event, text
+
+from benchmarks.datagen import SOURCE_DDL, generate_source
+from etl import connections, extract, keys, load, pushdown, transform
+
+DIMENSIONES = {
+    'dim_cliente': (extract.extract_dim_cliente, transform.transform_dim_cliente),
+    'dim_mensajero': (extract.extract_dim_mensajero, transform.transform_dim_mensajero),
+    'dim_sede': (extract.extract_dim_sede, transform.transform_dim_sede),
+    'dim_novedad': (extract.extract_dim_novedad, transform.transform_dim_novedad),
+    'dim_estado': (extract.extract_dim_estado, transform.transform_dim_estado),
+}
+
+
+def parse_scale(valor: str) -> int:
+    """
+    Convierte escalas como '10k' o '1M' a número de servicios
+    """
+    multiplicadores = {'k': 1_000, 'm': 1_000_000}
+    sufijo = valor[-1].lower()
+    if sufijo in multiplicadores:
+        return int(float(valor[:-1]) * multiplicadores[sufijo])
+    return int(valor)
+
+
+class Medidor:
+    """
+    Registra tiempo, CPU, memoria pico y filas de cada llamada medida
+    """
+
+    def __init__(self, memoria: bool = False):
+        self.memoria = memoria
+        self.registros = []
+        self.escala = None
+
+    def medir(self, etapa: str, funcion, *args, **kwargs):
+        if self.memoria:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+        inicio_cpu = time.process_time()
+        resultado = funcion(*args, **kwargs)
+        segundos = time.perf_counter() - inicio
+        cpu = time.process_time() - inicio_cpu
+        pico_mb = None
+        if self.memoria:
+            pico_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+            tracemalloc.stop()
+
+        filas = len(resultado) if isinstance(resultado, (pd.DataFrame, list)) else resultado
+        self.registros.append({
+            'escala': self.escala,
+            'etapa': etapa,
+            'segundos': round(segundos, 4),
+            'cpu_segundos': round(cpu, 4),
+            'pico_mb': round(pico_mb, 2) if pico_mb is not None else None,
+            'filas': filas if isinstance(filas, int) else None
+        })
+        print(f"  {etapa:<40} {segundos:>9.3f}s"
+              + (f" {pico_mb:>9.1f} MB" if pico_mb is not None else ""))
+        return resultado
+
+
+def _date_part(campo: str, valor):
+    """
+    date_part('epoch', hora) de PostgreSQL para las horas 'HH:MM:SS' de la fuente en SQLite
+    """
+    if campo != 'epoch' or valor is None:
+        return None
+    horas, minutos, segundos = valor.split(':')
+    return int(horas) * 3600 + int(minutos) * 60 + float(segundos)
+
+
+def sqlite_engine():
+    """
+    Base SQLite en memoria con las funciones de PostgreSQL que usan las consultas de extracción
+    """
+    engine = create_engine('sqlite://')
+    event.listen(engine, 'connect', lambda conexion, _: conexion.create_function('date_part', 2, _date_part))
+    return engine
+
+
+def create_source(tablas: dict[str, pd.DataFrame], engine, postgres: bool):
+    """
+    Crea las tablas fuente y carga los datos sintéticos
+    """
+    for tabla, df in tablas.items():
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP TABLE IF EXISTS {tabla}'))
+            conn.execute(text(SOURCE_DDL[tabla]))
+        if postgres:
+            load.load_copy(df, engine, tabla)
+        else:
+            df.to_sql(tabla, engine, if_exists='append', index=False, chunksize=50_000)
+
+
+def load_dimension(df: pd.DataFrame, engine, tabla: str, resolver: keys.KeyResolver, postgres: bool):
+    """
+    Carga una dimensión y registra sus llaves en el resolver
+    En SQLite las llaves subrogadas se asignan en orden, como lo haría el SERIAL de la bodega
+    """
+    llave, natural = keys.LLAVES_DIMENSIONES[tabla]
+    if postgres:
+        llaves = load.load_returning_keys(df, engine, tabla, llave, True)
+    else:
+        df.to_sql(tabla, engine, if_exists='replace', index=False)
+        llaves = list(range(1, len(df) + 1))
+    resolver.register(tabla, df[natural], llaves)
+    return llaves
+
+
+def load_fact(df: pd.DataFrame, engine, tabla: str, postgres: bool):
+    """
+    Carga un hecho con COPY en PostgreSQL o con to_sql en SQLite
+    """
+    if postgres:
+        return load.load_copy(df, engine, tabla, True)
+    # Mismas conversiones que se aplican antes de COPY (horas timedelta64 a 'HH:MM:SS')
+    load._preparar_para_copy(df).to_sql(tabla, engine, if_exists='replace', index=False, chunksize=50_000)
+    return len(df)
+
+
+def run_scale(n_servicios: int, medidor: Medidor, source_engine, target_engine, postgres: bool):
+    """
+    Ejecuta y mide todo el ETL para una escala
+    """
+    medidor.escala = n_servicios
+    print(f"\nEscala: {n_servicios} servicios")
+
+    tablas = medidor.medir('generar_fuente', generate_source, n_servicios)
+    medidor.medir('cargar_fuente', create_source, tablas, source_engine, postgres)
+    del tablas
+
+    resolver = keys.KeyResolver()
+
+    rango_fechas = medidor.medir('extract_dim_fecha', extract.extract_dim_fecha, source_engine)
+    dim_fecha = medidor.medir('transform_dim_fecha', transform.transform_dim_fecha, rango_fechas)
+    medidor.medir('load_dim_fecha', load_dimension, dim_fecha, target_engine, 'dim_fecha', resolver, postgres)
+    dim_hora = medidor.medir('transform_dim_hora', transform.transform_dim_hora)
+    medidor.medir('load_dim_hora', load_dimension, dim_hora, target_engine, 'dim_hora', resolver, postgres)
+
+    for tabla, (extraer, transformar) in DIMENSIONES.items():
+        df = medidor.medir(f'extract_{tabla}', extraer, source_engine)
+        df = medidor.medir(f'transform_{tabla}', transformar, df)
+        medidor.medir(f'load_{tabla}', load_dimension, df, target_engine, tabla, resolver, postgres)
+
+    df_servicios = medidor.medir('extract_hecho_acumulado', extract.extract_hecho_acumulado, source_engine)
+    hecho_acumulado = medidor.medir('transform_hecho_acumulado', transform.transform_hecho_acumulado,
+                                    df_servicios, resolver)
+    del df_servicios
+    if postgres:
+        # Motor del pivote en la fuente: mismo hecho con un registro por servicio extraído
+        df_pivote = medidor.medir('extract_hecho_acumulado_sql', pushdown.extract_hecho_acumulado_sql, source_engine)
+        hecho_sql = medidor.medir('transform_hecho_acumulado_sql', pushdown.transform_hecho_acumulado_sql,
+                                  df_pivote, resolver)
+        pushdown.check_parity(hecho_acumulado, hecho_sql)
+        print("Paridad del pivote pandas/sql verificada")
+        del df_pivote, hecho_sql
+    medidor.medir('load_hecho_entrega_acumulado', load_fact, hecho_acumulado, target_engine,
+                  'hecho_entrega_acumulado', postgres)
+
+    df_hora = medidor.medir('derive_hecho_servicio_hora', transform.derive_hecho_servicio_hora,
+                            hecho_acumulado, resolver)
+    hecho_hora = medidor.medir('transform_hecho_servicio_hora', transform.transform_hecho_servicio_hora, df_hora)
+    medidor.medir('load_hecho_entrega_servicio_hora', load_fact, hecho_hora, target_engine,
+                  'hecho_entrega_servicio_hora', postgres)
+
+    df_dia = medidor.medir('derive_hecho_servicio_diaria', transform.derive_hecho_servicio_diaria,
+                           hecho_acumulado, resolver)
+    hecho_dia = medidor.medir('transform_hecho_servicio_diaria', transform.transform_hecho_servicio_diaria, df_dia)
+    medidor.medir('load_hecho_entrega_servicio_diaria', load_fact, hecho_dia, target_engine,
+                  'hecho_entrega_servicio_diaria', postgres)
+
+    df_novedades = medidor.medir('extract_hecho_novedades', extract.extract_hecho_novedades, source_engine)
+    hecho_novedades = medidor.medir('transform_hecho_novedades', transform.transform_hecho_novedades,
+                                    df_novedades, resolver)
+    medidor.medir('load_hecho_novedades_servicio', load_fact, hecho_novedades, target_engine,
+                  'hecho_novedades_servicio', postgres)
+
+
+def compare_baseline(registros: list[dict], baseline: list[dict], tolerancia: float,
+                     minimo_segundos: float = 0.05) -> list[str]:
+    """
+    Compara los tiempos contra una ejecución anterior
+    Returns:
+        list: Descripción de las etapas más lentas que la base en más de la tolerancia
+    """
+    base = {(r['escala'], r['etapa']): r['segundos'] for r in baseline}
+    regresiones = []
+    for registro in registros:
+        anterior = base.get((registro['escala'], registro['etapa']))
+        if anterior is None or anterior < minimo_segundos:
+            continue
+        if registro['segundos'] > anterior * (1 + tolerancia):
+            regresiones.append(
+                f"{registro['etapa']} @ {registro['escala']}: {anterior:.3f}s -> {registro['segundos']:.3f}s"
+            )
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del ETL con datos sintéticos")
+    parser.add_argument('--scales', nargs='+', default=['10k'],
+                        help="Escalas en cantidad de servicios, por ejemplo 10k 1M 10M")
+    parser.add_argument('--postgres', metavar='CONFIG',
+                        help="Archivo con el formato de config.yml; sus bases fuente y bodega se sobrescriben")
+    parser.add_argument('--memoria', action='store_true',
+                        help="Mide la memoria pico con tracemalloc (agrega sobrecosto a los tiempos)")
+    parser.add_argument('--output', help="Archivo JSON donde guardar los resultados")
+    parser.add_argument('--baseline', help="Archivo JSON de una ejecución anterior para detectar regresiones")
+    parser.add_argument('--tolerancia', type=float, default=0.25,
+                        help="Aumento relativo de tiempo permitido frente a la base (por defecto 0.25)")
+    args = parser.parse_args()
+
+    medidor = Medidor(memoria=args.memoria)
+    postgres = args.postgres is not None
+
+    for escala in args.scales:
+        if postgres:
+            import main as etl_main
+            with open(args.postgres, 'r') as f:
+                config = yaml.safe_load(f)
+            # La fuente sintética se escribe, así que no usa las conexiones de solo lectura del ETL
+            source_engine = create_engine(connections.database_url(config, 'fuente'))
+            target_engine = etl_main.create_connections(config).target
+            etl_main.drop_all_tables(target_engine)
+            etl_main.create_tables(target_engine, config)
+        else:
+            source_engine = sqlite_engine()
+            target_engine = sqlite_engine()
+        run_scale(parse_scale(escala), medidor, source_engine, target_engine, postgres)
+        source_engine.dispose()
+        target_engine.dispose()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(medidor.registros, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regresiones = compare_baseline(medidor.registros, baseline, args.tolerancia)
+        if regresiones:
+            print("\nRegresiones detectadas:")
+            for regresion in regresiones:
+                print(f"  {regresion}")
+            sys.exit(1)
+        print("\nSin regresiones frente a la base")
+
+
+if __name__ == "__main__":
+    main()
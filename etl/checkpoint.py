@@ -0,0 +1,181 @@
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from typing import Any, Callable
+import pandas as pd
+
+# pyarrow es opcional: sin él los resultados de las etapas se guardan con pickle
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+MANIFIESTO = 'checkpoint.json'
+
+
+class RunCheckpoint:
+    """
+    Puntos de control de una ejecución del ETL en la carpeta <directorio>/<run_id>
+    El manifiesto checkpoint.json guarda el contexto de la ejecución (modo, marcas de agua,
+    llaves foráneas eliminadas) y las etapas terminadas; junto a él se guarda en un archivo el
+    resultado (DataFrame o Series) de cada etapa terminada mientras alguna etapa que depende
+    de él no haya terminado
+    Las cargas de cada etapa ya están confirmadas en la bodega cuando la etapa se registra,
+    así que al reanudar las etapas terminadas no se repiten: sus resultados se leen de los archivos
+    """
+
+    def __init__(self, directorio: str, run_id: str, contexto: dict | None = None,
+                 completadas: dict | None = None, inicio: str | None = None):
+        self.directorio = directorio
+        self.run_id = run_id
+        self.ruta = os.path.join(directorio, run_id)
+        self.contexto = contexto or {}
+        self.completadas = completadas or {}
+        self.inicio = inicio or datetime.now().isoformat(timespec='seconds')
+        self._dependientes = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def start(cls, directorio: str, run_id: str, contexto: dict) -> 'RunCheckpoint':
+        """
+        Crea los puntos de control de una ejecución nueva
+        Los de ejecuciones anteriores se eliminan: la nueva ejecución cambia la bodega
+        y ya no se podrían reanudar
+        Args:
+            directorio: Carpeta de los puntos de control (sección etl.checkpoints de config.yml)
+            run_id: Identificador de la ejecución
+            contexto: Datos de la ejecución que se necesitan para reanudarla (serializables en JSON)
+        """
+        if os.path.isdir(directorio):
+            for nombre in os.listdir(directorio):
+                shutil.rmtree(os.path.join(directorio, nombre), ignore_errors=True)
+        punto = cls(directorio, run_id, contexto)
+        os.makedirs(punto.ruta, exist_ok=True)
+        punto._guardar()
+        return punto
+
+    @classmethod
+    def resume(cls, directorio: str) -> 'RunCheckpoint | None':
+        """
+        Retoma los puntos de control de la última ejecución que no terminó
+        Returns:
+            RunCheckpoint: Puntos de control de la ejecución, o None si no hay ninguna pendiente
+        """
+        manifiestos = []
+        if os.path.isdir(directorio):
+            for nombre in os.listdir(directorio):
+                ruta = os.path.join(directorio, nombre, MANIFIESTO)
+                if os.path.exists(ruta):
+                    with open(ruta, 'r', encoding='utf-8') as f:
+                        manifiestos.append(json.load(f))
+        if not manifiestos:
+            return None
+        ultimo = max(manifiestos, key=lambda m: m['inicio'])
+        return cls(directorio, ultimo['run_id'], ultimo['contexto'], ultimo['completadas'], ultimo['inicio'])
+
+    def _guardar(self):
+        """
+        Escribe el manifiesto en una ruta temporal y lo renombra, para no dejarlo a medias
+        """
+        manifiesto = {'run_id': self.run_id, 'inicio': self.inicio, 'contexto': self.contexto,
+                      'completadas': self.completadas}
+        ruta = os.path.join(self.ruta, MANIFIESTO)
+        with open(f'{ruta}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifiesto, f, indent=2, ensure_ascii=False)
+        os.replace(f'{ruta}.tmp', ruta)
+
+    def completed(self, etapa: str) -> bool:
+        return etapa in self.completadas
+
+    def _pendiente(self, etapa: str) -> bool:
+        """
+        Si alguna etapa que depende de esta todavía no termina
+        """
+        return any(not self.completed(d) for d in self._dependientes.get(etapa, []))
+
+    def save(self, etapa: str, resultado: Any, dependencias: list[str]):
+        """
+        Registra una etapa como terminada y guarda su resultado si alguna etapa pendiente lo necesita
+        Los archivos de las dependencias que ya no necesita ninguna etapa pendiente se eliminan
+        """
+        registro = {'terminada': datetime.now().isoformat(timespec='seconds'), 'archivo': None, 'serie': None}
+        if isinstance(resultado, (pd.DataFrame, pd.Series)) and self._pendiente(etapa):
+            df = resultado.to_frame() if isinstance(resultado, pd.Series) else resultado
+            registro['archivo'] = self._escribir(etapa, df.reset_index(drop=True))
+            registro['serie'] = str(df.columns[0]) if isinstance(resultado, pd.Series) else None
+
+        with self._lock:
+            self.completadas[etapa] = registro
+            for dependencia in dependencias:
+                archivo = self.completadas.get(dependencia, {}).get('archivo')
+                if archivo and not self._pendiente(dependencia):
+                    os.remove(os.path.join(self.ruta, archivo))
+                    self.completadas[dependencia]['archivo'] = None
+            self._guardar()
+
+    def _escribir(self, etapa: str, df: pd.DataFrame) -> str:
+        if feather is None:
+            archivo = f'{etapa}.pkl'
+            df.to_pickle(os.path.join(self.ruta, archivo))
+        else:
+            archivo = f'{etapa}.arrow'
+            feather.write_feather(df, os.path.join(self.ruta, archivo), compression='uncompressed')
+        return archivo
+
+    def load(self, etapa: str) -> Any:
+        """
+        Lee el resultado guardado de una etapa terminada (None si la etapa no retornó datos)
+        """
+        registro = self.completadas[etapa]
+        if registro['archivo'] is None:
+            return None
+        ruta = os.path.join(self.ruta, registro['archivo'])
+        df = pd.read_pickle(ruta) if ruta.endswith('.pkl') else feather.read_feather(ruta)
+        return df[registro['serie']] if registro['serie'] is not None else df
+
+    def wrap_stages(self, etapas: dict[str, tuple[Callable, list[str]]],
+                    restaurar: Callable[[str], None] | None = None) -> dict[str, tuple[Callable, list[str]]]:
+        """
+        Envuelve las etapas del scheduler: las terminadas en la ejecución que se reanuda no se
+        ejecutan y entregan su resultado guardado; las demás se registran al terminar
+        Args:
+            etapas: {nombre: (funcion, dependencias)}
+            restaurar: Función que recibe el nombre de una etapa terminada y recupera el estado en
+                memoria que dejaba, por ejemplo las llaves de una dimensión en el KeyResolver; solo se
+                llama si alguna etapa pendiente depende de ella
+        Returns:
+            dict: {nombre: (funcion, dependencias)} para scheduler.run_stages
+        """
+        self._dependientes = {nombre: [] for nombre in etapas}
+        for nombre, (_, dependencias) in etapas.items():
+            for dependencia in dependencias:
+                self._dependientes[dependencia].append(nombre)
+
+        def omitir(nombre):
+            def funcion(resultados):
+                if not self._pendiente(nombre):
+                    return None
+                print(f"Etapa {nombre} terminada en la ejecución {self.run_id[:8]}, se usa su resultado guardado")
+                if restaurar is not None:
+                    restaurar(nombre)
+                return self.load(nombre)
+            return funcion
+
+        def registrar(nombre, funcion, dependencias):
+            def envuelta(resultados):
+                resultado = funcion(resultados)
+                self.save(nombre, resultado, dependencias)
+                return resultado
+            return envuelta
+
+        return {nombre: ((omitir(nombre) if self.completed(nombre) else registrar(nombre, funcion, dependencias)),
+                         dependencias)
+                for nombre, (funcion, dependencias) in etapas.items()}
+
+    def finish(self):
+        """
+        Elimina los puntos de control de una ejecución que terminó con éxito
+        """
+        shutil.rmtree(self.ruta, ignore_errors=True)
@@ -0,0 +1,104 @@
+from contextlib import contextmanager
+from typing import Iterator
+import psycopg2.extensions
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine
+
+# Parámetros de sesión de PostgreSQL de cada rol si config.yml no indica otros
+# fuente: extracciones de solo lectura; bodega: cargas masivas, índices y validación de llaves
+SESION_POR_DEFECTO = {
+    'fuente': {'work_mem': '64MB', 'default_transaction_read_only': 'on'},
+    'bodega': {'work_mem': '64MB', 'maintenance_work_mem': '512MB', 'synchronous_commit': 'off'},
+}
+
+
+def database_url(config: dict, rol: str) -> URL:
+    """
+    URL de conexión de la sección fuente o bodega de config.yml
+    """
+    base = config[rol]
+    return URL.create(base.get('drivername', 'postgresql'), username=base['user'], password=str(base['password']),
+                      host=base['host'], port=base['port'], database=base['dbname'])
+
+
+def session_options(parametros: dict) -> str:
+    """
+    Parámetros de sesión en el formato de la opción 'options' de libpq: -c nombre=valor
+    Los booleanos de YAML (off sin comillas) se escriben como on/off
+    """
+    opciones = []
+    for nombre, valor in parametros.items():
+        if isinstance(valor, bool):
+            valor = 'on' if valor else 'off'
+        # libpq separa las opciones por espacios; los espacios del valor se escapan
+        opciones.append(f"-c {nombre}=" + str(valor).replace(' ', '\\ '))
+    return ' '.join(opciones)
+
+
+class ConnectionManager:
+    """
+    Motores de la fuente y la bodega configurados con la sección etl.conexiones de config.yml:
+    un pool por base de datos, con pre-ping y reciclaje, compartido por todas las etapas,
+    y parámetros de sesión propios de cada rol aplicados al abrir cada conexión
+    Las conexiones de la fuente son de solo lectura con aislamiento REPEATABLE READ; dentro de
+    snapshot() todas las extracciones leen además la misma foto de la fuente
+    """
+
+    def __init__(self, config: dict):
+        config_conexiones = config.get('etl', {}).get('conexiones') or {}
+        # Una conexión por etapa en paralelo y una para el snapshot y las marcas de agua
+        tamano = config_conexiones.get('tamano_pool') or config.get('etl', {}).get('workers', 4) + 1
+        pool = {
+            'pool_size': tamano,
+            'max_overflow': config_conexiones.get('desborde', 2),
+            'pool_pre_ping': True,
+            'pool_recycle': config_conexiones.get('reciclar_segundos', 1800),
+        }
+        sesiones = {rol: {**parametros, **(config_conexiones.get(rol) or {})}
+                    for rol, parametros in SESION_POR_DEFECTO.items()}
+
+        self.source = create_engine(database_url(config, 'fuente'), isolation_level='REPEATABLE READ',
+                                    connect_args={'options': session_options(sesiones['fuente'])}, **pool)
+        self.target = create_engine(database_url(config, 'bodega'),
+                                    connect_args={'options': session_options(sesiones['bodega'])}, **pool)
+        self.usar_snapshot = config_conexiones.get('snapshot', True)
+
+    @contextmanager
+    def snapshot(self) -> Iterator[str | None]:
+        """
+        Exporta un snapshot de la fuente y lo importa en cada transacción de la fuente que se inicie
+        mientras el contexto esté abierto: las extracciones en paralelo y las marcas de agua ven
+        los mismos datos aunque la fuente reciba cambios durante la ejecución
+        Yields:
+            str: Identificador del snapshot (None si está desactivado en config.yml)
+        """
+        if not self.usar_snapshot:
+            yield None
+            return
+
+        exportadora = self.source.raw_connection()
+        try:
+            with exportadora.cursor() as cur:
+                cur.execute("SELECT pg_export_snapshot()")
+                identificador = cur.fetchone()[0]
+
+            def importar(conn, cursor, statement, parameters, context, executemany):
+                dbapi = conn.connection.dbapi_connection
+                # SET TRANSACTION SNAPSHOT debe ser la primera sentencia de la transacción
+                if dbapi.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    with dbapi.cursor() as previo:
+                        previo.execute("SET TRANSACTION SNAPSHOT %s", (identificador,))
+
+            event.listen(self.source, 'before_cursor_execute', importar)
+            print(f"Extracciones sobre el snapshot {identificador} de la fuente")
+            try:
+                yield identificador
+            finally:
+                event.remove(self.source, 'before_cursor_execute', importar)
+        finally:
+            exportadora.rollback()
+            exportadora.close()
+
+    def dispose(self):
+        self.source.dispose()
+        self.target.dispose()
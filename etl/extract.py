@@ -1,5 +1,99 @@
+from typing import Iterator
 import pandas as pd
 from sqlalchemy.engine import Engine
+from sqlalchemy import text
+
+# Tipos de cada extracción, aplicados al leer: llaves int32 (Int32 si admiten nulos),
+# textos de baja cardinalidad como category, fechas datetime64 y horas timedelta64
+# Las horas se extraen como segundos desde la medianoche (date_part('epoch', hora)) para construir
+# el timedelta64 con aritmética, sin pasar cada datetime.time por texto
+# Los textos libres, como la descripcion de las novedades, quedan como object
+TIPOS_CLIENTE = {
+    'cliente_id': 'int32',
+    'tipo_cliente': 'category',
+    'sector': 'category',
+    'ciudad': 'category',
+}
+TIPOS_MENSAJERO = {
+    'mensajero_id': 'int32',
+    'fecha_entrada': 'datetime64[ns]',
+    'fecha_salida': 'datetime64[ns]',
+    'ciudad_operacion': 'category',
+}
+TIPOS_SEDE = {
+    'sede_id': 'int32',
+    'ciudad_sede': 'category',
+    'departamento_sede': 'category',
+}
+TIPOS_NOVEDAD = {
+    'novedad_id': 'int32',
+    'tipo_novedad_id': 'Int32',
+}
+TIPOS_ESTADO = {
+    'estado_id': 'int32',
+}
+TIPOS_SERVICIOS_ESTADOS = {
+    'servicio_id': 'int32',
+    'cliente_id': 'Int32',
+    'mensajero_inicial_id': 'Int32',
+    'estado_id': 'Int8',
+    'fecha_estado': 'datetime64[ns]',
+    'hora_estado': 'timedelta64[ns]',
+}
+TIPOS_SERVICIO_HORA = {
+    'servicio_id': 'int32',
+    'key_dim_fecha': 'Int32',
+    'key_dim_cliente': 'Int32',
+    'key_dim_mensajero': 'Int32',
+    'key_dim_hora': 'Int32',
+    'key_dim_sede': 'Int32',
+    'hora_servicio': 'Int8',
+}
+TIPOS_SERVICIO_DIARIA = {
+    'servicio_id': 'int32',
+    'key_dim_fecha': 'Int32',
+    'key_dim_cliente': 'Int32',
+    'key_dim_mensajero': 'Int32',
+    'key_dim_sede': 'Int32',
+    'dia_semana': 'Int8',
+}
+TIPOS_RANGO_FECHAS = {
+    'desde': 'datetime64[ns]',
+    'hasta': 'datetime64[ns]',
+}
+TIPOS_NOVEDADES = {
+    'novedad_id': 'int32',
+    'fecha_hora_novedad': 'datetime64[ns]',
+    'cliente_id': 'Int32',
+    'mensajero_id': 'Int32',
+    'tipo_novedad_id': 'Int32',
+}
+
+
+def aplicar_tipos(df: pd.DataFrame, tipos: dict[str, str]) -> pd.DataFrame:
+    """
+    Convierte las columnas de un DataFrame leído de la base de datos a los tipos declarados
+    Args:
+        df: DataFrame retornado por pd.read_sql
+        tipos: {columna: tipo}; las columnas que no estén en el DataFrame se ignoran
+    Returns:
+        pd.DataFrame: El mismo DataFrame con las columnas convertidas
+    """
+    for columna, tipo in tipos.items():
+        if columna not in df.columns:
+            continue
+        if tipo.startswith('datetime64'):
+            df[columna] = pd.to_datetime(df[columna], errors='coerce')
+        elif tipo.startswith('timedelta64'):
+            # Segundos desde la medianoche (double precision de date_part)
+            df[columna] = pd.to_timedelta(pd.to_numeric(df[columna]), unit='s')
+        elif tipo == 'category':
+            df[columna] = df[columna].astype(tipo)
+        else:
+            # EXTRACT(...) llega como Decimal; to_numeric lo lleva a un tipo numérico antes de convertir
+            df[columna] = pd.to_numeric(df[columna]).astype(tipo)
+    return df
+
 
 def extract_dim_cliente(con: Engine) -> pd.DataFrame:
     """
@@ -25,7 +119,7 @@ def extract_dim_cliente(con: Engine) -> pd.DataFrame:
     LEFT JOIN tipo_cliente tc ON c.tipo_cliente_id = tc.tipo_cliente_id
     LEFT JOIN ciudad ci ON c.ciudad_id = ci.ciudad_id
     """
-    return pd.read_sql(query, con)
+    return aplicar_tipos(pd.read_sql(query, con), TIPOS_CLIENTE)
 
 
 def extract_dim_mensajero(con: Engine) -> pd.DataFrame:
@@ -46,7 +140,7 @@ def extract_dim_mensajero(con: Engine) -> pd.DataFrame:
     FROM clientes_mensajeroaquitoy m
     LEFT JOIN ciudad c ON m.ciudad_operacion_id = c.ciudad_id
     """
-    return pd.read_sql(query, con)
+    return aplicar_tipos(pd.read_sql(query, con), TIPOS_MENSAJERO)
 
 
 def extract_dim_sede(con: Engine) -> pd.DataFrame:
@@ -68,7 +162,7 @@ def extract_dim_sede(con: Engine) -> pd.DataFrame:
     JOIN ciudad ON sede.ciudad_id = ciudad.ciudad_id
     JOIN departamento ON ciudad.departamento_id = departamento.departamento_id
     """
-    return pd.read_sql(query, con)
+    return aplicar_tipos(pd.read_sql(query, con), TIPOS_SEDE)
 
 
 def extract_dim_novedad(con: Engine) -> pd.DataFrame:
@@ -87,7 +181,7 @@ def extract_dim_novedad(con: Engine) -> pd.DataFrame:
     FROM 
         mensajeria_novedadesservicio 
     """
-    return pd.read_sql(query, con)
+    return aplicar_tipos(pd.read_sql(query, con), TIPOS_NOVEDAD)
 
 
 def extract_dim_estado(con: Engine) -> pd.DataFrame:
@@ -105,49 +199,191 @@ def extract_dim_estado(con: Engine) -> pd.DataFrame:
         descripcion
     FROM mensajeria_estado
     """
-    return pd.read_sql(query, con)
+    return aplicar_tipos(pd.read_sql(query, con), TIPOS_ESTADO)
 
 
-def extract_hecho_acumulado(source_engine: Engine, target_engine: Engine) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+def extract_dim_fecha(con: Engine) -> pd.DataFrame:
     """
-    Extrae los datos necesarios para el hecho acumulado
+    Extrae el rango de fechas de la fuente para generar la dimensión fecha:
+    la primera y la última fecha de los estados de los servicios y de las novedades
     Args:
-        source_engine: Conexión a la base de datos fuente
-        target_engine: Conexión a la base de datos bodega
+        con: Conexión a la base de datos fuente
     Returns:
-        tuple: (df_servicios, dim_fecha, dim_cliente, dim_mensajero, dim_hora)
+        pd.DataFrame: Una fila con desde y hasta (nulas si la fuente no tiene datos)
     """
-    # Consulta principal desde la fuente
     query = """
+    SELECT MIN(desde) AS desde, MAX(hasta) AS hasta
+    FROM (
+        SELECT MIN(fecha) AS desde, MAX(fecha) AS hasta FROM mensajeria_estadosservicio
+        UNION ALL
+        SELECT MIN(fecha_novedad) AS desde, MAX(fecha_novedad) AS hasta FROM mensajeria_novedadesservicio
+    ) rangos
+    """
+    return aplicar_tipos(pd.read_sql(query, con), TIPOS_RANGO_FECHAS)
+
+
+QUERY_SERVICIOS_ESTADOS = """
     SELECT 
         s.id as servicio_id,
         s.cliente_id,
         s.mensajero_id as mensajero_inicial_id,
         es.estado_id,
         es.fecha as fecha_estado,
-        es.hora as hora_estado
+        date_part('epoch', es.hora) as hora_estado
     FROM mensajeria_servicio s
     JOIN mensajeria_estadosservicio es ON s.id = es.servicio_id
     ORDER BY s.id, es.fecha, es.hora
     """
-    
-    # Extraer datos principales de la fuente
-    df_servicios = pd.read_sql(query, source_engine)
-    
-    # Extraer dimensiones de la bodega
-    dim_fecha = pd.read_sql_table('dim_fecha', target_engine)
-    dim_cliente = pd.read_sql_table('dim_cliente', target_engine)
-    dim_mensajero = pd.read_sql_table('dim_mensajero', target_engine)
-    dim_hora = pd.read_sql_table('dim_hora', target_engine)
-    
-    return df_servicios, dim_fecha, dim_cliente, dim_mensajero, dim_hora
 
 
-def extract_hecho_servicio_hora(con: Engine) -> pd.DataFrame:
+def extract_hecho_acumulado(source_engine: Engine) -> pd.DataFrame:
+    """
+    Extrae los estados de los servicios para el hecho acumulado
+    Las llaves de las dimensiones se resuelven en memoria (ver etl.keys.KeyResolver)
+    Args:
+        source_engine: Conexión a la base de datos fuente
+    Returns:
+        pd.DataFrame: DataFrame con los estados de los servicios
+    """
+    return aplicar_tipos(pd.read_sql(QUERY_SERVICIOS_ESTADOS, source_engine), TIPOS_SERVICIOS_ESTADOS)
+
+
+def extract_servicios_estados_chunks(source_engine: Engine, chunksize: int = 200_000) -> Iterator[pd.DataFrame]:
+    """
+    Extrae los estados de los servicios por bloques usando un cursor del lado del servidor
+    Los bloques se cortan en los límites de servicio_id: ningún servicio queda repartido
+    entre dos bloques, así cada bloque puede transformarse de forma independiente
+    Args:
+        source_engine: Conexión a la base de datos fuente
+        chunksize: Filas leídas del cursor en cada iteración
+    Yields:
+        pd.DataFrame: Bloque con todos los estados de un conjunto de servicios
+    """
+    with source_engine.connect().execution_options(stream_results=True) as conn:
+        pendiente = None
+        for chunk in pd.read_sql(QUERY_SERVICIOS_ESTADOS, conn, chunksize=chunksize):
+            chunk = aplicar_tipos(chunk, TIPOS_SERVICIOS_ESTADOS)
+            if pendiente is not None:
+                chunk = pd.concat([pendiente, chunk], ignore_index=True)
+            if len(chunk) == 0:
+                continue
+            
+            # El último servicio puede continuar en el siguiente bloque
+            incompleto = chunk['servicio_id'] == chunk['servicio_id'].iloc[-1]
+            pendiente = chunk[incompleto]
+            if (~incompleto).any():
+                yield chunk[~incompleto].reset_index(drop=True)
+        
+        if pendiente is not None and len(pendiente) > 0:
+            yield pendiente.reset_index(drop=True)
+
+
+# Estados posteriores a la marca de agua, comparando primero la columna fecha sin expresiones
+# para que un índice sobre (fecha, hora) de la fuente limite la lectura a los días nuevos
+FILTRO_MARCA_ESTADOS = """fecha >= CAST(:desde_fecha AS DATE)
+            AND (fecha > CAST(:desde_fecha AS DATE) OR hora >= CAST(:desde_hora AS TIME))"""
+
+
+def watermark_params(desde: str) -> dict[str, str]:
+    """
+    Separa la marca de agua 'YYYY-MM-DD HH:MM:SS' de los estados en los parámetros de FILTRO_MARCA_ESTADOS
+    """
+    marca = pd.Timestamp(desde)
+    return {'desde_fecha': marca.strftime('%Y-%m-%d'), 'desde_hora': marca.strftime('%H:%M:%S.%f')}
+
+
+def extract_servicios_modificados(source_engine: Engine, desde: str) -> pd.DataFrame:
+    """
+    Extrae todos los estados de los servicios que tuvieron algún cambio de estado desde la marca de agua
+    Se traen todos los estados del servicio (no solo los nuevos) para poder recalcular su fila completa
+    Los estados registrados después con una fecha y hora anteriores a la marca de agua (eventos
+    con fecha atrasada) no se detectan: esos servicios se corrigen con --full-refresh
+    Args:
+        source_engine: Conexión a la base de datos fuente
+        desde: Marca de agua 'YYYY-MM-DD HH:MM:SS' de mensajeria_estadosservicio
+    Returns:
+        pd.DataFrame: DataFrame con las mismas columnas que QUERY_SERVICIOS_ESTADOS
+    """
+    query = f"""
+    SELECT 
+        s.id as servicio_id,
+        s.cliente_id,
+        s.mensajero_id as mensajero_inicial_id,
+        es.estado_id,
+        es.fecha as fecha_estado,
+        date_part('epoch', es.hora) as hora_estado
+    FROM mensajeria_servicio s
+    JOIN mensajeria_estadosservicio es ON s.id = es.servicio_id
+    WHERE s.id IN (
+        SELECT servicio_id 
+        FROM mensajeria_estadosservicio 
+        WHERE {FILTRO_MARCA_ESTADOS}
+    )
+    ORDER BY s.id, es.fecha, es.hora
+    """
+    return aplicar_tipos(pd.read_sql(text(query), source_engine, params=watermark_params(desde)),
+                         TIPOS_SERVICIOS_ESTADOS)
+
+
+def extract_watermarks(source_engine: Engine) -> dict[str, str]:
+    """
+    Obtiene las marcas de agua actuales de las tablas fuente usadas en modo incremental
+    Args:
+        source_engine: Conexión a la base de datos fuente
+    Returns:
+        dict: {tabla_fuente: valor} con el máximo fecha+hora de los estados y el máximo id de novedades
+    """
+    # El último estado por (fecha, hora) y no MAX(fecha + hora): un índice sobre (fecha, hora) de la fuente
+    # lo encuentra leyendo desde el final, sin recorrer la tabla para evaluar la expresión en cada fila
+    query = """
+    SELECT 
+        (SELECT fecha + hora FROM mensajeria_estadosservicio
+         WHERE fecha IS NOT NULL AND hora IS NOT NULL
+         ORDER BY fecha DESC, hora DESC LIMIT 1) as mensajeria_estadosservicio,
+        (SELECT MAX(id) FROM mensajeria_novedadesservicio) as mensajeria_novedadesservicio
+    """
+    fila = pd.read_sql(query, source_engine).iloc[0]
+    return {tabla: str(valor) for tabla, valor in fila.items() if pd.notna(valor)}
+
+
+# Tablas de la fuente que lee cada dimensión; su contenido forma parte de la huella de staging
+TABLAS_DIMENSIONES = {
+    'dim_cliente': ['cliente', 'tipo_cliente', 'ciudad'],
+    'dim_mensajero': ['clientes_mensajeroaquitoy', 'ciudad'],
+    'dim_sede': ['sede', 'ciudad', 'departamento'],
+    'dim_estado': ['mensajeria_estado'],
+}
+
+
+def extract_dimension_fingerprints(source_engine: Engine) -> dict[str, str]:
+    """
+    Huella del contenido de las tablas de la fuente que leen las dimensiones, para que la caché
+    de staging no entregue una dimensión desactualizada cuando cambia una fila sin cambiar las
+    marcas de agua (por ejemplo el teléfono de un cliente o el nombre de una sede)
+    Las tablas de TABLAS_DIMENSIONES son pequeñas: se usa la cantidad de filas y la suma de un hash
+    de cada fila completa. dim_novedad lee mensajeria_novedadesservicio, del tamaño de un hecho:
+    para ella solo se usan la cantidad de filas y el máximo id
+    Args:
+        source_engine: Conexión a la base de datos fuente
+    Returns:
+        dict: {tabla_fuente: huella}
+    """
+    tablas = sorted({tabla for lista in TABLAS_DIMENSIONES.values() for tabla in lista})
+    consultas = [f"SELECT '{tabla}' AS tabla, "
+                 f"COUNT(*) || ':' || COALESCE(SUM(hashtext(t::text)::bigint), 0) AS huella FROM {tabla} t"
+                 for tabla in tablas]
+    consultas.append("SELECT 'mensajeria_novedadesservicio' AS tabla, "
+                     "COUNT(*) || ':' || COALESCE(MAX(id), 0) AS huella FROM mensajeria_novedadesservicio")
+    df = pd.read_sql('\nUNION ALL\n'.join(consultas), source_engine)
+    return dict(zip(df['tabla'], df['huella'].astype(str)))
+
+
+def extract_hecho_servicio_hora(con: Engine, servicio_ids: list[int] | None = None) -> pd.DataFrame:
     """
     Extrae los datos para el hecho de servicios por hora desde el hecho acumulado
     Args:
         con: Conexión a la base de datos bodega
+        servicio_ids: Si se indica, solo extrae esos servicios (modo incremental)
     Returns:
         pd.DataFrame: DataFrame con los datos de servicios por hora
     """
@@ -165,14 +401,20 @@ def extract_hecho_servicio_hora(con: Engine) -> pd.DataFrame:
     JOIN dim_sede ds ON dc.cliente_id = ds.sede_id
     WHERE ha.hora_iniciado IS NOT NULL
     """
-    return pd.read_sql(query, con)
+    if servicio_ids is not None:
+        query += "    AND ha.servicio_id = ANY(:servicio_ids)\n"
+        df = pd.read_sql(text(query), con, params={'servicio_ids': list(servicio_ids)})
+    else:
+        df = pd.read_sql(query, con)
+    return aplicar_tipos(df, TIPOS_SERVICIO_HORA)
 
 
-def extract_hecho_servicio_diaria(con: Engine) -> pd.DataFrame:
+def extract_hecho_servicio_diaria(con: Engine, servicio_ids: list[int] | None = None) -> pd.DataFrame:
     """
     Extrae los datos para el hecho de servicios por día desde el hecho acumulado
     Args:
         con: Conexión a la base de datos bodega
+        servicio_ids: Si se indica, solo extrae esos servicios (modo incremental)
     Returns:
         pd.DataFrame: DataFrame con los datos de servicios por día
     """
@@ -190,17 +432,23 @@ def extract_hecho_servicio_diaria(con: Engine) -> pd.DataFrame:
     JOIN dim_fecha df ON ha.key_dim_fecha = df.key_dim_fecha
     WHERE ha.fecha_iniciado IS NOT NULL
     """
-    return pd.read_sql(query, con)
+    if servicio_ids is not None:
+        query += "    AND ha.servicio_id = ANY(:servicio_ids)\n"
+        df = pd.read_sql(text(query), con, params={'servicio_ids': list(servicio_ids)})
+    else:
+        df = pd.read_sql(query, con)
+    return aplicar_tipos(df, TIPOS_SERVICIO_DIARIA)
 
 
-def extract_hecho_novedades(con_fuente: Engine, con_bodega: Engine) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+def extract_hecho_novedades(con_fuente: Engine, desde_id: int | None = None) -> pd.DataFrame:
     """
     Extrae los datos necesarios para el hecho de novedades
+    Las llaves de las dimensiones se resuelven en memoria (ver etl.keys.KeyResolver)
     Args:
         con_fuente: Conexión a la base de datos fuente
-        con_bodega: Conexión a la base de datos bodega
+        desde_id: Si se indica, solo extrae las novedades con id mayor (modo incremental)
     Returns:
-        tuple: (df_novedades, dim_fecha, dim_cliente, dim_novedad)
+        pd.DataFrame: DataFrame con las novedades
     """
     # Consulta para datos de la fuente
     query = """
@@ -215,11 +463,7 @@ def extract_hecho_novedades(con_fuente: Engine, con_bodega: Engine) -> tuple[pd.
         mensajeria_novedadesservicio n
         JOIN mensajeria_servicio s ON n.id = s.cliente_id
     """
+    if desde_id is not None:
+        query += "    WHERE n.id > :desde_id\n"
     
-    # Extraer datos de la fuente y dimensiones de la bodega
-    df_novedades = pd.read_sql(query, con_fuente)
-    dim_fecha = pd.read_sql_table('dim_fecha', con_bodega)
-    dim_cliente = pd.read_sql_table('dim_cliente', con_bodega)
-    dim_novedad = pd.read_sql_table('dim_novedad', con_bodega)
-    
-    return df_novedades, dim_fecha, dim_cliente, dim_novedad
\ No newline at end of file
+    return aplicar_tipos(pd.read_sql(text(query), con_fuente, params={'desde_id': desde_id}), TIPOS_NOVEDADES)
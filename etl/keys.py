@@ -0,0 +1,122 @@
+import threading
+import numpy as np
+import pandas as pd
+from sqlalchemy.engine import Engine
+
+# Llave subrogada y llave natural de cada dimensión
+LLAVES_DIMENSIONES = {
+    'dim_fecha': ('key_dim_fecha', 'fecha'),
+    'dim_hora': ('key_dim_hora', 'hora'),
+    'dim_cliente': ('key_dim_cliente', 'cliente_id'),
+    'dim_mensajero': ('key_dim_mensajero', 'mensajero_id'),
+    'dim_sede': ('key_dim_sede', 'sede_id'),
+    'dim_novedad': ('key_dim_novedad', 'novedad_id'),
+    'dim_estado': ('key_dim_estado', 'estado_id'),
+}
+
+
+def _normalizar(tabla: str, valores) -> pd.Index:
+    """
+    Lleva las llaves naturales a un tipo comparable: datetime64 sin hora para fechas, numérico para ids
+    """
+    if tabla == 'dim_fecha':
+        return pd.Index(pd.to_datetime(pd.Series(valores), errors='coerce').dt.normalize())
+    return pd.Index(pd.to_numeric(pd.Series(valores), errors='coerce'))
+
+
+class KeyResolver:
+    """
+    Índices en memoria llave natural -> llave subrogada de las dimensiones, construidos una vez
+    por ejecución a partir de las filas cargadas y sus llaves generadas. Los hechos resuelven
+    sus llaves con búsquedas vectorizadas (Index.get_indexer) en lugar de merges y lecturas a la bodega
+    """
+
+    def __init__(self):
+        self._indices = {}
+        self._inversos = {}
+        self._lock = threading.Lock()
+
+    def register(self, tabla: str, naturales, llaves):
+        """
+        Agrega (o actualiza) miembros de una dimensión
+        Si una llave natural aparece más de una vez se conserva la última llave subrogada
+        Args:
+            tabla: Nombre de la dimensión
+            naturales: Llaves naturales de los miembros
+            llaves: Llaves subrogadas, en el mismo orden
+        """
+        nuevos = pd.Series(np.asarray(llaves), index=_normalizar(tabla, naturales))
+        inversos = pd.Series(nuevos.index, index=pd.Index(np.asarray(llaves)))
+        with self._lock:
+            if tabla in self._indices:
+                nuevos = pd.concat([self._indices[tabla], nuevos])
+                inversos = pd.concat([self._inversos[tabla], inversos])
+            nuevos = nuevos[~nuevos.index.duplicated(keep='last')]
+            inversos = inversos[~inversos.index.duplicated(keep='last')]
+            # pandas construye la tabla hash del índice en la primera búsqueda y esa construcción no es
+            # segura entre hilos: se construye aquí, antes de que las etapas en paralelo lo consulten
+            for serie in (nuevos, inversos):
+                serie.index.get_indexer(serie.index[:1])
+            self._indices[tabla] = nuevos
+            self._inversos[tabla] = inversos
+
+    def register_frame(self, tabla: str, df: pd.DataFrame):
+        """
+        Agrega los miembros de un DataFrame de la dimensión que ya tiene su llave subrogada
+        """
+        llave, natural = LLAVES_DIMENSIONES[tabla]
+        self.register(tabla, df[natural], df[llave])
+
+    def load_from_db(self, con: Engine, tabla: str):
+        """
+        Lee de la bodega solo la llave subrogada y la llave natural de una dimensión y las registra
+        """
+        llave, natural = LLAVES_DIMENSIONES[tabla]
+        self.register_frame(tabla, pd.read_sql(f'SELECT {llave}, {natural} FROM {tabla}', con))
+
+    def has(self, tabla: str) -> bool:
+        return tabla in self._indices
+
+    def resolve(self, tabla: str, valores) -> pd.Series:
+        """
+        Traduce llaves naturales a llaves subrogadas
+        Args:
+            tabla: Nombre de la dimensión
+            valores: Llaves naturales a buscar
+        Returns:
+            pd.Series: Llaves subrogadas (Int64), nulo si la llave natural no existe en la dimensión
+        """
+        indice = self._indices[tabla]
+        posiciones = indice.index.get_indexer(_normalizar(tabla, valores))
+        encontrados = posiciones >= 0
+        llaves = pd.array(np.zeros(len(posiciones), dtype='int64'), dtype='Int64')
+        llaves[encontrados] = indice.to_numpy()[posiciones[encontrados]]
+        llaves[~encontrados] = pd.NA
+        index = valores.index if isinstance(valores, pd.Series) else None
+        return pd.Series(llaves, index=index)
+
+    def natural(self, tabla: str, llaves) -> pd.Series:
+        """
+        Traduce llaves subrogadas a llaves naturales (búsqueda inversa)
+        Args:
+            tabla: Nombre de la dimensión
+            llaves: Llaves subrogadas a buscar
+        Returns:
+            pd.Series: Llaves naturales, nulo si la llave subrogada no existe en la dimensión
+        """
+        inverso = self._inversos[tabla]
+        posiciones = inverso.index.get_indexer(pd.to_numeric(pd.Series(llaves), errors='coerce'))
+        naturales = inverso.to_numpy()[np.where(posiciones >= 0, posiciones, 0)] if len(inverso) else np.full(len(posiciones), np.nan)
+        index = llaves.index if isinstance(llaves, pd.Series) else None
+        return pd.Series(naturales, index=index).where(posiciones >= 0)
+
+
+def resolver_from_frames(**dimensiones: pd.DataFrame) -> KeyResolver:
+    """
+    Construye un KeyResolver a partir de DataFrames de dimensiones ya cargadas (con su llave subrogada)
+    Ejemplo: resolver_from_frames(dim_fecha=dim_fecha, dim_cliente=dim_cliente)
+    """
+    resolver = KeyResolver()
+    for tabla, df in dimensiones.items():
+        resolver.register_frame(tabla, df)
+    return resolver
@@ -1,8 +1,25 @@
+import io
+import time
+from typing import Iterable
 from pandas import DataFrame
+from pandas import Timestamp
+from pandas.api.types import is_float_dtype, is_timedelta64_dtype
 from sqlalchemy.engine import Engine
 from sqlalchemy import text
+from psycopg2.extras import execute_values
+from etl import metrics
 
-def load(table: DataFrame, etl_conn: Engine, tname: str, replace: bool = False):
+# Llave natural de las tablas que se pueden cargar con merge (una fila por llave)
+# dim_cliente y dim_mensajero no están: llevan historia y tienen varias versiones por llave (ver etl/scd.py)
+LLAVES_MERGE = {
+    'hecho_entrega_acumulado': 'servicio_id',
+    'dim_sede': 'sede_id',
+    'dim_novedad': 'novedad_id',
+    'dim_estado': 'estado_id',
+}
+
+def load(table: DataFrame, etl_conn: Engine, tname: str, replace: bool = False,
+         copy: bool = False, chunksize: int = 100_000, merge: bool = False):
     """
     Carga un DataFrame en la base de datos
     Args:
@@ -10,11 +27,370 @@ def load(table: DataFrame, etl_conn: Engine, tname: str, replace: bool = False):
         etl_conn: Conexión a la base de datos
         tname: Nombre de la tabla destino
         replace: Si es True, elimina los datos existentes antes de cargar
+        copy: Si es True, carga con COPY FROM STDIN (ver load_copy)
+        chunksize: Filas por bloque enviado con COPY
+        merge: Si es True, inserta o actualiza según la llave natural de LLAVES_MERGE (ver load_merge)
+    Returns:
+        int: Cantidad de filas cargadas
     """
-    if replace:
+    if merge:
+        if tname not in LLAVES_MERGE:
+            raise ValueError(f"La tabla {tname} no tiene una llave natural declarada en LLAVES_MERGE")
+        return load_merge(table, etl_conn, tname, LLAVES_MERGE[tname], chunksize)
+    if copy:
+        return load_copy(table, etl_conn, tname, replace, chunksize)
+    elif replace:
         with etl_conn.connect() as conn:
             conn.execute(text(f'Delete from {tname}'))
             conn.commit()
         table.to_sql(tname, etl_conn, if_exists='append', index=False)
     else:
-        table.to_sql(tname, etl_conn, if_exists='append', index=False)
\ No newline at end of file
+        table.to_sql(tname, etl_conn, if_exists='append', index=False)
+    return len(table)
+
+
+def _preparar_para_copy(table: DataFrame) -> DataFrame:
+    """
+    Convierte las columnas float que solo contienen enteros (llaves con nulos) a Int64,
+    para que COPY no reciba valores como '3.0' en columnas INTEGER, y las horas timedelta64
+    a 'HH:MM:SS' para las columnas TIME
+    """
+    table = table.copy(deep=False)
+    for col in table.columns:
+        if is_float_dtype(table[col]):
+            valores = table[col].dropna()
+            if (valores == valores.round()).all():
+                table[col] = table[col].astype('Int64')
+        elif is_timedelta64_dtype(table[col]):
+            table[col] = (Timestamp(0) + table[col]).dt.strftime('%H:%M:%S')
+    return table
+
+
+def _copy_dataframe(cur, table: DataFrame, tname: str, chunksize: int):
+    """
+    Envía un DataFrame con COPY FROM STDIN por bloques de chunksize filas sobre un cursor abierto
+    y suma los bytes de cada buffer a las métricas del hilo
+    """
+    table = _preparar_para_copy(table)
+    columnas = ', '.join(f'"{col}"' for col in table.columns)
+    sql_copy = f"COPY {tname} ({columnas}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    for start in range(0, len(table), chunksize):
+        buffer = io.BytesIO()
+        table.iloc[start:start + chunksize].to_csv(
+            buffer, index=False, header=False, na_rep='\\N', encoding='utf-8'
+        )
+        metrics.add_copied_bytes(buffer.tell())
+        buffer.seek(0)
+        cur.copy_expert(sql_copy, buffer)
+
+
+def _reportar_carga(tname: str, filas: int, inicio: float):
+    """
+    Imprime las filas cargadas y la velocidad de carga
+    """
+    duracion = time.perf_counter() - inicio
+    print(f"{tname}: {filas} filas cargadas en {duracion:.2f}s "
+          f"({filas / duracion if duracion > 0 else 0:.0f} filas/s)")
+
+
+def load_copy(table: DataFrame, etl_conn: Engine, tname: str, replace: bool = False,
+              chunksize: int = 100_000):
+    """
+    Carga un DataFrame con COPY FROM STDIN desde un buffer CSV en memoria
+    Todo se hace en una sola transacción; los bloques de chunksize filas se envían uno tras otro
+    Args:
+        table: DataFrame a cargar
+        etl_conn: Conexión a la base de datos
+        tname: Nombre de la tabla destino
+        replace: Si es True, vacía la tabla con TRUNCATE antes de cargar
+            (la tabla no puede estar referenciada por llaves foráneas)
+        chunksize: Filas por bloque enviado con COPY
+    Returns:
+        int: Cantidad de filas cargadas
+    """
+    return load_chunks([table], etl_conn, tname, replace, chunksize)
+
+
+def load_chunks(chunks: Iterable[DataFrame], etl_conn: Engine, tname: str, replace: bool = False,
+                chunksize: int = 100_000):
+    """
+    Carga con COPY una secuencia de DataFrames (por ejemplo un generador) en una sola transacción
+    Cada bloque se envía apenas se produce, así solo hay un bloque en memoria a la vez
+    Args:
+        chunks: DataFrames a cargar, todos con las mismas columnas
+        etl_conn: Conexión a la base de datos
+        tname: Nombre de la tabla destino
+        replace: Si es True, vacía la tabla con TRUNCATE antes de cargar
+        chunksize: Filas por bloque enviado con COPY
+    Returns:
+        int: Cantidad de filas cargadas
+    """
+    bloques = ({tname: table} for table in chunks)
+    return load_chunks_tables(bloques, etl_conn, [tname], replace, chunksize)[tname]
+
+
+def load_chunks_tables(chunks: Iterable[dict[str, DataFrame]], etl_conn: Engine, tnames: list[str],
+                       replace: bool = False, chunksize: int = 100_000) -> dict[str, int]:
+    """
+    Carga con COPY una secuencia de bloques con filas para varias tablas en una sola transacción
+    Cada bloque es un dict {tabla: DataFrame} y sus DataFrames se envían apenas se produce,
+    así solo hay un bloque de cada tabla en memoria a la vez
+    Args:
+        chunks: Bloques {tabla: DataFrame}; una tabla puede faltar en algún bloque
+        etl_conn: Conexión a la base de datos
+        tnames: Nombres de las tablas destino
+        replace: Si es True, vacía las tablas con TRUNCATE antes de cargar
+        chunksize: Filas por bloque enviado con COPY
+    Returns:
+        dict: Cantidad de filas cargadas por tabla
+    """
+    inicio = time.perf_counter()
+    filas = dict.fromkeys(tnames, 0)
+
+    conn = etl_conn.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            if replace:
+                cur.execute(f"TRUNCATE TABLE {', '.join(tnames)}")
+            for bloque in chunks:
+                for tname, table in bloque.items():
+                    _copy_dataframe(cur, table, tname, chunksize)
+                    filas[tname] += len(table)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    for tname in tnames:
+        _reportar_carga(tname, filas[tname], inicio)
+    return filas
+
+
+def load_replace_keys(table: DataFrame, etl_conn: Engine, tname: str, key: str,
+                      chunksize: int = 100_000, values: list | None = None):
+    """
+    Reemplaza en la tabla destino las filas cuyas llaves aparecen en el DataFrame
+    Borra las filas existentes con esas llaves y carga las nuevas con COPY, en una sola transacción
+    Args:
+        table: DataFrame con las filas nuevas o modificadas
+        etl_conn: Conexión a la base de datos
+        tname: Nombre de la tabla destino
+        key: Columna que identifica las filas a reemplazar (por ejemplo servicio_id)
+        chunksize: Filas por bloque enviado con COPY
+        values: Llaves a borrar; por defecto las que aparecen en el DataFrame
+    Returns:
+        int: Cantidad de filas cargadas
+    """
+    inicio = time.perf_counter()
+    llaves = list(values) if values is not None else table[key].dropna().unique().tolist()
+
+    conn = etl_conn.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f'DELETE FROM {tname} WHERE {key} = ANY(%s)', (llaves,))
+            _copy_dataframe(cur, table, tname, chunksize)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    _reportar_carga(tname, len(table), inicio)
+    return len(table)
+
+
+def _copy_to_temp(cur, table: DataFrame, tname: str, chunksize: int) -> str:
+    """
+    Crea una tabla temporal con las columnas del DataFrame (y los tipos de la tabla destino),
+    le envía las filas con COPY y actualiza sus estadísticas para el cruce con la tabla destino
+    Returns:
+        str: Nombre de la tabla temporal, que se elimina al terminar la transacción
+    """
+    temporal = f'tmp_{tname}'
+    columnas = ', '.join(f'"{col}"' for col in table.columns)
+    cur.execute(f'CREATE TEMP TABLE {temporal} ON COMMIT DROP AS SELECT {columnas} FROM {tname} WITH NO DATA')
+    _copy_dataframe(cur, table, temporal, chunksize)
+    cur.execute(f'ANALYZE {temporal}')
+    return temporal
+
+
+def _update(cur, table: DataFrame, tname: str, key: str, chunksize: int) -> int:
+    """
+    UPDATE ... FROM de las columnas del DataFrame sobre un cursor abierto, sin confirmar
+    La tabla temporal se elimina al terminar, para poder repetir el paso en la misma transacción
+    """
+    asignaciones = ', '.join(f'"{col}" = s."{col}"' for col in table.columns if col != key)
+    temporal = _copy_to_temp(cur, table, tname, chunksize)
+    cur.execute(f'UPDATE {tname} t SET {asignaciones} FROM {temporal} s WHERE t."{key}" = s."{key}"')
+    filas = cur.rowcount
+    cur.execute(f'DROP TABLE {temporal}')
+    return filas
+
+
+def load_update(table: DataFrame, etl_conn: Engine, tname: str, key: str, chunksize: int = 100_000) -> int:
+    """
+    Actualiza en la tabla destino las columnas del DataFrame en las filas cuya llave aparece en él
+    Las filas se envían con COPY a una tabla temporal y se aplican con un solo UPDATE ... FROM
+    Args:
+        table: DataFrame con la llave y las columnas a actualizar
+        etl_conn: Conexión a la base de datos
+        tname: Nombre de la tabla destino
+        key: Columna que identifica las filas a actualizar; puede repetirse en la tabla destino
+        chunksize: Filas por bloque enviado con COPY
+    Returns:
+        int: Cantidad de filas actualizadas en la tabla destino
+    """
+    inicio = time.perf_counter()
+
+    conn = etl_conn.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            filas = _update(cur, table, tname, key, chunksize)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    _reportar_carga(tname, filas, inicio)
+    return filas
+
+
+def load_merge(table: DataFrame, etl_conn: Engine, tname: str, key: str, chunksize: int = 100_000) -> int:
+    """
+    Inserta o actualiza (merge) las filas del DataFrame según una llave natural
+    Las filas se envían con COPY a una tabla temporal; en una sola transacción se actualizan
+    las filas cuya llave ya existe (conservan su llave subrogada) y se insertan las demás
+    Las filas que no cambian (sin contar la fecha de carga saved) no se reescriben
+    No requiere una restricción UNIQUE sobre la llave (como ON CONFLICT), que en las tablas
+    particionadas tendría que incluir la columna de partición
+    Args:
+        table: DataFrame a cargar; si una llave se repite se conserva la última fila
+        etl_conn: Conexión a la base de datos
+        tname: Nombre de la tabla destino
+        key: Llave natural, por ejemplo servicio_id
+        chunksize: Filas por bloque enviado con COPY
+    Returns:
+        int: Cantidad de filas insertadas o actualizadas
+    """
+    inicio = time.perf_counter()
+    table = table.drop_duplicates(key, keep='last')
+    columnas = ', '.join(f'"{col}"' for col in table.columns)
+    asignaciones = ', '.join(f'"{col}" = s."{col}"' for col in table.columns if col != key)
+    comparadas = [f'"{col}"' for col in table.columns if col not in (key, 'saved')]
+    cambios = 'TRUE'
+    if comparadas:
+        destino = ', '.join('t.' + col for col in comparadas)
+        origen = ', '.join('s.' + col for col in comparadas)
+        cambios = f'({destino}) IS DISTINCT FROM ({origen})'
+
+    conn = etl_conn.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            temporal = _copy_to_temp(cur, table, tname, chunksize)
+            cur.execute(f'UPDATE {tname} t SET {asignaciones} FROM {temporal} s '
+                        f'WHERE t."{key}" = s."{key}" AND {cambios}')
+            actualizadas = cur.rowcount
+            cur.execute(f"""
+                INSERT INTO {tname} ({columnas})
+                SELECT {columnas} FROM {temporal} s
+                WHERE NOT EXISTS (SELECT 1 FROM {tname} t WHERE t."{key}" = s."{key}")
+            """)
+            insertadas = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    print(f"{tname}: {actualizadas} filas actualizadas y {insertadas} insertadas")
+    _reportar_carga(tname, actualizadas + insertadas, inicio)
+    return actualizadas + insertadas
+
+
+def _insert_returning(cur, table: DataFrame, tname: str, key_column: str, page_size: int) -> list:
+    """
+    INSERT ... RETURNING del DataFrame sobre un cursor abierto, sin confirmar
+    """
+    columnas = ', '.join(f'"{col}"' for col in table.columns)
+    filas = list(table.astype(object).where(table.notna(), None).itertuples(index=False, name=None))
+    llaves = execute_values(
+        cur,
+        f'INSERT INTO {tname} ({columnas}) VALUES %s RETURNING {key_column}',
+        filas,
+        page_size=page_size,
+        fetch=True
+    )
+    return [llave for (llave,) in llaves]
+
+
+def load_returning_keys(table: DataFrame, etl_conn: Engine, tname: str, key_column: str,
+                        replace: bool = False, page_size: int = 1000) -> list:
+    """
+    Inserta un DataFrame con INSERT ... RETURNING y retorna las llaves generadas
+    Pensado para dimensiones: las llaves retornadas alimentan el KeyResolver de la ejecución
+    sin tener que volver a leer la tabla
+    Args:
+        table: DataFrame a cargar
+        etl_conn: Conexión a la base de datos
+        tname: Nombre de la tabla destino
+        key_column: Columna de la llave subrogada (SERIAL) a retornar
+        replace: Si es True, elimina los datos existentes antes de cargar
+        page_size: Filas por sentencia INSERT
+    Returns:
+        list: Llaves generadas, en el mismo orden que las filas del DataFrame
+    """
+    inicio = time.perf_counter()
+
+    conn = etl_conn.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            if replace:
+                cur.execute(f'DELETE FROM {tname}')
+            llaves = _insert_returning(cur, table, tname, key_column, page_size)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    _reportar_carga(tname, len(table), inicio)
+    return llaves
+
+
+def load_scd(cambios: dict[str, DataFrame], etl_conn: Engine, tname: str, key: str, key_column: str,
+             chunksize: int = 100_000, page_size: int = 1000) -> list:
+    """
+    Aplica los cambios de una dimensión con historia (resultado de scd.detect_changes) en una
+    sola transacción: si algo falla no quedan versiones cerradas sin su versión nueva, y una
+    nueva ejecución (o --resume) vuelve a detectar los mismos cambios
+    Args:
+        cambios: {'tipo1', 'expirar', 'insertar'} de scd.detect_changes
+        etl_conn: Conexión a la base de datos
+        tname: Nombre de la dimensión
+        key: Llave natural, por la que se sobrescriben los cambios de tipo 1
+        key_column: Llave subrogada, por la que se cierran las versiones y que retornan las nuevas
+        chunksize: Filas por bloque enviado con COPY
+        page_size: Filas por sentencia INSERT
+    Returns:
+        list: Llaves generadas para las filas de cambios['insertar'], en el mismo orden
+    """
+    inicio = time.perf_counter()
+    llaves = []
+    with etl_conn.begin() as conn:
+        with conn.connection.cursor() as cur:
+            if len(cambios['tipo1']) > 0:
+                _update(cur, cambios['tipo1'], tname, key, chunksize)
+            if len(cambios['expirar']) > 0:
+                _update(cur, cambios['expirar'], tname, key_column, chunksize)
+            if len(cambios['insertar']) > 0:
+                llaves = _insert_returning(cur, cambios['insertar'], tname, key_column, page_size)
+
+    _reportar_carga(tname, sum(len(df) for df in cambios.values()), inicio)
+    return llaves
@@ -0,0 +1,277 @@
+import csv
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Iterable, Iterator
+import pandas as pd
+from sqlalchemy.engine import Engine
+from sqlalchemy import text
+
+# psutil es opcional: sin él no se registra la memoria RSS actual del proceso
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# resource no existe en Windows: sin él no se registra la memoria RSS pico
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# bytes_memoria es el tamaño en memoria del DataFrame, bytes_transferidos lo que se envió con COPY
+# y pico_rss_proceso_mb el máximo de RSS del proceso desde que inició (no el pico de la etapa)
+COLUMNAS_REPORTE = ['run_id', 'etapa', 'paso', 'inicio', 'segundos', 'cpu_segundos', 'cpu_procesos_segundos',
+                    'filas_entrada', 'filas_salida', 'bytes_memoria', 'bytes_transferidos', 'rss_mb',
+                    'pico_rss_proceso_mb', 'estado']
+
+DDL_RUN_LOG = """
+CREATE TABLE IF NOT EXISTS etl_run_log (
+    run_id VARCHAR(36) NOT NULL,
+    etapa VARCHAR(100) NOT NULL,
+    paso VARCHAR(100) NOT NULL,
+    inicio TIMESTAMP NOT NULL,
+    segundos DOUBLE PRECISION NOT NULL,
+    cpu_segundos DOUBLE PRECISION NOT NULL,
+    cpu_procesos_segundos DOUBLE PRECISION,
+    filas_entrada BIGINT,
+    filas_salida BIGINT,
+    bytes_memoria BIGINT,
+    bytes_transferidos BIGINT,
+    rss_mb DOUBLE PRECISION,
+    pico_rss_proceso_mb DOUBLE PRECISION,
+    estado VARCHAR(20) NOT NULL
+)
+"""
+
+
+def _filas(valor) -> int | None:
+    """
+    Filas de un resultado: largo de un DataFrame o lista, o el conteo que retornan las cargas
+    """
+    if isinstance(valor, (pd.DataFrame, pd.Series, list)):
+        return len(valor)
+    if isinstance(valor, int) and not isinstance(valor, bool):
+        return valor
+    return None
+
+
+def _bytes(valor) -> int | None:
+    """
+    Tamaño en memoria de un DataFrame (incluye el contenido de las columnas de texto)
+    """
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=False, deep=True).sum())
+    return None
+
+
+# CPU usada por los procesos del pool de etl.parallel en las tareas de cada hilo de etapa
+_cpu_procesos = threading.local()
+
+
+def add_process_cpu(segundos: float):
+    """
+    Suma al hilo actual el CPU que usó un proceso del pool en una tarea enviada desde ese hilo
+    RUSAGE_CHILDREN no la incluye: con forkserver los procesos del pool son hijos del servidor,
+    no de este proceso, y no terminan hasta que se cierra el pool
+    """
+    _cpu_procesos.segundos = _process_cpu() + segundos
+
+
+def _process_cpu() -> float:
+    return getattr(_cpu_procesos, 'segundos', 0.0)
+
+
+# Bytes enviados con COPY por etl.load en cada hilo de etapa
+_bytes_copiados = threading.local()
+
+
+def add_copied_bytes(cantidad: int):
+    """
+    Suma al hilo actual el tamaño de un buffer CSV enviado con COPY
+    """
+    _bytes_copiados.cantidad = _copied_bytes() + cantidad
+
+
+def _copied_bytes() -> int:
+    return getattr(_bytes_copiados, 'cantidad', 0)
+
+
+def _rss_mb() -> float | None:
+    if psutil is None:
+        return None
+    return psutil.Process().memory_info().rss / 1024 ** 2
+
+
+def _pico_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    # ru_maxrss está en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RunMetrics:
+    """
+    Métricas de una ejecución del ETL: un registro por cada paso (extract, transform, load)
+    de cada etapa con tiempo, CPU, filas, tamaño en memoria de los datos, bytes enviados con COPY y RSS
+    Las etapas corren en hilos, por eso el tiempo de CPU es el del hilo (time.thread_time) más el
+    que reportan los procesos del pool de etl.parallel para las tareas de ese hilo (cpu_procesos_segundos);
+    la memoria RSS y su pico son los del proceso completo, no los de la etapa
+    """
+
+    def __init__(self, run_id: str | None = None):
+        self.run_id = run_id or str(uuid.uuid4())
+        self.registros = []
+        self._lock = threading.Lock()
+
+    def _registrar(self, etapa: str, paso: str, inicio: datetime, segundos: float, cpu: float,
+                   cpu_procesos: float, filas_entrada, filas_salida, bytes_, transferidos, estado: str):
+        rss = _rss_mb()
+        pico = _pico_rss_mb()
+        registro = {
+            'run_id': self.run_id,
+            'etapa': etapa,
+            'paso': paso,
+            'inicio': inicio.isoformat(timespec='seconds'),
+            'segundos': round(segundos, 4),
+            'cpu_segundos': round(cpu, 4),
+            'cpu_procesos_segundos': round(cpu_procesos, 4),
+            'filas_entrada': filas_entrada,
+            'filas_salida': filas_salida,
+            'bytes_memoria': bytes_,
+            'bytes_transferidos': transferidos,
+            'rss_mb': round(rss, 1) if rss is not None else None,
+            'pico_rss_proceso_mb': round(pico, 1) if pico is not None else None,
+            'estado': estado
+        }
+        with self._lock:
+            self.registros.append(registro)
+
+    def measure(self, etapa: str, paso: str, funcion: Callable, *args, **kwargs):
+        """
+        Ejecuta una función y registra sus métricas
+        Las filas de entrada se toman del primer argumento si es un DataFrame; bytes_memoria es
+        el tamaño en memoria del DataFrame que sale de un extract (o de staging) o que entra a un load,
+        y bytes_transferidos lo que un load envió con COPY
+        Args:
+            etapa: Nombre de la etapa (tabla) a la que pertenece el paso
+            paso: 'extract', 'staging' (extracción leída de la caché), 'transform', 'load' u otro nombre descriptivo
+            funcion: Función a ejecutar con *args y **kwargs
+        Returns:
+            El resultado de la función
+        """
+        entrada = args[0] if args else None
+        inicio = datetime.now()
+        inicio_wall = time.perf_counter()
+        inicio_cpu = time.thread_time()
+        inicio_procesos = _process_cpu()
+        inicio_bytes = _copied_bytes()
+        estado = 'ok'
+        resultado = None
+        try:
+            resultado = funcion(*args, **kwargs)
+            return resultado
+        except Exception:
+            estado = 'error'
+            raise
+        finally:
+            segundos = time.perf_counter() - inicio_wall
+            cpu = time.thread_time() - inicio_cpu
+            cpu_procesos = _process_cpu() - inicio_procesos
+            memoria = (_bytes(entrada) if paso == 'load' else _bytes(resultado) if paso in ('extract', 'staging')
+                       else None)
+            transferidos = _copied_bytes() - inicio_bytes if paso == 'load' else None
+            self._registrar(etapa, paso, inicio, segundos, cpu, cpu_procesos, _filas(entrada),
+                            _filas(resultado), memoria, transferidos, estado)
+
+    def measure_chunks(self, etapa: str, paso: str, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """
+        Envuelve un generador de bloques y registra, al agotarse, el tiempo dentro del generador,
+        las filas y el tamaño en memoria de todos los bloques
+        El tiempo incluye el de los generadores de los que este consume
+        """
+        inicio = datetime.now()
+        segundos = cpu = cpu_procesos = 0.0
+        filas = bytes_ = 0
+        estado = 'ok'
+        iterador = iter(chunks)
+        try:
+            while True:
+                inicio_wall = time.perf_counter()
+                inicio_cpu = time.thread_time()
+                inicio_procesos = _process_cpu()
+                try:
+                    chunk = next(iterador)
+                except StopIteration:
+                    break
+                finally:
+                    segundos += time.perf_counter() - inicio_wall
+                    cpu += time.thread_time() - inicio_cpu
+                    cpu_procesos += _process_cpu() - inicio_procesos
+                filas += len(chunk)
+                bytes_ += _bytes(chunk) if paso == 'extract' else 0
+                yield chunk
+        except Exception:
+            estado = 'error'
+            raise
+        finally:
+            self._registrar(etapa, paso, inicio, segundos, cpu, cpu_procesos, None, filas,
+                            bytes_ if paso == 'extract' else None, None, estado)
+
+    def wrap_stage(self, etapa: str, funcion: Callable) -> Callable:
+        """
+        Envuelve la función de una etapa del scheduler para registrar su duración total
+        """
+        return lambda resultados: self.measure(etapa, 'total', funcion, resultados)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.registros, columns=COLUMNAS_REPORTE)
+
+    def summary(self):
+        """
+        Imprime el tiempo total y la memoria de cada etapa
+        """
+        totales = self.to_frame()
+        totales = totales[totales['paso'] == 'total']
+        print("\nResumen de la ejecución:")
+        for registro in totales.itertuples():
+            memoria = (f" pico RSS del proceso {registro.pico_rss_proceso_mb:.0f} MB"
+                       if pd.notna(registro.pico_rss_proceso_mb) else "")
+            procesos = f" (+{registro.cpu_procesos_segundos:.2f}s pool)" if registro.cpu_procesos_segundos else ""
+            print(f"  {registro.etapa:<32} {registro.segundos:>9.2f}s  CPU {registro.cpu_segundos:>8.2f}s"
+                  f"{procesos}{memoria}  [{registro.estado}]")
+
+    def write_report(self, directorio: str = 'reportes') -> tuple[str, str]:
+        """
+        Escribe el reporte de la ejecución en JSON y CSV
+        Args:
+            directorio: Carpeta donde se guardan los reportes (se crea si no existe)
+        Returns:
+            tuple: Rutas del archivo JSON y del CSV
+        """
+        os.makedirs(directorio, exist_ok=True)
+        base = os.path.join(directorio, f"run_{datetime.now():%Y%m%d_%H%M%S}_{self.run_id[:8]}")
+        with open(f'{base}.json', 'w', encoding='utf-8') as f:
+            json.dump({'run_id': self.run_id, 'pasos': self.registros}, f, indent=2, ensure_ascii=False)
+        with open(f'{base}.csv', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNAS_REPORTE)
+            writer.writeheader()
+            writer.writerows(self.registros)
+        print(f"Reporte de la ejecución guardado en {base}.json y {base}.csv")
+        return f'{base}.json', f'{base}.csv'
+
+    def save_to_db(self, con: Engine):
+        """
+        Agrega los registros de la ejecución a la tabla etl_run_log de la bodega
+        La tabla no se elimina en --full-refresh para conservar el historial de ejecuciones
+        """
+        with con.begin() as conn:
+            conn.execute(text(DDL_RUN_LOG))
+            if self.registros:
+                conn.execute(text(f"""
+                    INSERT INTO etl_run_log ({', '.join(COLUMNAS_REPORTE)})
+                    VALUES ({', '.join(':' + col for col in COLUMNAS_REPORTE)})
+                """), self.registros)
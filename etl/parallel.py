@@ -0,0 +1,171 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from multiprocessing import shared_memory
+from typing import Iterable, Iterator
+import numpy as np
+import pandas as pd
+from etl import metrics, transform
+from etl.keys import KeyResolver
+
+# pyarrow se exige solo al crear el pool, así la ejecución con un proceso funciona sin él
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+def split_servicios(df: pd.DataFrame, partes: int) -> list[pd.DataFrame]:
+    """
+    Divide los estados en rangos continuos de servicio_id con una cantidad similar de filas
+    Los cortes caen siempre entre servicios, así que cada servicio queda completo en un solo grupo,
+    y concatenar los resultados en orden da el mismo orden por servicio_id que sin dividir
+    Args:
+        df: Estados de los servicios
+        partes: Cantidad máxima de grupos
+    Returns:
+        list: Grupos de estados, en orden de servicio_id
+    """
+    # Orden estable: conserva el orden cronológico de la consulta dentro de cada servicio
+    df = df.sort_values('servicio_id', kind='mergesort', ignore_index=True)
+    servicios = df['servicio_id'].to_numpy()
+    cortes = np.searchsorted(servicios, servicios[np.linspace(0, len(df), partes + 1)[1:-1].astype(int)], 'left')
+    limites = np.unique(np.concatenate([[0], cortes, [len(df)]]))
+    return [df.iloc[inicio:fin] for inicio, fin in zip(limites[:-1], limites[1:]) if fin > inicio]
+
+
+def _a_arrow(df: pd.DataFrame):
+    """
+    Serializa un DataFrame en formato Arrow IPC (un solo buffer, conserva los tipos de pandas)
+    """
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, tabla.schema) as writer:
+        writer.write_table(tabla)
+    return sink.getvalue()
+
+
+def _de_arrow(buffer) -> pd.DataFrame:
+    return pa.ipc.open_stream(buffer).read_all().to_pandas()
+
+
+def _prepare_shard(nombre: str, tamano: int) -> tuple[bytes, float]:
+    """
+    Se ejecuta en un proceso del pool: lee un grupo de estados, calcula prepare_estados y
+    retorna el resultado como Arrow IPC junto con el tiempo de CPU que usó el proceso en la tarea
+    Args:
+        nombre: Bloque de memoria compartida con el grupo en Arrow IPC
+        tamano: Bytes del grupo dentro del bloque
+    """
+    inicio_cpu = time.process_time()
+    memoria = shared_memory.SharedMemory(name=nombre)
+    try:
+        vista = memoria.buf[:tamano]
+        df = _de_arrow(pa.py_buffer(vista))
+        vista.release()
+    finally:
+        memoria.close()
+    resultado = _a_arrow(transform.prepare_estados(df)).to_pybytes()
+    return resultado, time.process_time() - inicio_cpu
+
+
+class ShardedTransform:
+    """
+    Pool de procesos para calcular el pivote de estados y las duraciones del hecho acumulado
+    por grupos de servicios en varios núcleos
+    Los grupos se envían a los procesos en Arrow IPC por memoria compartida (un buffer por grupo,
+    sin serializar columna por columna); las llaves subrogadas se resuelven en el proceso principal
+    con el KeyResolver de la ejecución, que no se copia a los procesos
+    Se usa como contexto: with ShardedTransform(8) as pool: ...; con un solo proceso no se crea
+    el pool y todo se calcula en el proceso principal. Con más de uno se requiere pyarrow
+    """
+
+    def __init__(self, procesos: int | None = None, min_filas: int = 100_000):
+        self.procesos = procesos or os.cpu_count() or 1
+        self.min_filas = min_filas
+        self._pool = None
+
+    def __enter__(self) -> 'ShardedTransform':
+        if self.procesos <= 1:
+            return self
+        if pa is None:
+            raise ImportError("El cálculo en varios procesos requiere pyarrow: instálelo o use procesos: 1")
+        # forkserver: los procesos no heredan los hilos del scheduler de etapas; etl.transform
+        # se importa una sola vez en el servidor
+        metodos = multiprocessing.get_all_start_methods()
+        contexto = multiprocessing.get_context('forkserver' if 'forkserver' in metodos else 'spawn')
+        if 'forkserver' in metodos:
+            contexto.set_forkserver_preload(['etl.transform'])
+        self._pool = ProcessPoolExecutor(max_workers=self.procesos, mp_context=contexto)
+        return self
+
+    def __exit__(self, *exc):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _submit(self, df: pd.DataFrame) -> tuple[Future, shared_memory.SharedMemory]:
+        buffer = _a_arrow(df)
+        memoria = shared_memory.SharedMemory(create=True, size=max(buffer.size, 1))
+        try:
+            memoria.buf[:buffer.size] = memoryview(buffer).cast('B')
+            return self._pool.submit(_prepare_shard, memoria.name, buffer.size), memoria
+        except Exception:
+            memoria.close()
+            memoria.unlink()
+            raise
+
+    @staticmethod
+    def _result(futuro: Future, memoria: shared_memory.SharedMemory) -> pd.DataFrame:
+        """
+        Espera el resultado de un grupo y suma el CPU del proceso a la etapa del hilo que lo pide
+        """
+        try:
+            resultado, cpu = futuro.result()
+            metrics.add_process_cpu(cpu)
+        finally:
+            memoria.close()
+            memoria.unlink()
+        return _de_arrow(pa.py_buffer(resultado))
+
+    def prepare(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        prepare_estados en paralelo; el resultado es igual al de transform.prepare_estados(df)
+        """
+        partes = min(self.procesos, max(1, len(df) // self.min_filas))
+        if partes == 1 or self._pool is None:
+            return transform.prepare_estados(df)
+        enviados = [self._submit(grupo) for grupo in split_servicios(df, partes)]
+        return pd.concat([self._result(*enviado) for enviado in enviados], ignore_index=True)
+
+    def transform(self, df: pd.DataFrame, resolver: KeyResolver) -> pd.DataFrame:
+        """
+        transform_hecho_acumulado con el pivote y las duraciones calculados en paralelo
+        """
+        return transform.resolve_hecho_acumulado(self.prepare(df), resolver)
+
+    def transform_chunks(self, chunks: Iterable[pd.DataFrame], resolver: KeyResolver) -> Iterator[pd.DataFrame]:
+        """
+        transform_hecho_acumulado_chunks con varios bloques en proceso a la vez
+        Mantiene hasta 'procesos' bloques en vuelo (memoria acotada) y los entrega en el orden de entrada
+        """
+        if self._pool is None:
+            yield from transform.transform_hecho_acumulado_chunks(chunks, resolver)
+            return
+
+        en_vuelo = deque()
+        try:
+            for chunk in chunks:
+                en_vuelo.append(self._submit(chunk))
+                if len(en_vuelo) >= self.procesos:
+                    yield transform.resolve_hecho_acumulado(self._result(*en_vuelo.popleft()), resolver)
+            while en_vuelo:
+                yield transform.resolve_hecho_acumulado(self._result(*en_vuelo.popleft()), resolver)
+        finally:
+            # Si el consumidor se detiene o hay un error, liberar la memoria de los bloques pendientes
+            for futuro, memoria in en_vuelo:
+                futuro.cancel()
+                memoria.close()
+                memoria.unlink()
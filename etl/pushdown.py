@@ -0,0 +1,165 @@
+from typing import Iterable, Iterator
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from etl.extract import aplicar_tipos, watermark_params, FILTRO_MARCA_ESTADOS
+from etl.keys import KeyResolver
+from etl import transform
+
+# Motores del pivote de estados del hecho acumulado: 'pandas' extrae un registro por servicio y estado
+# y pivota en memoria; 'sql' pivota en PostgreSQL y extrae un solo registro ancho por servicio
+MOTORES_PIVOTE = ('pandas', 'sql')
+
+TIPOS_PIVOTE = {
+    'servicio_id': 'int32',
+    'cliente_id': 'Int32',
+    'mensajero_inicial_id': 'Int32',
+    'cantidad_novedades': 'int64',
+}
+TIPOS_PIVOTE.update({f'fecha_{nombre}': 'datetime64[ns]' for nombre in
+                     list(transform.ESTADOS.values()) + ['ultima_novedad']})
+TIPOS_PIVOTE.update({f'hora_{nombre}': 'timedelta64[ns]' for nombre in
+                     list(transform.ESTADOS.values()) + ['ultima_novedad']})
+
+# Duraciones del hecho acumulado: {columna: (instante inicial, instante final)}, igual que calcular_tiempos_estados
+DURACIONES = {
+    'tiempo_asignacion': ('iniciado', 'asignado'),
+    'tiempo_total_novedades': ('novedad', 'ultima_novedad'),
+    'tiempo_recogida': ('inicio_recogida', 'recogido'),
+    'tiempo_entrega': ('recogido', 'entregado'),
+    'tiempo_cierre': ('entregado', 'cerrado'),
+}
+
+
+def _primero(columna: str, estado: int, ultimo: bool = False) -> str:
+    """
+    Primer (o último) valor no nulo de la columna entre los registros del estado, en el orden
+    cronológico de la consulta del motor pandas (fecha, hora con los nulos al final),
+    igual que first/last de pandas en pivotar_estados
+    """
+    orden = 'es.fecha DESC NULLS FIRST, es.hora DESC NULLS FIRST' if ultimo else 'es.fecha, es.hora'
+    return (f"(ARRAY_AGG(es.{columna} ORDER BY {orden}) "
+            f"FILTER (WHERE es.estado_id = {estado} AND es.{columna} IS NOT NULL))[1]")
+
+
+def pivot_query(filtro: str = '') -> str:
+    """
+    Consulta que calcula en PostgreSQL el pivote de estados y las duraciones del hecho acumulado
+    Args:
+        filtro: Condición WHERE adicional sobre los servicios (alias s), por ejemplo para el modo incremental
+    Returns:
+        str: Un registro por servicio, ordenado por servicio_id, con las columnas de prepare_estados
+    """
+    columnas = []
+    for estado, nombre in transform.ESTADOS.items():
+        columnas.append(f"MIN(es.fecha) FILTER (WHERE es.estado_id = {estado}) AS fecha_{nombre}")
+        columnas.append(f"{_primero('hora', estado)} AS hora_{nombre}")
+    columnas.append("MAX(es.fecha) FILTER (WHERE es.estado_id = 3) AS fecha_ultima_novedad")
+    columnas.append(f"{_primero('hora', 3, ultimo=True)} AS hora_ultima_novedad")
+    columnas.append("COUNT(*) FILTER (WHERE es.estado_id = 3) AS cantidad_novedades")
+
+    # Instantes truncados a segundos, como combinar_fecha_hora
+    instantes = {nombre: f"date_trunc('second', p.fecha_{nombre} + p.hora_{nombre})"
+                 for nombre in list(transform.ESTADOS.values()) + ['ultima_novedad']}
+    # Sin novedad la recogida se mide desde la asignación, con novedad desde la última novedad
+    instantes['inicio_recogida'] = (f"CASE WHEN p.fecha_novedad IS NULL THEN {instantes['asignado']} "
+                                    f"ELSE {instantes['ultima_novedad']} END")
+    duraciones = [f"CAST(ABS(EXTRACT(EPOCH FROM {instantes[fin]} - {instantes[inicio]})) AS BIGINT) AS {columna}"
+                  for columna, (inicio, fin) in DURACIONES.items()]
+    # Las horas salen como segundos desde la medianoche, igual que en extract.QUERY_SERVICIOS_ESTADOS
+    salida = ['p.servicio_id', 'p.cliente_id', 'p.mensajero_inicial_id', 'p.cantidad_novedades']
+    for nombre in list(transform.ESTADOS.values()) + ['ultima_novedad']:
+        salida.append(f"p.fecha_{nombre}")
+        salida.append(f"date_part('epoch', p.hora_{nombre}) AS hora_{nombre}")
+
+    separador = ',\n        '
+    return f"""
+    WITH pivote AS (
+        SELECT
+        s.id AS servicio_id,
+        s.cliente_id,
+        s.mensajero_id AS mensajero_inicial_id,
+        {separador.join(columnas)}
+        FROM mensajeria_servicio s
+        JOIN mensajeria_estadosservicio es ON s.id = es.servicio_id
+        {filtro}
+        GROUP BY s.id, s.cliente_id, s.mensajero_id
+    )
+    SELECT {separador.join(salida)},
+        {separador.join(duraciones)}
+    FROM pivote p
+    ORDER BY p.servicio_id
+    """
+
+
+FILTRO_MODIFICADOS = f"""WHERE s.id IN (
+            SELECT servicio_id
+            FROM mensajeria_estadosservicio
+            WHERE {FILTRO_MARCA_ESTADOS}
+        )"""
+
+
+def _leer_pivote(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Deja el resultado de pivot_query con los mismos tipos y columnas que prepare_estados
+    """
+    df = aplicar_tipos(df, TIPOS_PIVOTE)
+    for nombre in list(transform.ESTADOS.values()) + ['ultima_novedad']:
+        df[f'hora_{nombre}'] = transform.normalizar_hora(df[f'hora_{nombre}'])
+    for columna in DURACIONES:
+        df[columna] = pd.to_numeric(df[columna]).astype('Int64')
+    df['hora_del_dia'] = df['hora_iniciado'] // pd.Timedelta(hours=1)
+    return df
+
+
+def extract_hecho_acumulado_sql(source_engine: Engine) -> pd.DataFrame:
+    """
+    Extrae el hecho acumulado ya pivotado en la fuente, un registro por servicio
+    Returns:
+        pd.DataFrame: Mismo resultado que transform.prepare_estados(extract.extract_hecho_acumulado(...))
+    """
+    return _leer_pivote(pd.read_sql(text(pivot_query()), source_engine))
+
+
+def extract_hecho_acumulado_sql_chunks(source_engine: Engine, chunksize: int = 200_000) -> Iterator[pd.DataFrame]:
+    """
+    Extrae el pivote por bloques con un cursor del lado del servidor; cada fila es un servicio
+    completo, así que los bloques no necesitan cortarse en los límites de servicio_id
+    """
+    with source_engine.connect().execution_options(stream_results=True) as conn:
+        for chunk in pd.read_sql(text(pivot_query()), conn, chunksize=chunksize):
+            yield _leer_pivote(chunk)
+
+
+def extract_servicios_modificados_sql(source_engine: Engine, desde: str) -> pd.DataFrame:
+    """
+    Extrae ya pivotados los servicios que tuvieron algún cambio de estado desde la marca de agua
+    Args:
+        source_engine: Conexión a la base de datos fuente
+        desde: Marca de agua 'YYYY-MM-DD HH:MM:SS' de mensajeria_estadosservicio
+    """
+    return _leer_pivote(pd.read_sql(text(pivot_query(FILTRO_MODIFICADOS)), source_engine,
+                                    params=watermark_params(desde)))
+
+
+def transform_hecho_acumulado_sql(df: pd.DataFrame, resolver: KeyResolver) -> pd.DataFrame:
+    """
+    Resuelve las llaves del hecho acumulado pivotado en la fuente
+    """
+    return transform.resolve_hecho_acumulado(df, resolver)
+
+
+def transform_hecho_acumulado_sql_chunks(chunks: Iterable[pd.DataFrame],
+                                         resolver: KeyResolver) -> Iterator[pd.DataFrame]:
+    for chunk in chunks:
+        yield transform_hecho_acumulado_sql(chunk, resolver)
+
+
+def check_parity(hecho_pandas: pd.DataFrame, hecho_sql: pd.DataFrame):
+    """
+    Verifica que los dos motores del pivote producen el mismo hecho acumulado
+    Raises:
+        AssertionError: Con la primera diferencia encontrada
+    """
+    pd.testing.assert_frame_equal(hecho_pandas.reset_index(drop=True), hecho_sql.reset_index(drop=True),
+                                  check_dtype=False, check_index_type=False)
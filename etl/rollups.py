@@ -0,0 +1,101 @@
+import pandas as pd
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from etl.schema import index_name
+
+
+def _columna(expresion: str) -> str:
+    """
+    Nombre de la columna del resumen para una dimensión: 'u.key_dim_sede' -> 'key_dim_sede'
+    """
+    return expresion.split('.')[-1].strip()
+
+
+def _calificar(expresion: str) -> str:
+    """
+    Las dimensiones sin alias se toman del hecho principal (alias h)
+    """
+    return expresion if '.' in expresion else f'h.{expresion}'
+
+
+def rollup_query(nombre: str, definicion: dict, filtrar: bool = False) -> str:
+    """
+    Consulta que calcula un resumen declarado en la sección resumenes de sqllayout.yml
+    El hecho principal lleva el alias h y la tabla de 'unir', si se indica, el alias u
+    Args:
+        nombre: Nombre de la tabla de resumen
+        definicion: hecho, dimensiones, medidas ({columna: expresión SQL}) y opcionalmente
+            fecha (por defecto key_dim_fecha) y unir ({tabla, usando})
+        filtrar: Si es True, la consulta solo agrega las fechas del parámetro :fechas
+    Returns:
+        str: SELECT agrupado por las dimensiones
+    """
+    fecha = definicion.get('fecha', 'key_dim_fecha')
+    dimensiones = definicion['dimensiones']
+    if fecha not in [_columna(d) for d in dimensiones]:
+        raise ValueError(f"El resumen {nombre} debe agrupar por su columna de fecha {fecha}")
+
+    desde = f"{definicion['hecho']} h"
+    if definicion.get('unir'):
+        desde += f" JOIN {definicion['unir']['tabla']} u USING ({definicion['unir']['usando']})"
+    # Las filas sin fecha no se resumen: así el refresco por fechas y el completo dan el mismo resultado
+    condicion = f"h.{fecha} IS NOT NULL"
+    if filtrar:
+        condicion += f" AND h.{fecha} = ANY(CAST(:fechas AS integer[]))"
+
+    seleccion = [f"{_calificar(d)} AS {_columna(d)}" for d in dimensiones]
+    seleccion += [f"{expresion} AS {medida}" for medida, expresion in definicion['medidas'].items()]
+    return (f"SELECT {', '.join(seleccion)} FROM {desde} WHERE {condicion} "
+            f"GROUP BY {', '.join(_calificar(d) for d in dimensiones)}")
+
+
+def touched_dates(definicion: dict, fechas: dict[str, pd.Series]) -> list[int]:
+    """
+    Fechas (key_dim_fecha) cargadas en la ejecución en el hecho del resumen o en la tabla que une
+    """
+    tablas = [definicion['hecho']] + ([definicion['unir']['tabla']] if definicion.get('unir') else [])
+    series = [pd.Series(fechas[t]) for t in tablas if t in fechas]
+    if not series:
+        return []
+    return sorted(pd.concat(series).dropna().astype('int64').unique().tolist())
+
+
+def refresh_rollups(con: Engine, resumenes: dict[str, dict], fechas: dict[str, pd.Series] | None = None) -> int:
+    """
+    Actualiza las tablas de resumen declaradas en sqllayout.yml
+    Sin fechas (carga completa), o si la tabla aún no existe, el resumen se reconstruye
+    completo con CREATE TABLE AS; con fechas solo se borran y vuelven a agregar las fechas
+    que la ejecución cargó, en una transacción por resumen para que las consultas de los
+    tableros no vean un resumen a medias
+    Args:
+        con: Conexión a la base de datos bodega
+        resumenes: {tabla: definicion} de read_layout
+        fechas: {hecho: key_dim_fecha cargadas en la ejecución}; None reconstruye todo
+    Returns:
+        int: Cantidad de filas agregadas a los resúmenes
+    """
+    total = 0
+    for nombre, definicion in resumenes.items():
+        fecha = definicion.get('fecha', 'key_dim_fecha')
+        if fechas is None or not inspect(con).has_table(nombre):
+            with con.begin() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS {nombre}"))
+                conn.execute(text(f"CREATE TABLE {nombre} AS {rollup_query(nombre, definicion)}"))
+                conn.execute(text(f"CREATE INDEX {index_name(nombre, fecha)} ON {nombre} ({fecha})"))
+                filas = conn.execute(text(f"SELECT COUNT(*) FROM {nombre}")).scalar()
+            print(f"{nombre}: reconstruido con {filas} filas")
+        else:
+            valores = touched_dates(definicion, fechas)
+            if not valores:
+                print(f"{nombre}: sin fechas nuevas")
+                continue
+            with con.begin() as conn:
+                conn.execute(text(f"DELETE FROM {nombre} WHERE {fecha} = ANY(CAST(:fechas AS integer[]))"),
+                             {'fechas': valores})
+                filas = conn.execute(text(f"INSERT INTO {nombre} {rollup_query(nombre, definicion, True)}"),
+                                     {'fechas': valores}).rowcount
+            print(f"{nombre}: {len(valores)} fechas actualizadas ({filas} filas)")
+        with con.begin() as conn:
+            conn.execute(text(f"ANALYZE {nombre}"))
+        total += filas
+    return total
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy.engine import Engine
+from etl.keys import LLAVES_DIMENSIONES
+
+# Atributos con historia de cada dimensión: los de tipo 1 se sobrescriben en todas las versiones
+# del miembro y conservan su llave subrogada; un cambio en los de tipo 2 cierra la versión actual
+# y crea una nueva con otra llave
+ATRIBUTOS_SCD = {
+    'dim_cliente': {
+        'tipo1': ['nombre', 'nit_cliente', 'email', 'telefono', 'direccion', 'nombre_contacto'],
+        'tipo2': ['tipo_cliente', 'sector', 'ciudad'],
+    },
+    'dim_mensajero': {
+        'tipo1': ['fecha_entrada'],
+        'tipo2': ['ciudad_operacion', 'activo', 'fecha_salida'],
+    },
+}
+
+def row_hash(df: pd.DataFrame, columnas: list[str]) -> pd.Series:
+    """
+    Hash de 64 bits de los valores de las columnas en cada fila
+    Los valores se comparan como texto para que el hash no dependa del tipo de la columna
+    (category, object, fechas como date o datetime64)
+    Args:
+        df: DataFrame de la dimensión
+        columnas: Atributos que forman el hash
+    Returns:
+        pd.Series: Hash de cada fila (int64, para guardarlo en una columna BIGINT)
+    """
+    if not columnas:
+        return pd.Series(np.zeros(len(df), dtype='int64'), index=df.index)
+    texto = df[columnas[0]].astype('string').fillna('\x00')
+    for columna in columnas[1:]:
+        texto = texto + '\x1f' + df[columna].astype('string').fillna('\x00')
+    return pd.util.hash_pandas_object(texto, index=False).astype('int64')
+
+
+def add_tracking_columns(df: pd.DataFrame, tabla: str) -> pd.DataFrame:
+    """
+    Agrega los hashes de los atributos de tipo 1 y tipo 2 y las columnas de vigencia
+    de la primera versión de cada miembro
+    """
+    atributos = ATRIBUTOS_SCD[tabla]
+    df['hash_tipo1'] = row_hash(df, atributos['tipo1'])
+    df['hash_tipo2'] = row_hash(df, atributos['tipo2'])
+    df['version'] = 1
+    # Vigencia como datetime64: valido_hasta queda NaT en la versión actual
+    df['valido_desde'] = pd.Timestamp.today().normalize()
+    df['valido_hasta'] = pd.NaT
+    df['es_actual'] = True
+    return df
+
+
+def read_current(con: Engine, tabla: str) -> pd.DataFrame:
+    """
+    Lee de la bodega la versión actual de cada miembro: llaves, hashes y número de versión
+    """
+    llave, natural = LLAVES_DIMENSIONES[tabla]
+    return pd.read_sql(
+        f'SELECT {llave}, {natural}, hash_tipo1, hash_tipo2, version FROM {tabla} WHERE es_actual',
+        con
+    )
+
+
+def detect_changes(df: pd.DataFrame, actuales: pd.DataFrame, tabla: str) -> dict[str, pd.DataFrame]:
+    """
+    Compara los miembros de la fuente con la versión actual de la bodega por sus hashes
+    Args:
+        df: Dimensión transformada (con add_tracking_columns)
+        actuales: Resultado de read_current
+        tabla: Nombre de la dimensión
+    Returns:
+        dict:
+            insertar: miembros nuevos y versiones nuevas de los que cambiaron en atributos de tipo 2
+            tipo1: llave natural y atributos de tipo 1 a sobrescribir en todas las versiones
+            expirar: llave subrogada y vigencia de las versiones que dejan de ser actuales
+    """
+    llave, natural = LLAVES_DIMENSIONES[tabla]
+    atributos = ATRIBUTOS_SCD[tabla]
+    actuales = actuales.drop_duplicates(natural, keep='last')
+    cruce = df.merge(actuales, on=natural, how='left', suffixes=('', '_actual'), indicator=True)
+    existe = (cruce['_merge'] == 'both').to_numpy()
+    cambio_tipo2 = existe & (cruce['hash_tipo2'] != cruce['hash_tipo2_actual']).to_numpy()
+    cambio_tipo1 = existe & (cruce['hash_tipo1'] != cruce['hash_tipo1_actual']).to_numpy()
+
+    insertar = df[~existe | cambio_tipo2].copy()
+    insertar.loc[cambio_tipo2[~existe | cambio_tipo2], 'version'] = (
+        cruce.loc[cambio_tipo2, 'version_actual'].astype('int64').to_numpy() + 1
+    )
+
+    tipo1 = df.loc[cambio_tipo1, [natural] + atributos['tipo1'] + ['hash_tipo1']]
+
+    expirar = pd.DataFrame({
+        llave: cruce.loc[cambio_tipo2, llave].astype('int64').to_numpy(),
+        'valido_hasta': pd.Timestamp.today().normalize(),
+        'es_actual': False
+    })
+    return {'insertar': insertar, 'tipo1': tipo1, 'expirar': expirar}
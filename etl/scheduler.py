@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable
+
+# Una etapa es (funcion, dependencias). La función recibe un dict {dependencia: resultado}
+# con los resultados de las etapas de las que depende y retorna su propio resultado
+Etapa = tuple[Callable[[dict[str, Any]], Any], list[str]]
+
+
+def validate_stages(etapas: dict[str, Etapa]) -> list[str]:
+    """
+    Verifica que todas las dependencias existan y que no haya ciclos
+    Args:
+        etapas: {nombre: (funcion, dependencias)}
+    Returns:
+        list: Nombres de las etapas en un orden topológico válido
+    """
+    for nombre, (_, dependencias) in etapas.items():
+        faltantes = [d for d in dependencias if d not in etapas]
+        if faltantes:
+            raise ValueError(f"La etapa {nombre} depende de etapas no registradas: {faltantes}")
+
+    orden = []
+    visitadas = set()
+    en_proceso = set()
+
+    def visitar(nombre):
+        if nombre in visitadas:
+            return
+        if nombre in en_proceso:
+            raise ValueError(f"Dependencia circular en la etapa {nombre}")
+        en_proceso.add(nombre)
+        for dependencia in etapas[nombre][1]:
+            visitar(dependencia)
+        en_proceso.discard(nombre)
+        visitadas.add(nombre)
+        orden.append(nombre)
+
+    for nombre in etapas:
+        visitar(nombre)
+    return orden
+
+
+def run_stages(etapas: dict[str, Etapa], max_workers: int = 4, liberar: bool = False) -> dict[str, Any]:
+    """
+    Ejecuta las etapas respetando sus dependencias; las etapas independientes corren en paralelo
+    Si una etapa falla no se inician etapas nuevas, se espera a las que están en curso
+    y se relanza el primer error
+    Args:
+        etapas: {nombre: (funcion, dependencias)}
+        max_workers: Cantidad máxima de etapas ejecutándose al mismo tiempo
+        liberar: Si es True, el resultado de una etapa se reemplaza por None en cuanto se inician
+            todas las etapas que dependen de ella, para no retener en memoria, por ejemplo,
+            las extracciones ya entregadas a su transformación
+    Returns:
+        dict: {nombre: resultado} de todas las etapas (None en las liberadas)
+    """
+    validate_stages(etapas)
+
+    pendientes = dict(etapas)
+    resultados = {}
+    en_curso = {}
+    error = None
+    # Cantidad de etapas que aún no reciben el resultado de cada etapa
+    por_entregar = {nombre: 0 for nombre in etapas}
+    for _, dependencias in etapas.values():
+        for dependencia in dependencias:
+            por_entregar[dependencia] += 1
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            if error is None:
+                for nombre in list(pendientes):
+                    funcion, dependencias = pendientes[nombre]
+                    if all(d in resultados for d in dependencias):
+                        del pendientes[nombre]
+                        print(f"Iniciando etapa {nombre}...")
+                        futuro = pool.submit(funcion, {d: resultados[d] for d in dependencias})
+                        en_curso[futuro] = nombre
+                        for dependencia in dependencias:
+                            por_entregar[dependencia] -= 1
+                            if liberar and por_entregar[dependencia] == 0:
+                                resultados[dependencia] = None
+
+            if not en_curso:
+                break
+
+            terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                nombre = en_curso.pop(futuro)
+                try:
+                    resultados[nombre] = futuro.result()
+                    print(f"Etapa {nombre} completada")
+                except Exception as e:
+                    print(f"Error en la etapa {nombre}: {e}")
+                    if error is None:
+                        error = e
+
+    if error is not None:
+        raise error
+    return resultados
@@ -0,0 +1,263 @@
+import re
+import yaml
+import pandas as pd
+from sqlalchemy.engine import Engine
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+# Formato del sufijo de cada partición según el periodo de dim_fecha que cubre
+SUFIJOS_PERIODO = {'year': '%Y', 'month': '%Y_%m'}
+
+
+def read_layout(ruta: str = 'sqllayout.yml') -> dict:
+    """
+    Lee el diseño físico declarado de la bodega
+    Args:
+        ruta: Archivo con las secciones indices, particiones y resumenes
+    Returns:
+        dict: {'indices': {tabla: [columnas]}, 'particiones': {tabla: columna}, 'resumenes': {tabla: definicion}}
+    """
+    with open(ruta, 'r', encoding='utf-8') as f:
+        layout = yaml.safe_load(f) or {}
+    return {'indices': layout.get('indices') or {}, 'particiones': layout.get('particiones') or {},
+            'resumenes': layout.get('resumenes') or {}}
+
+
+def index_name(tabla: str, columnas: str) -> str:
+    """
+    Nombre del índice: idx_<tabla>_<columnas>
+    """
+    return f"idx_{tabla}_{'_'.join(c.strip() for c in columnas.split(','))}"
+
+
+def create_indexes(con: Engine, indices: dict[str, list[str]]) -> int:
+    """
+    Crea los índices secundarios que aún no existen y actualiza las estadísticas de cada tabla
+    Se ejecuta después de la carga masiva: construir el índice una vez sobre la tabla llena
+    es más rápido que mantenerlo fila a fila durante COPY
+    En las tablas particionadas el índice se crea en cada partición
+    Args:
+        con: Conexión a la base de datos bodega
+        indices: {tabla: [columnas]} de read_layout
+    Returns:
+        int: Cantidad de índices declarados
+    """
+    total = 0
+    for tabla, lista in indices.items():
+        with con.begin() as conn:
+            for columnas in lista:
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS {index_name(tabla, columnas)} ON {tabla} ({columnas})"
+                ))
+                total += 1
+        # ANALYZE fuera de la transacción de los índices para no retener los bloqueos
+        with con.begin() as conn:
+            conn.execute(text(f"ANALYZE {tabla}"))
+    print(f"{total} índices secundarios verificados en {len(indices)} tablas")
+    return total
+
+
+def partitioned_ddl(script: str, tabla: str, columna: str) -> str:
+    """
+    Convierte el CREATE TABLE de un hecho de sqlscripts.yml en una tabla particionada
+    por rango de la columna, con una partición DEFAULT para las filas sin fecha o fuera
+    de los rangos creados
+    PostgreSQL exige que la llave primaria de una tabla particionada incluya la columna
+    de partición, que en los hechos puede ser nula; por eso la llave subrogada queda
+    como SERIAL sin restricción PRIMARY KEY
+    Args:
+        script: DDL de la tabla
+        tabla: Nombre de la tabla
+        columna: Columna de partición
+    Returns:
+        str: DDL de la tabla particionada y de su partición DEFAULT
+    """
+    script = re.sub(r'\s+PRIMARY KEY', '', script, count=1)
+    script = script.rstrip().rstrip(';') + f" PARTITION BY RANGE ({columna});\n"
+    return script + f"CREATE TABLE {tabla}_default PARTITION OF {tabla} DEFAULT;\n"
+
+
+def is_partitioned(con: Engine, tabla: str) -> bool:
+    with con.connect() as conn:
+        return conn.execute(
+            text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:tabla)"),
+            {'tabla': tabla}
+        ).first() is not None
+
+
+def partition_ranges(con: Engine, periodo: str = 'year') -> pd.DataFrame:
+    """
+    Rangos de key_dim_fecha de cada periodo de dim_fecha
+    Returns:
+        pd.DataFrame: periodo, desde (incluido) y hasta (excluido), en orden de fecha
+    """
+    if periodo not in SUFIJOS_PERIODO:
+        raise ValueError(f"Periodo de partición inválido: {periodo}. Opciones: {list(SUFIJOS_PERIODO)}")
+    return pd.read_sql(text("""
+    SELECT
+        date_trunc(:periodo, fecha) AS periodo,
+        MIN(key_dim_fecha) AS desde,
+        MAX(key_dim_fecha) + 1 AS hasta
+    FROM dim_fecha
+    GROUP BY 1
+    ORDER BY 1
+    """), con, params={'periodo': periodo})
+
+
+def create_partitions(con: Engine, particiones: dict[str, str], periodo: str = 'year') -> int:
+    """
+    Crea en los hechos particionados una partición por periodo de dim_fecha
+    Las llaves de dim_fecha se asignan en orden de fecha, así que cada periodo es un rango
+    continuo de key_dim_fecha; los periodos cuyo rango se cruza con uno anterior (llaves
+    agregadas fuera de orden) no se particionan y sus filas quedan en la partición DEFAULT
+    Args:
+        con: Conexión a la base de datos bodega, con dim_fecha ya cargada
+        particiones: {tabla: columna} de read_layout
+        periodo: 'year' o 'month'
+    Returns:
+        int: Cantidad de particiones creadas o ya existentes
+    """
+    rangos = partition_ranges(con, periodo)
+    # Descartar los periodos que se cruzan con el rango de un periodo anterior
+    continuos = rangos[rangos['desde'] >= rangos['hasta'].cummax().shift(fill_value=0)]
+    if len(continuos) < len(rangos):
+        print(f"{len(rangos) - len(continuos)} periodos de dim_fecha no tienen llaves continuas, "
+              f"sus filas quedan en la partición DEFAULT")
+
+    total = 0
+    for tabla in particiones:
+        if not is_partitioned(con, tabla):
+            print(f"{tabla} no está particionada, se omite")
+            continue
+        for rango in continuos.itertuples():
+            nombre = f"{tabla}_{rango.periodo.strftime(SUFIJOS_PERIODO[periodo])}"
+            try:
+                with con.begin() as conn:
+                    conn.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {nombre} PARTITION OF {tabla} "
+                        f"FOR VALUES FROM ({rango.desde}) TO ({rango.hasta})"
+                    ))
+                total += 1
+            except Exception as e:
+                # Por ejemplo si la partición DEFAULT ya tiene filas en ese rango
+                print(f"No se pudo crear la partición {nombre}: {e}")
+    print(f"{total} particiones en {len(particiones)} hechos")
+    return total
+
+
+def read_foreign_keys(con: Engine, tablas: list[str]) -> pd.DataFrame:
+    """
+    Llaves foráneas declaradas en las tablas, leídas del catálogo de PostgreSQL
+    Returns:
+        pd.DataFrame: tabla, nombre y definicion (FOREIGN KEY (...) REFERENCES ...) de cada restricción
+    """
+    return pd.read_sql(text("""
+    SELECT conrelid::regclass::text AS tabla, conname AS nombre, pg_get_constraintdef(oid) AS definicion
+    FROM pg_constraint
+    WHERE contype = 'f' AND conrelid = ANY(CAST(:tablas AS regclass[]))
+    ORDER BY 1, 2
+    """), con, params={'tablas': list(tablas)})
+
+
+def drop_foreign_keys(con: Engine, tablas: list[str], indices: dict[str, list[str]] | None = None) -> pd.DataFrame:
+    """
+    Elimina las llaves foráneas (y los índices secundarios declarados) de las tablas antes
+    de una carga masiva, para que COPY no verifique cada fila contra las dimensiones
+    Args:
+        con: Conexión a la base de datos bodega
+        tablas: Tablas que se van a cargar
+        indices: {tabla: [columnas]} de read_layout; sus índices se eliminan si existen
+    Returns:
+        pd.DataFrame: Llaves foráneas eliminadas, para restaurarlas con restore_foreign_keys
+    """
+    llaves = read_foreign_keys(con, tablas)
+    with con.begin() as conn:
+        for llave in llaves.itertuples():
+            conn.execute(text(f"ALTER TABLE {llave.tabla} DROP CONSTRAINT {llave.nombre}"))
+        for tabla, lista in (indices or {}).items():
+            if tabla in tablas:
+                for columnas in lista:
+                    conn.execute(text(f"DROP INDEX IF EXISTS {index_name(tabla, columnas)}"))
+    print(f"{len(llaves)} llaves foráneas eliminadas antes de la carga masiva")
+    return llaves
+
+
+def _partes_llave(definicion: str) -> tuple[list[str], str, list[str]]:
+    """
+    Columnas, tabla referenciada y columnas referenciadas de una definición de llave foránea
+    """
+    coincidencia = re.match(r'FOREIGN KEY \((.+?)\) REFERENCES ([\w."]+)\((.+?)\)', definicion)
+    if coincidencia is None:
+        raise ValueError(f"Definición de llave foránea no reconocida: {definicion}")
+    columnas, referencia, referenciadas = coincidencia.groups()
+    return ([c.strip() for c in columnas.split(',')], referencia,
+            [c.strip() for c in referenciadas.split(',')])
+
+
+def find_orphans(con: Engine, tabla: str, definicion: str, ejemplos: int = 10) -> tuple[int, list]:
+    """
+    Filas de la tabla cuya llave foránea no existe en la tabla referenciada
+    Args:
+        con: Conexión a la base de datos bodega
+        tabla: Tabla con la llave foránea
+        definicion: Definición de la llave (pg_get_constraintdef)
+        ejemplos: Cantidad máxima de valores huérfanos a retornar
+    Returns:
+        tuple: Cantidad de filas huérfanas y valores de ejemplo (los más frecuentes)
+    """
+    columnas, referencia, referenciadas = _partes_llave(definicion)
+    cruce = ' AND '.join(f'h.{c} = d.{r}' for c, r in zip(columnas, referenciadas))
+    no_nulas = ' AND '.join(f'h.{c} IS NOT NULL' for c in columnas)
+    seleccion = ', '.join(f'h.{c}' for c in columnas)
+    query = f"""
+    SELECT {seleccion}, COUNT(*) AS filas
+    FROM {tabla} h
+    WHERE {no_nulas}
+      AND NOT EXISTS (SELECT 1 FROM {referencia} d WHERE {cruce})
+    GROUP BY {seleccion}
+    ORDER BY filas DESC
+    """
+    huerfanos = pd.read_sql(text(query), con)
+    valores = huerfanos[columnas].head(ejemplos)
+    valores = valores[columnas[0]].tolist() if len(columnas) == 1 else list(valores.itertuples(index=False, name=None))
+    return int(huerfanos['filas'].sum()), valores
+
+
+def restore_foreign_keys(con: Engine, llaves: pd.DataFrame) -> pd.DataFrame:
+    """
+    Vuelve a crear las llaves foráneas después de la carga masiva y las valida con una sola
+    consulta por restricción en lugar de fila a fila
+    Cada llave se crea NOT VALID y se confirma, así el bloqueo exclusivo dura solo lo que tarda
+    el ALTER; VALIDATE corre después en su propia transacción con un bloqueo que no impide
+    leer ni escribir la tabla. Solo si la validación falla se buscan las filas huérfanas: la
+    llave queda NOT VALID (las filas nuevas sí se verifican) y se reporta. Las tablas
+    particionadas no admiten NOT VALID, así que la llave se crea validada o no se crea
+    Args:
+        con: Conexión a la base de datos bodega
+        llaves: Resultado de drop_foreign_keys
+    Returns:
+        pd.DataFrame: tabla, nombre, definicion, filas y ejemplos de las llaves con huérfanos
+    """
+    reporte = []
+    for llave in llaves.itertuples():
+        particionada = is_partitioned(con, llave.tabla)
+        crear = f"ALTER TABLE {llave.tabla} ADD CONSTRAINT {llave.nombre} {llave.definicion}"
+        try:
+            with con.begin() as conn:
+                # Una ejecución reanudada puede encontrar la llave ya creada por el intento anterior
+                conn.execute(text(f"ALTER TABLE {llave.tabla} DROP CONSTRAINT IF EXISTS {llave.nombre}"))
+                conn.execute(text(crear if particionada else f"{crear} NOT VALID"))
+            if not particionada:
+                with con.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {llave.tabla} VALIDATE CONSTRAINT {llave.nombre}"))
+            continue
+        except IntegrityError:
+            filas, ejemplos = find_orphans(con, llave.tabla, llave.definicion)
+        reporte.append({'tabla': llave.tabla, 'nombre': llave.nombre, 'definicion': llave.definicion,
+                        'filas': filas, 'ejemplos': ejemplos})
+
+    print(f"{len(llaves) - len(reporte)} llaves foráneas restauradas y validadas")
+    for registro in reporte:
+        print(f"  {registro['tabla']}.{registro['nombre']}: {registro['filas']} filas huérfanas "
+              f"({registro['definicion']}); valores más frecuentes: {registro['ejemplos']}")
+    return pd.DataFrame(reporte, columns=['tabla', 'nombre', 'definicion', 'filas', 'ejemplos'])
@@ -0,0 +1,189 @@
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from typing import Callable
+import pandas as pd
+
+# pyarrow se exige solo si la caché está habilitada, así --no-staging funciona sin él
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+# Modos de la caché: usar (leer si existe, si no extraer y guardar), refrescar (extraer y
+# sobrescribir) u omitir (extraer sin leer ni guardar)
+MODOS = ('usar', 'refrescar', 'omitir')
+
+
+def _nombres(codigo) -> set[str]:
+    """
+    Nombres globales y atributos que usa un código, incluidos los de sus comprensiones y funciones internas
+    """
+    nombres = set(codigo.co_names)
+    for constante in codigo.co_consts:
+        if inspect.iscode(constante):
+            nombres |= _nombres(constante)
+    return nombres
+
+
+def _codigo(funcion: Callable, vistas: set | None = None) -> list[str]:
+    """
+    Código de una extracción y valores de lo que usa del paquete: las consultas y mapas de tipos
+    de módulo (QUERY_SERVICIOS_ESTADOS, TIPOS_*, FILTRO_*), también los que se leen como atributo
+    de otro módulo (transform.ESTADOS), y el código de las funciones del paquete que llama
+    (aplicar_tipos, pivot_query, ...), recursivamente
+    Así un cambio en la consulta o en los tipos cambia la llave aunque la función no cambie
+    """
+    vistas = set() if vistas is None else vistas
+    vistas.add(funcion)
+    paquete = funcion.__module__.split('.')[0]
+    espacios = [funcion.__globals__]
+    espacios += [vars(valor) for valor in funcion.__globals__.values()
+                 if inspect.ismodule(valor) and valor.__name__.split('.')[0] == paquete]
+
+    partes = [inspect.getsource(funcion)]
+    for nombre in sorted(_nombres(funcion.__code__)):
+        for espacio in espacios:
+            if nombre not in espacio:
+                continue
+            valor = espacio[nombre]
+            if inspect.isfunction(valor) and valor.__module__.split('.')[0] == paquete:
+                if valor not in vistas:
+                    partes += _codigo(valor, vistas)
+            elif isinstance(valor, (str, int, float, tuple, list, dict)):
+                partes.append(f'{nombre}={valor!r}')
+    return partes
+
+
+class StagingCache:
+    """
+    Caché local de las extracciones de la fuente en archivos Arrow IPC (Feather sin compresión),
+    que se leen con memory map
+    Cada archivo se identifica por la extracción (nombre y código de la función, que incluye
+    el texto de la consulta), sus argumentos y una huella de la fuente (por ejemplo las marcas
+    de agua actuales); si la fuente cambia, la huella cambia y la entrada anterior deja de usarse
+    Las entradas vencen ttl_horas después de escritas y, si la carpeta pasa de max_mb,
+    se eliminan primero las más antiguas
+    """
+
+    def __init__(self, directorio: str = 'staging', huella: str = '', ttl_horas: float = 12,
+                 max_mb: float = 2048, modo: str = 'usar'):
+        if modo not in MODOS:
+            raise ValueError(f"Modo de staging inválido: {modo}. Opciones: {MODOS}")
+        if feather is None and modo != 'omitir':
+            raise ImportError("La caché de staging requiere pyarrow: instálelo o use --no-staging")
+        self.directorio = directorio
+        self.huella = huella
+        self.ttl_segundos = ttl_horas * 3600
+        self.max_bytes = max_mb * 1024 ** 2
+        self.modo = modo
+        self._lock = threading.Lock()
+        if self.modo != 'omitir':
+            os.makedirs(self.directorio, exist_ok=True)
+            self.evict()
+
+    @classmethod
+    def from_config(cls, config: dict, huella: str = '', modo: str | None = None) -> 'StagingCache':
+        """
+        Crea la caché con la sección etl.staging de config.yml
+        Args:
+            config: Configuración cargada de config.yml
+            huella: Huella de la fuente
+            modo: Si se indica, reemplaza el modo de la configuración (por ejemplo desde la línea de comandos)
+        """
+        config_staging = config.get('etl', {}).get('staging', {})
+        if modo is None:
+            modo = 'usar' if config_staging.get('habilitado', False) else 'omitir'
+        return cls(
+            directorio=config_staging.get('directorio', 'staging'),
+            huella=huella,
+            ttl_horas=config_staging.get('ttl_horas', 12),
+            max_mb=config_staging.get('max_mb', 2048),
+            modo=modo
+        )
+
+    def _llave(self, funcion: Callable, args: tuple, kwargs: dict) -> str:
+        """
+        Llave de una extracción: código de la función y de lo que usa para armar la consulta y los
+        tipos (ver _codigo), argumentos y huella
+        Las conexiones (Engine) no forman parte de la llave; la fuente se identifica con la huella
+        """
+        argumentos = [repr(a) for a in args if not hasattr(a, 'connect')]
+        argumentos += [f'{k}={v!r}' for k, v in sorted(kwargs.items())]
+        contenido = json.dumps({
+            'funcion': f'{funcion.__module__}.{funcion.__qualname__}',
+            'codigo': _codigo(funcion),
+            'argumentos': argumentos,
+            'huella': self.huella
+        })
+        return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+    def _ruta(self, funcion: Callable, llave: str) -> str:
+        return os.path.join(self.directorio, f'{funcion.__name__}_{llave[:16]}.arrow')
+
+    def cached(self, funcion: Callable, *args, **kwargs) -> bool:
+        """
+        Indica si read leerá la extracción desde la caché en lugar de ejecutarla
+        """
+        if self.modo != 'usar':
+            return False
+        return self._vigente(self._ruta(funcion, self._llave(funcion, args, kwargs)))
+
+    def read(self, funcion: Callable, *args, **kwargs) -> pd.DataFrame:
+        """
+        Retorna el resultado de una extracción desde la caché o, si no está, ejecutándola
+        Args:
+            funcion: Función de etl.extract que retorna un DataFrame
+            *args, **kwargs: Argumentos de la función (incluida la conexión a la fuente)
+        Returns:
+            pd.DataFrame: Resultado de la extracción, con los mismos tipos
+        """
+        if self.modo == 'omitir':
+            return funcion(*args, **kwargs)
+
+        ruta = self._ruta(funcion, self._llave(funcion, args, kwargs))
+        if self.modo == 'usar' and self._vigente(ruta):
+            return feather.read_table(ruta, memory_map=True).to_pandas()
+
+        df = funcion(*args, **kwargs)
+        self._write(df, ruta)
+        return df
+
+    def _vigente(self, ruta: str) -> bool:
+        return os.path.exists(ruta) and time.time() - os.path.getmtime(ruta) <= self.ttl_segundos
+
+    def _write(self, df: pd.DataFrame, ruta: str):
+        """
+        Escribe el archivo en una ruta temporal y lo renombra, para no dejar archivos a medias
+        """
+        temporal = f'{ruta}.{threading.get_ident()}.tmp'
+        feather.write_feather(df.reset_index(drop=True), temporal, compression='uncompressed')
+        os.replace(temporal, ruta)
+        self.evict()
+
+    def evict(self):
+        """
+        Elimina las entradas vencidas y, si la carpeta supera max_mb, las más antiguas
+        """
+        with self._lock:
+            ahora = time.time()
+            entradas = []
+            for nombre in os.listdir(self.directorio):
+                if not nombre.endswith('.arrow'):
+                    continue
+                ruta = os.path.join(self.directorio, nombre)
+                estado = os.stat(ruta)
+                if ahora - estado.st_mtime > self.ttl_segundos:
+                    os.remove(ruta)
+                else:
+                    entradas.append((estado.st_mtime, estado.st_size, ruta))
+
+            total = sum(tamano for _, tamano, _ in entradas)
+            for _, tamano, ruta in sorted(entradas):
+                if total <= self.max_bytes:
+                    break
+                os.remove(ruta)
+                total -= tamano
@@ -1,28 +1,44 @@
 import datetime
 from datetime import date
+from typing import Iterable, Iterator
 import numpy as np
 import pandas as pd
 from pandas import DataFrame
+from pandas.api.types import is_timedelta64_dtype
+from etl.keys import KeyResolver
+from etl.scd import add_tracking_columns
 
-def transform_dim_fecha() -> pd.DataFrame:
+def transform_dim_fecha(df: pd.DataFrame, existentes=None) -> pd.DataFrame:
     """
-    Genera la dimensión fecha para el período especificado
+    Genera la dimensión fecha para los años completos que cubre la fuente
+    Se generan años completos para que cada año (y cada mes) ocupe un rango continuo
+    de key_dim_fecha, como lo requieren las particiones de los hechos
+    Args:
+        df: Rango de fechas de la fuente (extract.extract_dim_fecha)
+        existentes: Fechas que ya están en la bodega; solo se generan las que faltan
     Returns:
-        pd.DataFrame: Dimensión fecha con todos sus atributos
+        pd.DataFrame: Fechas nuevas de la dimensión, en orden, con todos sus atributos
     """
-    # Generar fechas
-    fechas = pd.date_range(start='2023-01-01', end='2024-12-31', freq='D')
-    dim_fecha = pd.DataFrame({'fecha': fechas})
-    
-    # Convertir a timestamp sin hora (solo fecha)
-    dim_fecha['fecha'] = dim_fecha['fecha'].dt.strftime('%Y-%m-%d')
-    dim_fecha['fecha'] = pd.to_datetime(dim_fecha['fecha'])
-    
-    # Extraer componentes de la fecha
-    dim_fecha['año'] = dim_fecha['fecha'].dt.year
-    dim_fecha['mes'] = dim_fecha['fecha'].dt.month
-    dim_fecha['dia'] = dim_fecha['fecha'].dt.day
-    dim_fecha['dia_semana'] = dim_fecha['fecha'].dt.dayofweek  # 0 = Lunes, 6 = Domingo
+    desde, hasta = df['desde'].min(), df['hasta'].max()
+    existentes = pd.DatetimeIndex(pd.to_datetime(pd.Series(existentes, dtype=object))).normalize()
+    if len(existentes) > 0:
+        # Los años de las fechas existentes también se completan
+        desde = existentes.min() if pd.isna(desde) else min(desde, existentes.min())
+        hasta = existentes.max() if pd.isna(hasta) else max(hasta, existentes.max())
+    
+    fechas = pd.DatetimeIndex([], dtype='datetime64[ns]')
+    if pd.notna(desde):
+        fechas = pd.date_range(start=f'{desde.year}-01-01', end=f'{hasta.year}-12-31', freq='D')
+    fechas = fechas.difference(existentes)
+    
+    # Componentes calculados sobre el índice, sin pasar las fechas por texto
+    dim_fecha = pd.DataFrame({
+        'fecha': fechas,
+        'año': fechas.year,
+        'mes': fechas.month,
+        'dia': fechas.day,
+        'dia_semana': fechas.dayofweek,  # 0 = Lunes, 6 = Domingo
+    })
     
     # Agregar fecha de carga
     dim_fecha['saved'] = date.today()
@@ -78,10 +94,9 @@ def transform_dim_cliente(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         pd.DataFrame: DataFrame transformado
     """
-    # Por ahora solo agregamos la fecha de carga
-    # Aquí podrías agregar más transformaciones si son necesarias en el futuro
     df['saved'] = date.today()
-    return df
+    # Hashes de los atributos con historia y vigencia de la versión (ver etl/scd.py)
+    return add_tracking_columns(df, 'dim_cliente')
 
 
 def transform_dim_mensajero(df: pd.DataFrame) -> pd.DataFrame:
@@ -99,14 +114,15 @@ def transform_dim_mensajero(df: pd.DataFrame) -> pd.DataFrame:
         pd.NaT: None  # Para fechas nulas
     })
     
-    # Asegurarse de que las fechas estén en el formato correcto
-    df['fecha_entrada'] = pd.to_datetime(df['fecha_entrada']).dt.date
-    df['fecha_salida'] = pd.to_datetime(df['fecha_salida']).dt.date
+    # Fechas sin hora, como datetime64 (no objetos date) para que las columnas sigan siendo vectoriales
+    df['fecha_entrada'] = pd.to_datetime(df['fecha_entrada']).dt.normalize()
+    df['fecha_salida'] = pd.to_datetime(df['fecha_salida']).dt.normalize()
     
     # Agregar fecha de carga
     df['saved'] = date.today()
     
-    return df
+    # Hashes de los atributos con historia y vigencia de la versión (ver etl/scd.py)
+    return add_tracking_columns(df, 'dim_mensajero')
 
 def transform_dim_sede(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -170,148 +186,211 @@ def calcular_tiempo_entre_estados(fecha1, hora1, fecha2, hora2):
         return "00:00:00"
 
 
-def transform_hecho_acumulado(df: pd.DataFrame, dim_fecha: pd.DataFrame, 
-                            dim_cliente: pd.DataFrame, dim_mensajero: pd.DataFrame,
-                            dim_hora: pd.DataFrame) -> pd.DataFrame:
+# Hora del día en texto: H:MM:SS o HH:MM:SS con fracción de segundo opcional
+FORMATO_HORA = r'\d{1,2}:[0-5]\d:[0-5]\d(\.\d+)?'
+
+
+def a_timedelta(hora: pd.Series) -> pd.Series:
     """
-    Transforma los datos para crear el hecho acumulado
+    Lleva una serie de horas a timedelta64; las que ya vienen tipadas de la extracción no pasan por texto
+    Las horas fuera del día (24:00:00 o más, negativas) o con minutos o segundos mayores a 59
+    quedan como NaT, igual que en el cálculo fila por fila, donde pd.to_datetime las rechazaba
+    Args:
+        hora: Serie con las horas (timedelta64, time o str 'HH:MM:SS')
+    Returns:
+        pd.Series: Serie timedelta64, NaT si la hora es nula o inválida
     """
-    # Limpiar formato de hora
-    df['hora_estado'] = df['hora_estado'].apply(lambda x: str(x).split('.')[0] if '.' in str(x) else str(x))
-    
-    # Procesar estado 3 (novedades)
-    estado_3 = df[df['estado_id'] == 3].groupby('servicio_id').agg({
-        'fecha_estado': list,
-        'hora_estado': list,
-        'cliente_id': 'first',
-        'mensajero_inicial_id': 'first'
-    }).reset_index()
-    
-    # Crear DataFrame de novedades
-    df_novedades = pd.DataFrame({'servicio_id': df['servicio_id'].unique()})
-    df_novedades['tiene_novedad'] = df_novedades['servicio_id'].isin(estado_3['servicio_id'])
-    df_novedades['cantidad_novedades'] = 0
-    
-    # Actualizar novedades
-    servicios_con_novedades = estado_3.copy()
-    servicios_con_novedades['cantidad_novedades'] = servicios_con_novedades['fecha_estado'].str.len()
-    df_novedades.update(
-        servicios_con_novedades[['servicio_id', 'cantidad_novedades']].set_index('servicio_id')
-    )
-    
-    # Procesar todos los estados
-    df_estados = pd.DataFrame()
-    for estado in [1, 2, 3, 4, 5, 6]:
-        if estado == 3:
-            estado_data = estado_3.copy()
-            estado_data['fecha_primera_novedad'] = estado_data['fecha_estado'].apply(lambda x: x[0] if x else None)
-            estado_data['hora_primera_novedad'] = estado_data['hora_estado'].apply(lambda x: x[0] if x else None)
-            estado_data['fecha_ultima_novedad'] = estado_data['fecha_estado'].apply(lambda x: x[-1] if x else None)
-            estado_data['hora_ultima_novedad'] = estado_data['hora_estado'].apply(lambda x: x[-1] if x else None)
-        else:
-            estado_data = df[df['estado_id'] == estado].groupby('servicio_id').agg({
-                'fecha_estado': 'first',
-                'hora_estado': 'first',
-                'cliente_id': 'first',
-                'mensajero_inicial_id': 'first'
-            }).reset_index()
-        
-        nombre_estado = {1: 'iniciado', 2: 'asignado', 3: 'novedad',
-                        4: 'recogido', 5: 'entregado', 6: 'cerrado'}[estado]
-        
-        if estado == 3:
-            columnas_rename = {
-                'fecha_primera_novedad': f'fecha_{nombre_estado}',
-                'hora_primera_novedad': f'hora_{nombre_estado}',
-                'fecha_ultima_novedad': f'fecha_ultima_{nombre_estado}',
-                'hora_ultima_novedad': f'hora_ultima_{nombre_estado}'
-            }
-        else:
-            columnas_rename = {
-                'fecha_estado': f'fecha_{nombre_estado}',
-                'hora_estado': f'hora_{nombre_estado}'
-            }
-        
-        estado_data = estado_data.rename(columns=columnas_rename)
-        
-        if len(df_estados) == 0:
-            df_estados = estado_data
-            df_estados = df_estados.merge(df_novedades[['servicio_id', 'cantidad_novedades']], 
-                                        on='servicio_id', how='left')
+    if not is_timedelta64_dtype(hora):
+        texto = hora.astype('string')
+        hora = pd.to_timedelta(texto.where(texto.str.fullmatch(FORMATO_HORA).fillna(False)), errors='coerce')
+    return hora.where((hora >= pd.Timedelta(0)) & (hora < pd.Timedelta(days=1)))
+
+
+def normalizar_hora(hora: pd.Series) -> pd.Series:
+    """
+    Normaliza horas a timedelta64 truncado a segundos, sin pasar fila por fila por texto
+    Args:
+        hora: Serie con las horas (timedelta64, time o str 'HH:MM:SS[.ffffff]')
+    Returns:
+        pd.Series: Serie timedelta64 sin fracciones de segundo, NaT si la hora es nula o inválida
+    """
+    return a_timedelta(hora).dt.floor('s')
+
+
+def combinar_fecha_hora(fecha: pd.Series, hora: pd.Series) -> pd.Series:
+    """
+    Combina una columna de fechas y una de horas en una sola columna datetime64
+    Args:
+        fecha: Serie con las fechas (date, str o datetime)
+        hora: Serie con las horas (time, str 'HH:MM:SS' o timedelta)
+    Returns:
+        pd.Series: Serie datetime64 truncada a segundos, NaT si falta alguna parte
+    """
+    fechas = pd.to_datetime(fecha, errors='coerce').dt.normalize()
+    return (fechas + a_timedelta(hora)).dt.floor('s')
+
+
+def calcular_duracion_segundos(inicio: pd.Series, fin: pd.Series) -> pd.Series:
+    """
+    Calcula la duración absoluta en segundos entre dos columnas datetime64
+    Si fin es anterior a inicio se intercambian, igual que calcular_tiempo_entre_estados
+    Args:
+        inicio: Serie datetime64 con el instante inicial
+        fin: Serie datetime64 con el instante final
+    Returns:
+        pd.Series: Segundos enteros (Int64), nulo si falta alguno de los extremos
+    """
+    delta = (fin - inicio).abs()
+    return (delta // pd.Timedelta(seconds=1)).astype('Int64')
+
+
+def calcular_tiempos_estados(df_estados: pd.DataFrame) -> pd.DataFrame:
+    """
+    Calcula de forma vectorizada los tiempos entre estados del hecho acumulado
+    Cada par fecha/hora se combina una sola vez en datetime64 y las cinco
+    duraciones se obtienen con aritmética de columnas
+    Args:
+        df_estados: DataFrame ancho con las columnas fecha_<estado> y hora_<estado>
+    Returns:
+        pd.DataFrame: El mismo DataFrame con tiempo_asignacion, tiempo_total_novedades,
+        tiempo_recogida, tiempo_entrega y tiempo_cierre en segundos (Int64, nulo si falta
+        alguno de los dos estados)
+    """
+    ts = {}
+    for nombre in ['iniciado', 'asignado', 'novedad', 'ultima_novedad',
+                   'recogido', 'entregado', 'cerrado']:
+        fecha = df_estados.get(f'fecha_{nombre}', pd.Series(None, index=df_estados.index, dtype=object))
+        hora = df_estados.get(f'hora_{nombre}', pd.Series(None, index=df_estados.index, dtype=object))
+        ts[nombre] = combinar_fecha_hora(fecha, hora)
+
+    # Sin novedad la recogida se mide desde la asignación, con novedad desde la última novedad
+    sin_novedad = pd.to_datetime(
+        df_estados.get('fecha_novedad', pd.Series(None, index=df_estados.index, dtype=object)),
+        errors='coerce'
+    ).isna()
+    inicio_recogida = ts['asignado'].where(sin_novedad, ts['ultima_novedad'])
+
+    duraciones = {
+        'tiempo_asignacion': (ts['iniciado'], ts['asignado']),
+        'tiempo_total_novedades': (ts['novedad'], ts['ultima_novedad']),
+        'tiempo_recogida': (inicio_recogida, ts['recogido']),
+        'tiempo_entrega': (ts['recogido'], ts['entregado']),
+        'tiempo_cierre': (ts['entregado'], ts['cerrado']),
+    }
+    for columna, (inicio, fin) in duraciones.items():
+        df_estados[columna] = calcular_duracion_segundos(inicio, fin)
+
+    return df_estados
+
+
+ESTADOS = {1: 'iniciado', 2: 'asignado', 3: 'novedad',
+           4: 'recogido', 5: 'entregado', 6: 'cerrado'}
+
+
+def pivotar_estados(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Construye el DataFrame ancho del hecho acumulado con un solo ordenamiento y un solo pivot
+    Para cada servicio y estado toma el primer registro; para las novedades (estado 3)
+    toma además el último registro y la cantidad de registros
+    Args:
+        df: DataFrame con un registro por servicio y estado, en orden cronológico por servicio
+    Returns:
+        pd.DataFrame: Un registro por servicio con las columnas fecha_<estado>, hora_<estado>,
+        fecha_ultima_novedad, hora_ultima_novedad y cantidad_novedades
+    """
+    # Orden estable: conserva el orden cronológico de la consulta dentro de cada servicio
+    df = df.sort_values('servicio_id', kind='mergesort')
+    
+    servicios = df.groupby('servicio_id', sort=False)[['cliente_id', 'mensajero_inicial_id']].first()
+    
+    agregados = df[df['estado_id'].isin(list(ESTADOS))].groupby(
+        ['servicio_id', 'estado_id'], sort=False
+    ).agg(
+        fecha=('fecha_estado', 'first'),
+        hora=('hora_estado', 'first'),
+        fecha_ultima=('fecha_estado', 'last'),
+        hora_ultima=('hora_estado', 'last'),
+        cantidad=('estado_id', 'size')
+    ).unstack('estado_id')
+    
+    # Los estados que no aparecen quedan como columnas nulas del mismo tipo que fecha_estado/hora_estado
+    tipos = {'fecha': df['fecha_estado'].dtype, 'hora': df['hora_estado'].dtype}
+    
+    df_estados = servicios
+    for estado, nombre_estado in ESTADOS.items():
+        for campo in ['fecha', 'hora']:
+            if (campo, estado) in agregados.columns:
+                df_estados[f'{campo}_{nombre_estado}'] = agregados[(campo, estado)]
+            else:
+                df_estados[f'{campo}_{nombre_estado}'] = pd.Series(None, index=df_estados.index, dtype=tipos[campo])
+    
+    for campo in ['fecha', 'hora']:
+        if ('fecha', 3) in agregados.columns:
+            df_estados[f'{campo}_ultima_novedad'] = agregados[(f'{campo}_ultima', 3)]
         else:
-            df_estados = df_estados.merge(estado_data, 
-                                        on=['servicio_id', 'cliente_id', 'mensajero_inicial_id'],
-                                        how='outer')
+            df_estados[f'{campo}_ultima_novedad'] = pd.Series(None, index=df_estados.index, dtype=tipos[campo])
+    
+    if ('cantidad', 3) in agregados.columns:
+        df_estados['cantidad_novedades'] = agregados[('cantidad', 3)].fillna(0).astype(int)
+    else:
+        df_estados['cantidad_novedades'] = 0
+    
+    return df_estados.sort_index().reset_index()
+
+
+def transform_hecho_acumulado(df: pd.DataFrame, resolver: KeyResolver) -> pd.DataFrame:
+    """
+    Transforma los datos para crear el hecho acumulado
+    Args:
+        df: DataFrame con los estados de los servicios
+        resolver: Llaves subrogadas de dim_fecha, dim_cliente, dim_mensajero y dim_hora
+    Returns:
+        pd.DataFrame: Hecho acumulado, un registro por servicio
+    """
+    return resolve_hecho_acumulado(prepare_estados(df), resolver)
+
+
+def prepare_estados(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parte del hecho acumulado que no depende de las dimensiones: pivote de estados, duraciones
+    y llaves naturales de fecha y hora. Cada servicio se calcula solo con sus propios estados,
+    así que puede ejecutarse por separado sobre grupos de servicios (ver etl/parallel.py)
+    Args:
+        df: DataFrame con los estados de los servicios
+    Returns:
+        pd.DataFrame: Un registro por servicio, ordenado por servicio_id
+    """
+    # Tipar fechas y horas (sin fracciones de segundo); con los tipos de la extracción no hay conversión
+    df['fecha_estado'] = pd.to_datetime(df['fecha_estado'], errors='coerce')
+    df['hora_estado'] = normalizar_hora(df['hora_estado'])
+    
+    # Pivotar todos los estados en una sola pasada
+    df_estados = pivotar_estados(df)
     
     # Calcular tiempos entre estados
-    df_estados['tiempo_asignacion'] = df_estados.apply(
-        lambda row: calcular_tiempo_entre_estados(
-            row['fecha_iniciado'], row['hora_iniciado'],
-            row['fecha_asignado'], row['hora_asignado']
-        ), axis=1
-    )
-    
-    df_estados['tiempo_total_novedades'] = df_estados.apply(
-        lambda row: calcular_tiempo_entre_estados(
-            row['fecha_novedad'], row['hora_novedad'],
-            row['fecha_ultima_novedad'], row['hora_ultima_novedad']
-        ) if pd.notna(row['fecha_novedad']) else "00:00:00",
-        axis=1
-    )
-    
-    df_estados['tiempo_recogida'] = df_estados.apply(
-        lambda row: calcular_tiempo_entre_estados(
-            row['fecha_asignado'], row['hora_asignado'],
-            row['fecha_recogido'], row['hora_recogido']
-        ) if pd.isna(row.get('fecha_novedad')) else
-        calcular_tiempo_entre_estados(
-            row['fecha_ultima_novedad'], row['hora_ultima_novedad'],
-            row['fecha_recogido'], row['hora_recogido']
-        ), axis=1
-    )
-    
-    df_estados['tiempo_entrega'] = df_estados.apply(
-        lambda row: calcular_tiempo_entre_estados(
-            row['fecha_recogido'], row['hora_recogido'],
-            row['fecha_entregado'], row['hora_entregado']
-        ), axis=1
-    )
-    
-    df_estados['tiempo_cierre'] = df_estados.apply(
-        lambda row: calcular_tiempo_entre_estados(
-            row['fecha_entregado'], row['hora_entregado'],
-            row['fecha_cerrado'], row['hora_cerrado']
-        ), axis=1
-    )
-    
-    # Preparar para merge con dimensiones
-    df_estados['fecha_iniciado'] = pd.to_datetime(df_estados['fecha_iniciado']).dt.date
-    dim_fecha['fecha'] = pd.to_datetime(dim_fecha['fecha']).dt.date
-    df_estados['hora_del_dia'] = df_estados['hora_iniciado'].apply(
-        lambda x: int(x.split(':')[0]) if pd.notna(x) else None
-    )
-    
-    # Realizar merges con dimensiones
-    hecho_acumulado = df_estados.merge(
-        dim_fecha[['key_dim_fecha', 'fecha']], 
-        left_on='fecha_iniciado', 
-        right_on='fecha',
-        how='left'
-    ).merge(
-        dim_cliente[['key_dim_cliente', 'cliente_id']], 
-        on='cliente_id',
-        how='left'
-    ).merge(
-        dim_mensajero[['key_dim_mensajero', 'mensajero_id']], 
-        left_on='mensajero_inicial_id',
-        right_on='mensajero_id',
-        how='left'
-    ).merge(
-        dim_hora[['key_dim_hora', 'hora']], 
-        left_on='hora_del_dia',
-        right_on='hora',
-        how='left'
-    )
+    df_estados = calcular_tiempos_estados(df_estados)
+    
+    # Preparar llaves naturales
+    df_estados['fecha_iniciado'] = pd.to_datetime(df_estados['fecha_iniciado']).dt.normalize()
+    df_estados['hora_del_dia'] = a_timedelta(df_estados['hora_iniciado']) // pd.Timedelta(hours=1)
+    return df_estados
+
+
+def resolve_hecho_acumulado(df_estados: pd.DataFrame, resolver: KeyResolver) -> pd.DataFrame:
+    """
+    Resuelve las llaves subrogadas y deja las columnas finales del hecho acumulado
+    Args:
+        df_estados: Resultado de prepare_estados
+        resolver: Llaves subrogadas de dim_fecha, dim_cliente, dim_mensajero y dim_hora
+    Returns:
+        pd.DataFrame: Hecho acumulado, un registro por servicio
+    """
+    # Resolver llaves subrogadas de las dimensiones
+    hecho_acumulado = df_estados
+    hecho_acumulado['key_dim_fecha'] = resolver.resolve('dim_fecha', df_estados['fecha_iniciado'])
+    hecho_acumulado['key_dim_cliente'] = resolver.resolve('dim_cliente', df_estados['cliente_id'])
+    hecho_acumulado['key_dim_mensajero'] = resolver.resolve('dim_mensajero', df_estados['mensajero_inicial_id'])
+    hecho_acumulado['key_dim_hora'] = resolver.resolve('dim_hora', df_estados['hora_del_dia'])
 
     # Seleccionar y ordenar columnas finales
     columnas_finales = [
@@ -355,6 +434,83 @@ def transform_hecho_acumulado(df: pd.DataFrame, dim_fecha: pd.DataFrame,
     return hecho_acumulado[columnas_finales]
 
 
+def transform_hecho_acumulado_chunks(chunks: Iterable[pd.DataFrame],
+                                    resolver: KeyResolver) -> Iterator[pd.DataFrame]:
+    """
+    Aplica transform_hecho_acumulado a cada bloque de servicios de forma perezosa
+    Los bloques deben venir cortados por servicio_id (ver extract.extract_servicios_estados_chunks)
+    Args:
+        chunks: Bloques con los estados de los servicios
+        resolver: Llaves subrogadas de las dimensiones
+    Yields:
+        pd.DataFrame: Hecho acumulado de cada bloque
+    """
+    for chunk in chunks:
+        yield transform_hecho_acumulado(chunk, resolver)
+
+
+def _llaves_completas(df: pd.DataFrame, columnas: list[str]) -> pd.DataFrame:
+    """
+    Descarta las filas con alguna llave nula (igual que el groupby posterior) y deja las llaves como int64
+    """
+    df = df.dropna(subset=columnas)
+    return df.astype({col: 'int64' for col in columnas})
+
+
+def derive_hecho_servicio_hora(hecho_acumulado: pd.DataFrame, resolver: KeyResolver) -> pd.DataFrame:
+    """
+    Construye en memoria, a partir del hecho acumulado, el mismo DataFrame que
+    extract.extract_hecho_servicio_hora lee de la bodega
+    Args:
+        hecho_acumulado: Hecho acumulado transformado (al menos servicio_id, key_dim_* y hora_iniciado)
+        resolver: Llaves subrogadas de dim_cliente y dim_sede
+    Returns:
+        pd.DataFrame: DataFrame con los datos de servicios por hora
+    """
+    df = hecho_acumulado[hecho_acumulado['hora_iniciado'].notna()]
+    
+    # Mismo cruce que la consulta: dim_cliente.cliente_id = dim_sede.sede_id
+    cliente_id = resolver.natural('dim_cliente', df['key_dim_cliente'])
+    df_hora = pd.DataFrame({
+        'servicio_id': df['servicio_id'],
+        'key_dim_fecha': df['key_dim_fecha'],
+        'key_dim_cliente': df['key_dim_cliente'],
+        'key_dim_mensajero': df['key_dim_mensajero'],
+        'key_dim_hora': df['key_dim_hora'],
+        'key_dim_sede': resolver.resolve('dim_sede', cliente_id),
+        'hora_servicio': a_timedelta(df['hora_iniciado']) // pd.Timedelta(hours=1)
+    })
+    return _llaves_completas(df_hora, ['key_dim_fecha', 'key_dim_cliente', 'key_dim_sede',
+                                       'key_dim_mensajero', 'key_dim_hora'])
+
+
+def derive_hecho_servicio_diaria(hecho_acumulado: pd.DataFrame, resolver: KeyResolver) -> pd.DataFrame:
+    """
+    Construye en memoria, a partir del hecho acumulado, el mismo DataFrame que
+    extract.extract_hecho_servicio_diaria lee de la bodega
+    Args:
+        hecho_acumulado: Hecho acumulado transformado (al menos servicio_id, key_dim_* y fecha_iniciado)
+        resolver: Llaves subrogadas de dim_cliente, dim_sede y dim_fecha
+    Returns:
+        pd.DataFrame: DataFrame con los datos de servicios por día
+    """
+    df = hecho_acumulado[hecho_acumulado['fecha_iniciado'].notna()]
+    
+    # Mismo cruce que la consulta: dim_cliente.cliente_id = dim_sede.sede_id
+    cliente_id = resolver.natural('dim_cliente', df['key_dim_cliente'])
+    fecha = resolver.natural('dim_fecha', df['key_dim_fecha'])
+    df_dia = pd.DataFrame({
+        'servicio_id': df['servicio_id'],
+        'key_dim_fecha': df['key_dim_fecha'],
+        'key_dim_cliente': df['key_dim_cliente'],
+        'key_dim_mensajero': df['key_dim_mensajero'],
+        'key_dim_sede': resolver.resolve('dim_sede', cliente_id),
+        'dia_semana': pd.to_datetime(fecha).dt.dayofweek
+    })
+    return _llaves_completas(df_dia, ['key_dim_fecha', 'key_dim_cliente', 'key_dim_sede',
+                                      'key_dim_mensajero'])
+
+
 def transform_hecho_servicio_hora(df: pd.DataFrame) -> pd.DataFrame:
     """
     Transforma los datos para el hecho de servicios por hora
@@ -419,50 +575,28 @@ def transform_hecho_servicio_diaria(df: pd.DataFrame) -> pd.DataFrame:
     return hecho_dia
 
 
-def transform_hecho_novedades(df: pd.DataFrame, dim_fecha: pd.DataFrame, 
-                            dim_cliente: pd.DataFrame, dim_novedad: pd.DataFrame) -> pd.DataFrame:
+def transform_hecho_novedades(df: pd.DataFrame, resolver: KeyResolver) -> pd.DataFrame:
     """
     Transforma los datos para el hecho de novedades
     Args:
         df: DataFrame con los datos de novedades
-        dim_fecha: Dimensión fecha
-        dim_cliente: Dimensión cliente
-        dim_novedad: Dimensión novedad
+        resolver: Llaves subrogadas de dim_fecha, dim_cliente y dim_novedad
     Returns:
         pd.DataFrame: DataFrame transformado con las novedades
     """
     # Convertir fecha_novedad a datetime y extraer componentes
-    df['fecha_hora_novedad'] = pd.to_datetime(df['fecha_hora_novedad']).dt.date
-    dim_fecha['fecha'] = pd.to_datetime(dim_fecha['fecha']).dt.date
-    
-    # Realizar los merges con las dimensiones
-    hecho_novedades = df.merge(
-        dim_fecha[['key_dim_fecha', 'fecha']], 
-        left_on='fecha_hora_novedad', 
-        right_on='fecha',
-        how='left'
-    ).merge(
-        dim_cliente[['key_dim_cliente', 'cliente_id']], 
-        on='cliente_id',
-        how='left'
-    ).merge(
-        dim_novedad[['key_dim_novedad', 'novedad_id']], 
-        on='novedad_id',
-        how='left'
-    )
-    
-    # Seleccionar columnas finales
-    columnas_finales = [
-        'key_dim_fecha',
-        'key_dim_cliente',
-        'key_dim_novedad',
-        'fecha_hora_novedad',
-        'descripcion'
-    ]
-    
-    hecho_novedades = hecho_novedades[columnas_finales]
+    df['fecha_hora_novedad'] = pd.to_datetime(df['fecha_hora_novedad']).dt.normalize()
+    
+    # Resolver llaves subrogadas de las dimensiones
+    hecho_novedades = pd.DataFrame({
+        'key_dim_fecha': resolver.resolve('dim_fecha', df['fecha_hora_novedad']),
+        'key_dim_cliente': resolver.resolve('dim_cliente', df['cliente_id']),
+        'key_dim_novedad': resolver.resolve('dim_novedad', df['novedad_id']),
+        'fecha_hora_novedad': df['fecha_hora_novedad'],
+        'descripcion': df['descripcion']
+    })
     
     # Agregar fecha de carga
     hecho_novedades['saved'] = date.today()
     
-    return hecho_novedades
\ No newline at end of file
+    return hecho_novedades
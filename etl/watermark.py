@@ -0,0 +1,31 @@
+import pandas as pd
+from sqlalchemy.engine import Engine
+from sqlalchemy import text
+
+def read_watermarks(con: Engine) -> dict[str, str]:
+    """
+    Lee las marcas de agua guardadas en la bodega por la última ejecución exitosa
+    Args:
+        con: Conexión a la base de datos bodega
+    Returns:
+        dict: {tabla_fuente: valor}, vacío si no hay marcas guardadas
+    """
+    df = pd.read_sql('SELECT tabla, valor FROM etl_watermark', con)
+    return dict(zip(df['tabla'], df['valor']))
+
+
+def save_watermarks(con: Engine, watermarks: dict[str, str]):
+    """
+    Guarda (o actualiza) las marcas de agua en la bodega
+    Args:
+        con: Conexión a la base de datos bodega
+        watermarks: {tabla_fuente: valor}
+    """
+    query = text("""
+    INSERT INTO etl_watermark (tabla, valor, saved)
+    VALUES (:tabla, :valor, NOW())
+    ON CONFLICT (tabla) DO UPDATE SET valor = EXCLUDED.valor, saved = EXCLUDED.saved
+    """)
+    with con.begin() as conn:
+        for tabla, valor in watermarks.items():
+            conn.execute(query, {'tabla': tabla, 'valor': valor})
@@ -1,39 +1,40 @@
 import pandas as pd
-from sqlalchemy.engine import Engine, create_engine
-from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy import inspect, Integer
 import yaml
-from etl import extract, transform, load
-import psycopg2
-import time
+from etl import (extract, transform, load, keys, scheduler, watermark, metrics, staging, schema, scd, parallel,
+                 rollups, pushdown, connections, checkpoint)
+import json
+import argparse
+
+# Dimensiones que vienen de la fuente: (extract, transform, llave natural)
+DIMENSIONES_FUENTE = {
+    'dim_cliente': (extract.extract_dim_cliente, transform.transform_dim_cliente, 'cliente_id'),
+    'dim_mensajero': (extract.extract_dim_mensajero, transform.transform_dim_mensajero, 'mensajero_id'),
+    'dim_sede': (extract.extract_dim_sede, transform.transform_dim_sede, 'sede_id'),
+    'dim_novedad': (extract.extract_dim_novedad, transform.transform_dim_novedad, 'novedad_id'),
+    'dim_estado': (extract.extract_dim_estado, transform.transform_dim_estado, 'estado_id'),
+}
+
+TABLAS_BODEGA = ['dim_fecha', 'dim_hora', 'dim_cliente', 'dim_mensajero', 'dim_sede',
+                 'dim_novedad', 'dim_estado', 'hecho_entrega_acumulado',
+                 'hecho_entrega_servicio_hora', 'hecho_entrega_servicio_diaria',
+                 'hecho_novedades_servicio', 'etl_watermark']
 
 def create_connections(config):
     """
-    Crea las conexiones a las bases de datos fuente y destino
+    Crea los pools de conexiones a las bases de datos fuente y destino (sección etl.conexiones)
+    Returns:
+        connections.ConnectionManager: Motores source y target compartidos por todas las etapas
     """
-    source_engine = create_engine(
-        f"postgresql://{config['fuente']['user']}:{config['fuente']['password']}@"
-        f"{config['fuente']['host']}:{config['fuente']['port']}/{config['fuente']['dbname']}"
-    )
-    
-    target_engine = create_engine(
-        f"postgresql://{config['bodega']['user']}:{config['bodega']['password']}@"
-        f"{config['bodega']['host']}:{config['bodega']['port']}/{config['bodega']['dbname']}"
-    )
-    
-    return source_engine, target_engine
+    return connections.ConnectionManager(config)
 
-def drop_all_tables(config):
+def drop_all_tables(target_engine):
     """
     Elimina todas las tablas existentes para empezar desde cero
     """
     print("Eliminando todas las tablas existentes...")
-    conn = psycopg2.connect(
-        dbname=config['bodega']['dbname'],
-        user=config['bodega']['user'],
-        password=config['bodega']['password'],
-        host=config['bodega']['host'],
-        port=config['bodega']['port']
-    )
+    conn = target_engine.raw_connection()
     
     # Primero eliminar los hechos (que tienen foreign keys)
     drop_facts = """
@@ -52,6 +53,7 @@ def drop_all_tables(config):
     DROP TABLE IF EXISTS dim_sede CASCADE;
     DROP TABLE IF EXISTS dim_novedad CASCADE;
     DROP TABLE IF EXISTS dim_estado CASCADE;
+    DROP TABLE IF EXISTS etl_watermark CASCADE;
     """
     
     try:
@@ -66,22 +68,22 @@ def drop_all_tables(config):
     finally:
         conn.close()
 
-def create_tables(config):
+def create_tables(target_engine, config):
     """
     Crea las tablas en la base de datos bodega usando sqlscripts.yml
+    Si etl.particiones está habilitado, los hechos declarados en sqllayout.yml
+    se crean particionados por rango
     """
     print("Creando tablas en la base de datos...")
-    conn = psycopg2.connect(
-        dbname=config['bodega']['dbname'],
-        user=config['bodega']['user'],
-        password=config['bodega']['password'],
-        host=config['bodega']['host'],
-        port=config['bodega']['port']
-    )
+    conn = target_engine.raw_connection()
 
     with open('sqlscripts.yml', 'r', encoding='utf-8') as f:
         scripts = yaml.safe_load(f)
 
+    if config.get('etl', {}).get('particiones', {}).get('habilitado', False):
+        for tabla, columna in schema.read_layout()['particiones'].items():
+            scripts[tabla] = schema.partitioned_ddl(scripts[tabla], tabla, columna)
+
     try:
         with conn.cursor() as cur:
             for table_name, script in scripts.items():
@@ -108,156 +110,652 @@ def verify_tables_exist(engine, required_tables):
         return False
     return True
 
-def process_dimensions(source_engine, target_engine):
+def verify_duration_columns(engine):
+    """
+    Verifica que las duraciones del hecho acumulado estén en segundos (INTEGER)
+    Las bodegas creadas con las duraciones como texto 'HH:MM:SS' requieren una carga completa
+    """
+    columnas = {col['name']: col['type'] for col in inspect(engine).get_columns('hecho_entrega_acumulado')}
+    if not isinstance(columnas.get('tiempo_asignacion'), Integer):
+        print("Las duraciones de hecho_entrega_acumulado están como texto, se requiere una carga completa")
+        return False
+    return True
+
+def verify_scd_columns(engine):
+    """
+    Verifica que las dimensiones con historia tengan las columnas de hash y vigencia
+    Las bodegas creadas antes de llevar historia requieren una carga completa
+    """
+    for tabla in scd.ATRIBUTOS_SCD:
+        columnas = {col['name'] for col in inspect(engine).get_columns(tabla)}
+        if 'hash_tipo2' not in columnas:
+            print(f"{tabla} no tiene las columnas de historia, se requiere una carga completa")
+            return False
+    return True
+
+def process_dim_fecha(source_engine, target_engine, resolver, metricas, resultados):
     """
-    Procesa las dimensiones del proceso ETL
-    Proceso de Carga (Load)
+    Genera y carga la dimensión fecha para el rango de fechas de la fuente
     """
-    print("\nProcesando dimensiones...")
+    dim_fecha = metricas.measure('dim_fecha', 'transform', transform.transform_dim_fecha,
+                                 resultados['extract_dim_fecha'])
+    llaves = metricas.measure('dim_fecha', 'load', load.load_returning_keys,
+                              dim_fecha, target_engine, 'dim_fecha', 'key_dim_fecha', True)
+    resolver.register('dim_fecha', dim_fecha['fecha'], llaves)
+
+def process_dim_fecha_incremental(source_engine, target_engine, resolver, metricas, resultados):
+    """
+    Agrega a la dimensión fecha solo las fechas que faltan para cubrir la fuente
+    Las fechas existentes conservan su llave y la dimensión no se recarga
+    """
+    existentes = metricas.measure('dim_fecha', 'extract_bodega', pd.read_sql,
+                                  'SELECT key_dim_fecha, fecha FROM dim_fecha', target_engine)
+    resolver.register_frame('dim_fecha', existentes)
+    nuevas = metricas.measure('dim_fecha', 'transform', transform.transform_dim_fecha,
+                              resultados['extract_dim_fecha'], existentes['fecha'])
+    if len(nuevas) > 0:
+        llaves = metricas.measure('dim_fecha', 'load', load.load_returning_keys,
+                                  nuevas, target_engine, 'dim_fecha', 'key_dim_fecha')
+        resolver.register('dim_fecha', nuevas['fecha'], llaves)
+    print(f"dim_fecha: {len(nuevas)} fechas nuevas")
+
+def process_dim_hora(source_engine, target_engine, resolver, metricas, resultados):
+    """
+    Genera y carga la dimensión hora
+    """
+    dim_hora = metricas.measure('dim_hora', 'transform', transform.transform_dim_hora)
+    llaves = metricas.measure('dim_hora', 'load', load.load_returning_keys,
+                              dim_hora, target_engine, 'dim_hora', 'key_dim_hora', True)
+    resolver.register('dim_hora', dim_hora['hora'], llaves)
+
+def process_extract(tabla, extraer, source_engine, target_engine, resolver, metricas, resultados, staging,
+                    args=()):
+    """
+    Extrae de la fuente, pasando por staging, los datos de una tabla
+    Corre como una etapa sin dependencias para que las consultas a la fuente se ejecuten
+    en paralelo y se superpongan con la transformación y carga de otras etapas
+    Returns:
+        pd.DataFrame: Resultado de la extracción, que recibe la etapa de la tabla
+    """
+    # Las lecturas de la caché se registran en el reporte con el paso 'staging'
+    paso = 'staging' if staging.cached(extraer, source_engine, *args) else 'extract'
+    return metricas.measure(tabla, paso, staging.read, extraer, source_engine, *args)
+
+def process_dim_fuente(tabla, source_engine, target_engine, resolver, metricas, resultados):
+    """
+    Transforma y carga una de las dimensiones que vienen de la fuente
+    """
+    _, transformar, llave = DIMENSIONES_FUENTE[tabla]
+    df = resultados[f'extract_{tabla}']
+    df = metricas.measure(tabla, 'transform', transformar, df)
+    llaves = metricas.measure(tabla, 'load', load.load_returning_keys,
+                              df, target_engine, tabla, keys.LLAVES_DIMENSIONES[tabla][0], True)
+    resolver.register(tabla, df[llave], llaves)
+
+def process_dim_fuente_incremental(tabla, source_engine, target_engine, resolver, metricas, resultados):
+    """
+    Carga una dimensión de la fuente con merge por su llave natural: los miembros nuevos se insertan
+    y los que cambiaron se actualizan en su lugar, conservando su llave subrogada
+    """
+    _, transformar, _ = DIMENSIONES_FUENTE[tabla]
+    df = resultados[f'extract_{tabla}']
+    df = metricas.measure(tabla, 'transform', transformar, df)
+    metricas.measure(tabla, 'load', load.load, df, target_engine, tabla, merge=True)
+    metricas.measure(tabla, 'extract_bodega', resolver.load_from_db, target_engine, tabla)
+
+def process_dim_scd_incremental(tabla, source_engine, target_engine, resolver, metricas, resultados):
+    """
+    Actualiza una dimensión con historia comparando los hashes de sus atributos con la versión actual:
+    los cambios de tipo 1 se sobrescriben en su lugar (la llave subrogada no cambia y los hechos
+    no se reprocesan), los de tipo 2 cierran la versión actual y agregan una nueva
+    """
+    _, transformar, llave = DIMENSIONES_FUENTE[tabla]
+    llave_subrogada = keys.LLAVES_DIMENSIONES[tabla][0]
+    df = resultados[f'extract_{tabla}']
+    df = metricas.measure(tabla, 'transform', transformar, df)
+    actuales = metricas.measure(tabla, 'extract_bodega', scd.read_current, target_engine, tabla)
+    resolver.register_frame(tabla, actuales)
+    cambios = metricas.measure(tabla, 'detect_changes', scd.detect_changes, df, actuales, tabla)
     
-    try:
-        # Procesar dimensión fecha
-        print("Procesando dimensión fecha...")
-        dim_fecha = transform.transform_dim_fecha()
-        load.load(dim_fecha, target_engine, 'dim_fecha', True)
-        print("dim_fecha procesada exitosamente")
-        time.sleep(2)
-
-        # Procesar dimensión hora
-        print("Procesando dimensión hora...")
-        dim_hora = transform.transform_dim_hora()
-        load.load(dim_hora, target_engine, 'dim_hora', True)
-        print("dim_hora procesada exitosamente")
-        time.sleep(2)
-
-        # Procesar dimensión cliente
-        print("Procesando dimensión cliente...")
-        dim_cliente = extract.extract_dim_cliente(source_engine)
-        dim_cliente = transform.transform_dim_cliente(dim_cliente)
-        load.load(dim_cliente, target_engine, 'dim_cliente', True)
-        print("dim_cliente procesada exitosamente")
-        time.sleep(2)
-
-        # Procesar dimensión mensajero
-        print("Procesando dimensión mensajero...")
-        dim_mensajero = extract.extract_dim_mensajero(source_engine)
-        dim_mensajero = transform.transform_dim_mensajero(dim_mensajero)
-        load.load(dim_mensajero, target_engine, 'dim_mensajero', True)
-        print("dim_mensajero procesada exitosamente")
-        time.sleep(2)
-
-        # Procesar dimensión sede
-        print("Procesando dimensión sede...")
-        dim_sede = extract.extract_dim_sede(source_engine)
-        dim_sede = transform.transform_dim_sede(dim_sede)
-        load.load(dim_sede, target_engine, 'dim_sede', True)
-        print("dim_sede procesada exitosamente")
-        time.sleep(2)
-
-        # Procesar dimensión novedad
-        print("Procesando dimensión novedad...")
-        dim_novedad = extract.extract_dim_novedad(source_engine)
-        dim_novedad = transform.transform_dim_novedad(dim_novedad)
-        load.load(dim_novedad, target_engine, 'dim_novedad', True)
-        print("dim_novedad procesada exitosamente")
-        time.sleep(2)
-
-        # Procesar dimensión estado
-        print("Procesando dimensión estado...")
-        dim_estado = extract.extract_dim_estado(source_engine)
-        dim_estado = transform.transform_dim_estado(dim_estado)
-        load.load(dim_estado, target_engine, 'dim_estado', True)
-        print("dim_estado procesada exitosamente")
-        time.sleep(2)
+    # Tipo 1, cierre de versiones y versiones nuevas en una sola transacción
+    if any(len(cambio) > 0 for cambio in cambios.values()):
+        llaves = metricas.measure(tabla, 'load', load.load_scd, cambios, target_engine, tabla, llave,
+                                  llave_subrogada)
+        resolver.register(tabla, cambios['insertar'][llave], llaves)
+    nuevos = len(cambios['insertar']) - len(cambios['expirar'])
+    print(f"{tabla}: {nuevos} miembros nuevos, {len(cambios['expirar'])} versiones nuevas, "
+          f"{len(cambios['tipo1'])} actualizados en su lugar")
+
+def process_dim_estatica_incremental(tabla, source_engine, target_engine, resolver, metricas, resultados):
+    """
+    Registra en el resolver las llaves de una dimensión que no se recarga en modo incremental
+    """
+    metricas.measure(tabla, 'extract_bodega', resolver.load_from_db, target_engine, tabla)
+
+# Columnas del hecho acumulado necesarias para derivar en memoria los hechos por hora y por día
+COLUMNAS_DERIVADOS = ['servicio_id', 'key_dim_fecha', 'key_dim_cliente', 'key_dim_mensajero',
+                      'key_dim_hora', 'fecha_iniciado', 'hora_iniciado']
+
+def transform_acumulado(df_servicios, resolver, metricas, procesos, motor):
+    """
+    Transforma la extracción del hecho acumulado con el motor del pivote configurado
+    """
+    etapa = 'hecho_entrega_acumulado'
+    if motor == 'sql':
+        return metricas.measure(etapa, 'transform', pushdown.transform_hecho_acumulado_sql, df_servicios, resolver)
+    with parallel.ShardedTransform(procesos) as pool:
+        return metricas.measure(etapa, 'transform', pool.transform, df_servicios, resolver)
+
+def process_hecho_acumulado(source_engine, target_engine, resolver, metricas, resultados,
+                            chunksize=None, procesos=1, motor='pandas'):
+    """
+    Procesa el hecho acumulado
+    Si se indica chunksize, se procesa en streaming: extracción, transformación y carga
+    por bloques de servicios, con memoria acotada; en ese caso los hechos por hora y por día
+    se derivan y cargan de cada bloque en la misma transacción (no hay etapas aparte para ellos)
+    y la extracción no pasa por staging; si no, los estados llegan de la etapa
+    extract_hecho_entrega_acumulado
+    Con procesos > 1 el pivote de estados y las duraciones se calculan en varios procesos
+    (por grupos de servicios, o varios bloques a la vez en streaming); con motor 'sql'
+    se calculan en la fuente y la extracción ya trae un registro por servicio
+    Returns:
+        pd.DataFrame: Hecho acumulado cargado, para derivar los hechos por hora y por día;
+            None en streaming
+    """
+    if chunksize:
+        etapa = 'hecho_entrega_acumulado'
+        tablas = [etapa, 'hecho_entrega_servicio_hora', 'hecho_entrega_servicio_diaria']
         
-        print("Todas las dimensiones fueron procesadas exitosamente")
+        def derivar(hechos):
+            # Cada servicio está completo en un solo bloque y los hechos por hora y por día
+            # agrupan por servicio_id, así que derivarlos por bloque da las mismas filas
+            for hecho in hechos:
+                yield {
+                    etapa: hecho,
+                    'hecho_entrega_servicio_hora': transform.transform_hecho_servicio_hora(
+                        transform.derive_hecho_servicio_hora(hecho, resolver)),
+                    'hecho_entrega_servicio_diaria': transform.transform_hecho_servicio_diaria(
+                        transform.derive_hecho_servicio_diaria(hecho, resolver)),
+                }
         
-    except Exception as e:
-        print(f"Error procesando dimensiones: {e}")
-        raise
+        if motor == 'sql':
+            chunks = metricas.measure_chunks(
+                etapa, 'extract', pushdown.extract_hecho_acumulado_sql_chunks(source_engine, chunksize))
+            hechos = metricas.measure_chunks(
+                etapa, 'extract_transform', pushdown.transform_hecho_acumulado_sql_chunks(chunks, resolver))
+            metricas.measure(etapa, 'extract_transform_load', load.load_chunks_tables,
+                             derivar(hechos), target_engine, tablas, True)
+        else:
+            with parallel.ShardedTransform(procesos) as pool:
+                chunks = metricas.measure_chunks(
+                    etapa, 'extract', extract.extract_servicios_estados_chunks(source_engine, chunksize))
+                hechos = metricas.measure_chunks(etapa, 'extract_transform', pool.transform_chunks(chunks, resolver))
+                metricas.measure(etapa, 'extract_transform_load', load.load_chunks_tables,
+                                 derivar(hechos), target_engine, tablas, True)
+        return None
+    
+    etapa = 'hecho_entrega_acumulado'
+    df_servicios = resultados['extract_hecho_entrega_acumulado']
+    hecho_acumulado = transform_acumulado(df_servicios, resolver, metricas, procesos, motor)
+    metricas.measure(etapa, 'load', load.load, hecho_acumulado, target_engine, etapa, True, copy=True)
+    return hecho_acumulado
 
-def process_facts(source_engine, target_engine):
+def process_hecho_acumulado_incremental(source_engine, target_engine, resolver, metricas, resultados,
+                                        desde, procesos=1, motor='pandas'):
     """
-    Procesa los hechos del proceso ETL
+    Recalcula completos los servicios con estados nuevos desde la marca de agua
+    y actualiza sus filas por servicio_id (merge); los servicios nuevos se insertan
+    Returns:
+        pd.DataFrame: Hecho acumulado de los servicios actualizados
     """
-    print("\nProcesando hechos...")
+    etapa = 'hecho_entrega_acumulado'
+    df_servicios = resultados['extract_hecho_entrega_acumulado']
+    print(f"{df_servicios['servicio_id'].nunique()} servicios con cambios desde {desde}")
     
-    # Verificar que todas las dimensiones necesarias existan
-    required_tables = ['dim_fecha', 'dim_hora', 'dim_cliente', 'dim_mensajero', 
-                      'dim_sede', 'dim_novedad', 'dim_estado']
+    if len(df_servicios) == 0:
+        return pd.DataFrame(columns=COLUMNAS_DERIVADOS)
+    hecho_acumulado = transform_acumulado(df_servicios, resolver, metricas, procesos, motor)
+    # Merge por servicio_id: los servicios existentes se actualizan en su lugar y conservan su llave
+    metricas.measure(etapa, 'load', load.load, hecho_acumulado, target_engine, etapa, merge=True)
+    return hecho_acumulado
+
+def process_hecho_servicio_hora(source_engine, target_engine, resolver, metricas, resultados,
+                                incremental=False, en_memoria=True):
+    """
+    Procesa el hecho de servicios por hora a partir del hecho acumulado
+    Con en_memoria se deriva del hecho acumulado de la etapa anterior en lugar de leerlo de la bodega
+    En modo incremental solo se reemplazan los servicios actualizados
+    """
+    hecho_acumulado = resultados['hecho_entrega_acumulado']
+    servicio_ids = hecho_acumulado['servicio_id'].tolist() if incremental else None
+    if incremental and not servicio_ids:
+        return
+    
+    etapa = 'hecho_entrega_servicio_hora'
+    if en_memoria:
+        df_servicio_hora = metricas.measure(etapa, 'derive', transform.derive_hecho_servicio_hora,
+                                            hecho_acumulado, resolver)
+    else:
+        df_servicio_hora = metricas.measure(etapa, 'extract', extract.extract_hecho_servicio_hora,
+                                            target_engine, servicio_ids)
+    hecho_hora = metricas.measure(etapa, 'transform', transform.transform_hecho_servicio_hora, df_servicio_hora)
     
-    if not verify_tables_exist(target_engine, required_tables):
-        raise Exception("Faltan tablas de dimensiones requeridas")
+    if incremental:
+        metricas.measure(etapa, 'load', load.load_replace_keys, hecho_hora, target_engine, etapa, 'servicio_id',
+                         values=servicio_ids)
+    else:
+        metricas.measure(etapa, 'load', load.load, hecho_hora, target_engine, etapa, True, copy=True)
 
+def process_hecho_servicio_diaria(source_engine, target_engine, resolver, metricas, resultados,
+                                  incremental=False, en_memoria=True):
+    """
+    Procesa el hecho de servicios por día a partir del hecho acumulado
+    Con en_memoria se deriva del hecho acumulado de la etapa anterior en lugar de leerlo de la bodega
+    En modo incremental solo se reemplazan los servicios actualizados
+    """
+    hecho_acumulado = resultados['hecho_entrega_acumulado']
+    servicio_ids = hecho_acumulado['servicio_id'].tolist() if incremental else None
+    if incremental and not servicio_ids:
+        return
+    
+    etapa = 'hecho_entrega_servicio_diaria'
+    if en_memoria:
+        df_servicio_dia = metricas.measure(etapa, 'derive', transform.derive_hecho_servicio_diaria,
+                                           hecho_acumulado, resolver)
+    else:
+        df_servicio_dia = metricas.measure(etapa, 'extract', extract.extract_hecho_servicio_diaria,
+                                           target_engine, servicio_ids)
+    hecho_dia = metricas.measure(etapa, 'transform', transform.transform_hecho_servicio_diaria, df_servicio_dia)
+    
+    if incremental:
+        metricas.measure(etapa, 'load', load.load_replace_keys, hecho_dia, target_engine, etapa, 'servicio_id',
+                         values=servicio_ids)
+    else:
+        metricas.measure(etapa, 'load', load.load, hecho_dia, target_engine, etapa, True, copy=True)
+
+def process_hecho_novedades(source_engine, target_engine, resolver, metricas, resultados, incremental=False):
+    """
+    Procesa el hecho de novedades
+    En modo incremental las novedades extraídas (id mayor a la marca de agua) reemplazan las filas
+    con la misma key_dim_novedad: si una ejecución falla después de esta etapa las marcas de agua
+    no se guardan y la siguiente vuelve a extraer las mismas novedades, sin duplicarlas
+    Returns:
+        pd.Series: key_dim_fecha de las novedades cargadas, para refrescar sus resúmenes
+    """
+    etapa = 'hecho_novedades_servicio'
+    df_novedades = resultados['extract_hecho_novedades_servicio']
+    hecho_novedades = metricas.measure(etapa, 'transform', transform.transform_hecho_novedades,
+                                       df_novedades, resolver)
+    if not incremental:
+        metricas.measure(etapa, 'load', load.load, hecho_novedades, target_engine, etapa, True, copy=True)
+    elif len(hecho_novedades) > 0:
+        metricas.measure(etapa, 'load', load.load_replace_keys, hecho_novedades, target_engine, etapa,
+                         'key_dim_novedad')
+    print(f"hecho_novedades_servicio: {len(hecho_novedades)} novedades")
+    return hecho_novedades['key_dim_fecha'].drop_duplicates()
+
+def process_particiones(source_engine, target_engine, resolver, metricas, resultados, layout, periodo):
+    """
+    Crea las particiones de los hechos para los periodos de dim_fecha, antes de cargarlos
+    """
+    metricas.measure('particiones', 'ddl', schema.create_partitions, target_engine, layout['particiones'], periodo)
+
+def process_indices(source_engine, target_engine, resolver, metricas, resultados, layout):
+    """
+    Crea los índices secundarios declarados en sqllayout.yml, después de la carga masiva
+    """
+    metricas.measure('indices', 'ddl', schema.create_indexes, target_engine, layout['indices'])
+
+def process_resumenes(source_engine, target_engine, resolver, metricas, resultados, layout, incremental=False):
+    """
+    Actualiza las tablas de resumen declaradas en sqllayout.yml
+    En modo incremental solo se vuelven a agregar las fechas cargadas en la ejecución; los hechos
+    por hora y por día se derivan de los servicios del hecho acumulado, así que sus fechas son las mismas
+    """
+    fechas = None
+    if incremental:
+        acumulado = resultados['hecho_entrega_acumulado']['key_dim_fecha']
+        fechas = {
+            'hecho_entrega_acumulado': acumulado,
+            'hecho_entrega_servicio_hora': acumulado,
+            'hecho_entrega_servicio_diaria': acumulado,
+            'hecho_novedades_servicio': resultados['hecho_novedades_servicio'],
+        }
+    metricas.measure('resumenes', 'refresh', rollups.refresh_rollups, target_engine, layout['resumenes'], fechas)
+
+def process_llaves_foraneas(source_engine, target_engine, resolver, metricas, resultados, llaves):
+    """
+    Restaura y valida las llaves foráneas eliminadas para la carga masiva
+    Si alguna tiene filas huérfanas la etapa falla con el detalle y la ejecución no guarda marcas de agua
+    """
+    huerfanos = metricas.measure('llaves_foraneas', 'validate', schema.restore_foreign_keys, target_engine, llaves)
+    if len(huerfanos) > 0:
+        raise ValueError(f"{int(huerfanos['filas'].sum())} filas huérfanas en las llaves foráneas "
+                         f"{', '.join(huerfanos['tabla'] + '.' + huerfanos['nombre'])}")
+
+def restore_stage(tabla, target_engine, resolver, metricas):
+    """
+    Al reanudar una ejecución, registra en el KeyResolver las llaves de una dimensión que
+    cargó el intento anterior, leyéndolas de la bodega
+    """
+    if tabla not in keys.LLAVES_DIMENSIONES:
+        return
+    if tabla in scd.ATRIBUTOS_SCD:
+        actuales = metricas.measure(tabla, 'reanudar', scd.read_current, target_engine, tabla)
+        resolver.register_frame(tabla, actuales)
+    else:
+        metricas.measure(tabla, 'reanudar', resolver.load_from_db, target_engine, tabla)
+
+def medir_etapas(etapas, metricas):
+    """
+    Envuelve cada etapa para registrar su duración total en las métricas de la ejecución
+    """
+    return {nombre: (metricas.wrap_stage(nombre, funcion), dependencias)
+            for nombre, (funcion, dependencias) in etapas.items()}
+
+def build_stages(source_engine, target_engine, config, resolver, metricas, staging, marcas=None,
+                 llaves_foraneas=None):
+    """
+    Registra las etapas del ETL con sus dependencias
+    Args:
+        source_engine: Conexión a la base de datos fuente
+        target_engine: Conexión a la base de datos bodega
+        config: Configuración cargada de config.yml
+        resolver: KeyResolver compartido por las etapas de la ejecución
+        metricas: RunMetrics donde cada etapa registra sus pasos
+        staging: StagingCache por la que pasan las extracciones de la fuente
+        marcas: Marcas de agua de la última ejecución; si se indican, las etapas son incrementales
+        llaves_foraneas: Llaves foráneas eliminadas para la carga masiva; se restauran al final
+    Returns:
+        dict: {nombre: (funcion, dependencias)} para scheduler.run_stages
+    """
+    def etapa(funcion, *args, **kwargs):
+        return lambda resultados: funcion(*args, source_engine, target_engine, resolver, metricas, resultados,
+                                          **kwargs)
+    
+    en_memoria = config.get('etl', {}).get('hechos_en_memoria', True)
+    procesos = config.get('etl', {}).get('procesos', 1)
+    config_particiones = config.get('etl', {}).get('particiones', {})
+    layout = schema.read_layout()
+    
+    def completar(etapas):
+        """
+        Agrega las etapas del diseño físico: las particiones antes de cargar los hechos,
+        los índices cuando terminan de cargarse todas sus tablas, los resúmenes cuando están
+        cargados los hechos y sus índices y, al final (los índices y la validación bloquean
+        las tablas), la validación de las llaves foráneas
+        """
+        if config_particiones.get('habilitado', False):
+            etapas['particiones'] = (
+                etapa(process_particiones, layout=layout, periodo=config_particiones.get('periodo', 'year')),
+                ['dim_fecha']
+            )
+            for tabla in filter(etapas.__contains__, layout['particiones']):
+                funcion, dependencias = etapas[tabla]
+                etapas[tabla] = (funcion, dependencias + ['particiones'])
+        etapas['indices'] = (etapa(process_indices, layout=layout), [t for t in etapas if t in layout['indices']])
+        if layout['resumenes']:
+            etapas['resumenes'] = (
+                etapa(process_resumenes, layout=layout, incremental=marcas is not None),
+                [t for t in ['hecho_entrega_acumulado', 'hecho_entrega_servicio_hora',
+                             'hecho_entrega_servicio_diaria', 'hecho_novedades_servicio', 'indices'] if t in etapas]
+            )
+        if llaves_foraneas is not None:
+            etapas['llaves_foraneas'] = (
+                etapa(process_llaves_foraneas, llaves=llaves_foraneas),
+                [t for t in etapas if not t.startswith('extract_')]
+            )
+        return medir_etapas(etapas, metricas)
+    
+    def extracciones(consultas):
+        """
+        Etapas extract_<tabla> sin dependencias, una por consulta a la fuente: el scheduler las
+        inicia primero (la más pesada antes) y cada tabla se transforma apenas llega su extracción
+        Args:
+            consultas: {tabla: (funcion de extract, argumentos adicionales a la conexión)}
+        """
+        return {f'extract_{tabla}': (etapa(process_extract, tabla, extraer, staging=staging, args=args), [])
+                for tabla, (extraer, args) in consultas.items()}
+    
+    chunksize = config.get('etl', {}).get('chunksize')
+    motor = config.get('etl', {}).get('motor_pivote', 'pandas')
+    if motor not in pushdown.MOTORES_PIVOTE:
+        raise ValueError(f"Motor del pivote inválido: {motor}. Opciones: {list(pushdown.MOTORES_PIVOTE)}")
+    extraer_acumulado = pushdown.extract_hecho_acumulado_sql if motor == 'sql' else extract.extract_hecho_acumulado
+    extraer_modificados = (pushdown.extract_servicios_modificados_sql if motor == 'sql'
+                           else extract.extract_servicios_modificados)
+    dependencias_acumulado = ['dim_fecha', 'dim_cliente', 'dim_mensajero', 'dim_hora']
+    dependencias_hora = ['hecho_entrega_acumulado', 'dim_cliente', 'dim_sede']
+    dependencias_dia = ['hecho_entrega_acumulado', 'dim_cliente', 'dim_sede', 'dim_fecha']
+    dependencias_novedades = ['dim_fecha', 'dim_cliente', 'dim_novedad', 'extract_hecho_novedades_servicio']
+    dimensiones = {tabla: (extraer, ()) for tabla, (extraer, _, _) in DIMENSIONES_FUENTE.items()}
+    
+    if marcas is None:
+        # En streaming el hecho acumulado extrae por bloques dentro de su propia etapa
+        consultas = {} if chunksize else {'hecho_entrega_acumulado': (extraer_acumulado, ())}
+        consultas.update(dimensiones)
+        consultas['hecho_novedades_servicio'] = (extract.extract_hecho_novedades, ())
+        consultas['dim_fecha'] = (extract.extract_dim_fecha, ())
+        etapas = extracciones(consultas)
+        etapas.update({
+            'dim_fecha': (etapa(process_dim_fecha), ['extract_dim_fecha']),
+            'dim_hora': (etapa(process_dim_hora), []),
+        })
+        for tabla in DIMENSIONES_FUENTE:
+            etapas[tabla] = (etapa(process_dim_fuente, tabla), [f'extract_{tabla}'])
+        etapas['hecho_novedades_servicio'] = (etapa(process_hecho_novedades), dependencias_novedades)
+        if chunksize:
+            # En streaming la etapa del hecho acumulado también carga los hechos por hora y por día
+            etapas['hecho_entrega_acumulado'] = (
+                etapa(process_hecho_acumulado, chunksize=chunksize, procesos=procesos, motor=motor),
+                sorted(set(dependencias_acumulado + dependencias_hora + dependencias_dia)
+                       - {'hecho_entrega_acumulado'})
+            )
+            return completar(etapas)
+        etapas.update({
+            'hecho_entrega_acumulado': (
+                etapa(process_hecho_acumulado, procesos=procesos, motor=motor),
+                dependencias_acumulado + ['extract_hecho_entrega_acumulado']
+            ),
+            'hecho_entrega_servicio_hora': (
+                etapa(process_hecho_servicio_hora, en_memoria=en_memoria), dependencias_hora
+            ),
+            'hecho_entrega_servicio_diaria': (
+                etapa(process_hecho_servicio_diaria, en_memoria=en_memoria), dependencias_dia
+            ),
+        })
+        return completar(etapas)
+    
+    # Modo incremental: dim_hora es estática y no se recarga; a dim_fecha solo se le agregan
+    # las fechas nuevas de la fuente
+    desde = marcas.get('mensajeria_estadosservicio', '1900-01-01 00:00:00')
+    desde_id = int(marcas.get('mensajeria_novedadesservicio', 0))
+    
+    consultas = {'hecho_entrega_acumulado': (extraer_modificados, (desde,))}
+    consultas.update(dimensiones)
+    consultas['hecho_novedades_servicio'] = (extract.extract_hecho_novedades, (desde_id,))
+    consultas['dim_fecha'] = (extract.extract_dim_fecha, ())
+    etapas = extracciones(consultas)
+    etapas.update({
+        'dim_fecha': (etapa(process_dim_fecha_incremental), ['extract_dim_fecha']),
+        'dim_hora': (etapa(process_dim_estatica_incremental, 'dim_hora'), []),
+    })
+    for tabla in DIMENSIONES_FUENTE:
+        procesar = process_dim_scd_incremental if tabla in scd.ATRIBUTOS_SCD else process_dim_fuente_incremental
+        etapas[tabla] = (etapa(procesar, tabla), [f'extract_{tabla}'])
+    etapas.update({
+        'hecho_entrega_acumulado': (
+            etapa(process_hecho_acumulado_incremental, desde=desde, procesos=procesos, motor=motor),
+            dependencias_acumulado + ['extract_hecho_entrega_acumulado']
+        ),
+        'hecho_entrega_servicio_hora': (
+            etapa(process_hecho_servicio_hora, incremental=True, en_memoria=en_memoria),
+            dependencias_hora
+        ),
+        'hecho_entrega_servicio_diaria': (
+            etapa(process_hecho_servicio_diaria, incremental=True, en_memoria=en_memoria),
+            dependencias_dia
+        ),
+        'hecho_novedades_servicio': (
+            etapa(process_hecho_novedades, incremental=True),
+            dependencias_novedades
+        ),
+    })
+    return completar(etapas)
+
+def write_run_report(metricas, target_engine, config):
+    """
+    Imprime el resumen de la ejecución y guarda el reporte en JSON/CSV y, si está
+    habilitado en config.yml, en la tabla etl_run_log de la bodega
+    """
+    config_etl = config.get('etl', {})
+    metricas.summary()
     try:
-        # Procesar hecho acumulado
-        print("Procesando hecho acumulado...")
-        df_servicios, dim_fecha, dim_cliente, dim_mensajero, dim_hora = extract.extract_hecho_acumulado(source_engine, target_engine)
-        hecho_acumulado = transform.transform_hecho_acumulado(df_servicios, dim_fecha, dim_cliente, dim_mensajero, dim_hora)
-        load.load(hecho_acumulado, target_engine, 'hecho_entrega_acumulado', True)
-        print("hecho_entrega_acumulado procesado exitosamente")
-        time.sleep(2)
-
-        # Procesar hecho servicio hora
-        print("Procesando hecho servicio hora...")
-        df_servicio_hora = extract.extract_hecho_servicio_hora(target_engine)
-        hecho_hora = transform.transform_hecho_servicio_hora(df_servicio_hora)
-        load.load(hecho_hora, target_engine, 'hecho_entrega_servicio_hora', True)
-        print("hecho_entrega_servicio_hora procesado exitosamente")
-        time.sleep(2)
-
-        # Procesar hecho servicio diaria
-        print("Procesando hecho servicio diaria...")
-        df_servicio_dia = extract.extract_hecho_servicio_diaria(target_engine)
-        hecho_dia = transform.transform_hecho_servicio_diaria(df_servicio_dia)
-        load.load(hecho_dia, target_engine, 'hecho_entrega_servicio_diaria', True)
-        print("hecho_entrega_servicio_diaria procesado exitosamente")
-        time.sleep(2)
-
-        print("Procesando hecho novedades...")
-        df_novedades, dim_fecha, dim_cliente, dim_novedad = extract.extract_hecho_novedades(source_engine, target_engine)
-        hecho_novedades = transform.transform_hecho_novedades(
-            df_novedades,
-            dim_fecha,
-            dim_cliente,
-            dim_novedad
-        )
-        load.load(hecho_novedades, target_engine, 'hecho_novedades_servicio', True)
-        print("hecho_novedades_servicio procesado exitosamente")
-        time.sleep(2)
-        
-        print("Todos los hechos fueron procesados exitosamente")
-        
+        metricas.write_report(config_etl.get('reportes', 'reportes'))
+        if config_etl.get('run_log', False):
+            metricas.save_to_db(target_engine)
     except Exception as e:
-        print(f"Error procesando hechos: {e}")
-        raise
+        print(f"Error guardando el reporte de la ejecución: {e}")
+
+def parse_args():
+    """
+    Lee los argumentos de línea de comandos
+    """
+    parser = argparse.ArgumentParser(description="ETL Rapidos y Furiosos")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument('--full-refresh', action='store_true',
+                      help="Elimina y reconstruye todas las tablas de la bodega desde cero")
+    modo.add_argument('--resume', action='store_true',
+                      help="Reanuda la última ejecución que falló desde sus etapas pendientes")
+    cache = parser.add_mutually_exclusive_group()
+    cache.add_argument('--refresh-staging', action='store_true',
+                       help="Vuelve a extraer de la fuente y reemplaza los archivos de staging")
+    cache.add_argument('--no-staging', action='store_true',
+                       help="Extrae directo de la fuente sin leer ni escribir staging")
+    return parser.parse_args()
+
+def resume_checkpoint(config):
+    """
+    Busca la última ejecución sin terminar para reanudarla con --resume
+    Returns:
+        checkpoint.RunCheckpoint: Puntos de control de la ejecución, o None si no hay una pendiente
+    """
+    config_checkpoints = config.get('etl', {}).get('checkpoints', {})
+    if not config_checkpoints.get('habilitado', False):
+        print("Los puntos de control están desactivados (etl.checkpoints), no hay ejecución para reanudar")
+        return None
+    punto = checkpoint.RunCheckpoint.resume(config_checkpoints.get('directorio', 'checkpoints'))
+    if punto is None:
+        print("No hay una ejecución pendiente para reanudar")
+    return punto
 
 def main():
+    args = parse_args()
+    
     # Cargar configuración
     with open('config.yml', 'r') as f:
         config = yaml.safe_load(f)
 
     # Crear conexiones
-    source_engine, target_engine = create_connections(config)
+    conexiones = create_connections(config)
+    source_engine, target_engine = conexiones.source, conexiones.target
+    
+    # Ejecución que se reanuda: conserva su run_id, sus marcas de agua y el modo (completo o incremental)
+    reanudar = resume_checkpoint(config) if args.resume else None
+    
+    # Métricas por etapa y paso de esta ejecución
+    metricas = metrics.RunMetrics(reanudar.run_id if reanudar else None)
+    config_checkpoints = config.get('etl', {}).get('checkpoints', {})
+    punto = reanudar
 
     try:
-        # Eliminar todas las tablas existentes
-        drop_all_tables(config)
-        
-        # Crear todas las tablas desde cero
-        create_tables(config)
-        
-        # Procesar dimensiones
-        process_dimensions(source_engine, target_engine)
-        
-        # Procesar hechos
-        process_facts(source_engine, target_engine)
-        
-        print("\n¡Proceso ETL completado exitosamente!")
-        
+        with conexiones.snapshot():
+            # Marcas de agua de la fuente antes de extraer, en el mismo snapshot que las extracciones:
+            # lo que llegue durante la ejecución se procesa en la siguiente. Al reanudar se usan las
+            # del intento anterior, que son las que corresponden a las etapas ya cargadas
+            if reanudar:
+                nuevas_marcas = reanudar.contexto['nuevas_marcas']
+            else:
+                nuevas_marcas = extract.extract_watermarks(source_engine)
+            
+            # Staging local de las extracciones; la huella (fuente, marcas de agua y contenido de las
+            # tablas de las dimensiones) invalida las entradas cuando llegan datos nuevos o cambia una dimensión
+            modo_staging = 'refrescar' if args.refresh_staging else 'omitir' if args.no_staging else None
+            usar_staging = modo_staging == 'refrescar' or (
+                modo_staging is None and config.get('etl', {}).get('staging', {}).get('habilitado', False))
+            huella = json.dumps({'fuente': source_engine.url.render_as_string(hide_password=True),
+                                 'marcas': nuevas_marcas,
+                                 'dimensiones': extract.extract_dimension_fingerprints(source_engine)
+                                 if usar_staging else {}},
+                                sort_keys=True)
+            cache = staging.StagingCache.from_config(config, huella, modo_staging)
+            
+            # Llaves de las dimensiones, construidas una vez por ejecución
+            resolver = keys.KeyResolver()
+            
+            marcas = {}
+            llaves = None
+            if reanudar:
+                # Las tablas ya existen: no se eliminan ni se vuelven a crear
+                print(f"Reanudando la ejecución {reanudar.run_id} ({len(reanudar.completadas)} etapas terminadas)")
+                marcas = reanudar.contexto['marcas']
+                if reanudar.contexto.get('llaves') is not None:
+                    llaves = pd.DataFrame(reanudar.contexto['llaves'], columns=['tabla', 'nombre', 'definicion'])
+            elif (not args.full_refresh and verify_tables_exist(target_engine, TABLAS_BODEGA)
+                    and verify_duration_columns(target_engine) and verify_scd_columns(target_engine)):
+                marcas = watermark.read_watermarks(target_engine)
+            
+            if marcas:
+                print("Ejecutando ETL incremental")
+                etapas = build_stages(source_engine, target_engine, config, resolver, metricas, cache, marcas)
+            else:
+                print("Ejecutando ETL completo")
+                
+                if not reanudar:
+                    # Eliminar todas las tablas existentes
+                    drop_all_tables(target_engine)
+                    
+                    # Crear todas las tablas desde cero
+                    create_tables(target_engine, config)
+                    
+                    # Carga masiva sin llaves foráneas: se restauran y validan en una sola pasada
+                    # por restricción al terminar la carga (etapa llaves_foraneas)
+                    if config.get('etl', {}).get('diferir_llaves', True):
+                        llaves = metricas.measure('llaves_foraneas', 'drop', schema.drop_foreign_keys,
+                                                  target_engine, TABLAS_BODEGA, schema.read_layout()['indices'])
+                
+                etapas = build_stages(source_engine, target_engine, config, resolver, metricas, cache,
+                                      llaves_foraneas=llaves)
+            
+            # Puntos de control: cada etapa terminada queda registrada con su resultado, para que
+            # --resume continúe desde la etapa que falle sin repetir las anteriores
+            if punto is None and config_checkpoints.get('habilitado', False):
+                punto = checkpoint.RunCheckpoint.start(
+                    config_checkpoints.get('directorio', 'checkpoints'), metricas.run_id,
+                    {'marcas': marcas, 'nuevas_marcas': nuevas_marcas,
+                     'llaves': llaves.to_dict('records') if llaves is not None else None})
+            if punto is not None:
+                etapas = punto.wrap_stages(
+                    etapas, lambda tabla: restore_stage(tabla, target_engine, resolver, metricas))
+            
+            # Procesar dimensiones y hechos; las etapas independientes corren en paralelo
+            scheduler.run_stages(etapas, config.get('etl', {}).get('workers', 4), liberar=True)
+            
+            watermark.save_watermarks(target_engine, nuevas_marcas)
+            if punto is not None:
+                punto.finish()
+            
+            print("\n¡Proceso ETL completado exitosamente!")
+            
     except Exception as e:
         print(f"\nError durante el proceso ETL: {e}")
         print("El proceso ETL falló")
+        if punto is not None:
+            print(f"Para continuar desde las etapas pendientes: python main.py --resume (ejecución {punto.run_id})")
+    
+    finally:
+        write_run_report(metricas, target_engine, config)
+        conexiones.dispose()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
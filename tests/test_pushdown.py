@@ -0,0 +1,160 @@
+import os
+import uuid
+from datetime import date, time
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+from etl import extract, keys, pushdown, transform
+
+# URL de una base PostgreSQL de pruebas para ejecutar la consulta del pivote; sin ella esas pruebas se omiten
+PG_URL = os.environ.get('ETL_TEST_PG_URL')
+
+# Estados de la fuente en el orden de QUERY_SERVICIOS_ESTADOS: (servicio_id, estado_id, fecha, hora)
+# 1 completo con una hora con fracción de segundo, 2 con novedades que cruzan la medianoche,
+# 3 solo iniciado y asignado sin hora, 4 con estados en el mismo instante y la entrega antes de la recogida
+ESTADOS = [
+    (1, 1, date(2024, 3, 1), time(8, 0)), (1, 2, date(2024, 3, 1), time(8, 10, 30)),
+    (1, 4, date(2024, 3, 1), time(8, 40)), (1, 5, date(2024, 3, 1), time(9, 5, 15, 500000)),
+    (1, 6, date(2024, 3, 1), time(9, 6)),
+    (2, 1, date(2024, 3, 1), time(22, 0)), (2, 2, date(2024, 3, 1), time(22, 15)),
+    (2, 3, date(2024, 3, 1), time(23, 50)), (2, 3, date(2024, 3, 2), time(0, 20)),
+    (2, 3, date(2024, 3, 2), time(1, 5)), (2, 4, date(2024, 3, 2), time(1, 30)),
+    (2, 5, date(2024, 3, 2), time(2, 0)),
+    (3, 1, date(2024, 3, 1), time(10, 0)), (3, 2, date(2024, 3, 1), None),
+    (4, 1, date(2024, 3, 1), time(13, 0)), (4, 2, date(2024, 3, 1), time(13, 0)),
+    (4, 4, date(2024, 3, 1), time(13, 30)), (4, 5, date(2024, 3, 1), time(13, 20)),
+]
+# (servicio_id, cliente_id, mensajero_id)
+SERVICIOS = [(1, 10, 100), (2, 20, 200), (3, 30, None), (4, 10, 100)]
+
+
+def _segundos(hora: time | None) -> float | None:
+    """
+    Hora como la extraen las consultas: date_part('epoch', hora), segundos desde la medianoche
+    """
+    if hora is None:
+        return None
+    return hora.hour * 3600 + hora.minute * 60 + hora.second + hora.microsecond / 1_000_000
+
+
+def _pivote() -> pd.DataFrame:
+    """
+    Resultado de pivot_query para ESTADOS, armado a mano con los tipos que entrega psycopg2
+    """
+    vacio = {f'{campo}_{nombre}': None for campo in ['fecha', 'hora']
+             for nombre in list(transform.ESTADOS.values()) + ['ultima_novedad']}
+    dia1, dia2 = date(2024, 3, 1), date(2024, 3, 2)
+    filas = [
+        {'servicio_id': 1, 'cliente_id': 10, 'mensajero_inicial_id': 100,
+         'fecha_iniciado': dia1, 'hora_iniciado': time(8, 0), 'fecha_asignado': dia1, 'hora_asignado': time(8, 10, 30),
+         'fecha_recogido': dia1, 'hora_recogido': time(8, 40),
+         'fecha_entregado': dia1, 'hora_entregado': time(9, 5, 15, 500000),
+         'fecha_cerrado': dia1, 'hora_cerrado': time(9, 6), 'cantidad_novedades': 0,
+         'tiempo_asignacion': 630, 'tiempo_total_novedades': None, 'tiempo_recogida': 1770,
+         'tiempo_entrega': 1515, 'tiempo_cierre': 45},
+        {'servicio_id': 2, 'cliente_id': 20, 'mensajero_inicial_id': 200,
+         'fecha_iniciado': dia1, 'hora_iniciado': time(22, 0), 'fecha_asignado': dia1, 'hora_asignado': time(22, 15),
+         'fecha_novedad': dia1, 'hora_novedad': time(23, 50),
+         'fecha_ultima_novedad': dia2, 'hora_ultima_novedad': time(1, 5),
+         'fecha_recogido': dia2, 'hora_recogido': time(1, 30), 'fecha_entregado': dia2, 'hora_entregado': time(2, 0),
+         'cantidad_novedades': 3, 'tiempo_asignacion': 900, 'tiempo_total_novedades': 4500,
+         'tiempo_recogida': 1500, 'tiempo_entrega': 1800, 'tiempo_cierre': None},
+        {'servicio_id': 3, 'cliente_id': 30, 'mensajero_inicial_id': None,
+         'fecha_iniciado': dia1, 'hora_iniciado': time(10, 0), 'fecha_asignado': dia1, 'cantidad_novedades': 0,
+         'tiempo_asignacion': None, 'tiempo_total_novedades': None, 'tiempo_recogida': None,
+         'tiempo_entrega': None, 'tiempo_cierre': None},
+        {'servicio_id': 4, 'cliente_id': 10, 'mensajero_inicial_id': 100,
+         'fecha_iniciado': dia1, 'hora_iniciado': time(13, 0), 'fecha_asignado': dia1, 'hora_asignado': time(13, 0),
+         'fecha_recogido': dia1, 'hora_recogido': time(13, 30), 'fecha_entregado': dia1, 'hora_entregado': time(13, 20),
+         'cantidad_novedades': 0, 'tiempo_asignacion': 0, 'tiempo_total_novedades': None,
+         'tiempo_recogida': 1800, 'tiempo_entrega': 600, 'tiempo_cierre': None},
+    ]
+    filas = [{columna: _segundos(valor) if columna.startswith('hora_') else valor
+              for columna, valor in {**vacio, **fila}.items()} for fila in filas]
+    return pd.DataFrame(filas)
+
+
+def _estados() -> pd.DataFrame:
+    """
+    ESTADOS como los entrega extract_hecho_acumulado
+    """
+    servicios = pd.DataFrame(SERVICIOS, columns=['servicio_id', 'cliente_id', 'mensajero_inicial_id'])
+    df = pd.DataFrame(ESTADOS, columns=['servicio_id', 'estado_id', 'fecha_estado', 'hora_estado'])
+    df = servicios.merge(df, on='servicio_id')
+    df['hora_estado'] = df['hora_estado'].map(_segundos)
+    return extract.aplicar_tipos(df, extract.TIPOS_SERVICIOS_ESTADOS)
+
+
+def _resolver() -> keys.KeyResolver:
+    return keys.resolver_from_frames(
+        dim_fecha=pd.DataFrame({'key_dim_fecha': [1, 2], 'fecha': pd.to_datetime(['2024-03-01', '2024-03-02'])}),
+        dim_cliente=pd.DataFrame({'key_dim_cliente': [1, 2, 3], 'cliente_id': [10, 20, 30]}),
+        dim_mensajero=pd.DataFrame({'key_dim_mensajero': [1, 2], 'mensajero_id': [100, 200]}),
+        dim_hora=pd.DataFrame({'key_dim_hora': range(1, 25), 'hora': range(24)}),
+    )
+
+
+def test_transform_hecho_acumulado_sql_igual_a_pandas():
+    resolver = _resolver()
+    hecho_pandas = transform.transform_hecho_acumulado(_estados(), resolver)
+    hecho_sql = pushdown.transform_hecho_acumulado_sql(pushdown._leer_pivote(_pivote()), resolver)
+
+    pushdown.check_parity(hecho_pandas, hecho_sql)
+    assert hecho_sql['key_dim_hora'].tolist() == [9, 23, 11, 14]
+    assert hecho_sql['hora_entregado'][0] == pd.Timedelta('09:05:15')
+
+
+@pytest.fixture
+def fuente():
+    """
+    Tablas de la fuente con ESTADOS en un esquema temporal de la base ETL_TEST_PG_URL
+    """
+    if not PG_URL:
+        pytest.skip("ETL_TEST_PG_URL no está definida")
+    esquema = f'prueba_pushdown_{uuid.uuid4().hex[:8]}'
+    admin = create_engine(PG_URL)
+    with admin.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA {esquema}'))
+    engine = create_engine(PG_URL, connect_args={'options': f'-csearch_path={esquema}'})
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE mensajeria_servicio (id INTEGER PRIMARY KEY, cliente_id INTEGER, mensajero_id INTEGER);
+                CREATE TABLE mensajeria_estadosservicio (
+                    id SERIAL PRIMARY KEY, servicio_id INTEGER, estado_id INTEGER, fecha DATE, hora TIME
+                );
+            """))
+            conn.execute(text("INSERT INTO mensajeria_servicio VALUES (:id, :cliente_id, :mensajero_id)"),
+                         [dict(zip(['id', 'cliente_id', 'mensajero_id'], fila)) for fila in SERVICIOS])
+            conn.execute(text("""
+                INSERT INTO mensajeria_estadosservicio (servicio_id, estado_id, fecha, hora)
+                VALUES (:servicio_id, :estado_id, :fecha, :hora)
+            """), [dict(zip(['servicio_id', 'estado_id', 'fecha', 'hora'], fila)) for fila in ESTADOS])
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA {esquema} CASCADE'))
+        admin.dispose()
+
+
+def test_pivot_query_igual_a_pandas(fuente):
+    resolver = _resolver()
+    pivote = pushdown.extract_hecho_acumulado_sql(fuente)
+    hecho_pandas = transform.transform_hecho_acumulado(extract.extract_hecho_acumulado(fuente), resolver)
+
+    pushdown.check_parity(hecho_pandas, pushdown.transform_hecho_acumulado_sql(pivote.copy(), resolver))
+    pushdown.check_parity(pushdown._leer_pivote(_pivote()), pivote[_pivote().columns.tolist() + ['hora_del_dia']])
+    bloques = pd.concat(pushdown.extract_hecho_acumulado_sql_chunks(fuente, chunksize=3), ignore_index=True)
+    pd.testing.assert_frame_equal(bloques, pivote)
+
+
+def test_servicios_modificados_sql_igual_a_pandas(fuente):
+    resolver = _resolver()
+    desde = '2024-03-02 00:20:00'
+    modificados = pushdown.extract_servicios_modificados_sql(fuente, desde)
+    estados = extract.extract_servicios_modificados(fuente, desde)
+
+    assert modificados['servicio_id'].tolist() == [2]
+    pushdown.check_parity(transform.transform_hecho_acumulado(estados, resolver),
+                          pushdown.transform_hecho_acumulado_sql(modificados, resolver))
@@ -0,0 +1,184 @@
+from datetime import date, time
+import pandas as pd
+from etl import extract, transform
+
+COLUMNAS_TIEMPO = ['tiempo_asignacion', 'tiempo_total_novedades', 'tiempo_recogida',
+                   'tiempo_entrega', 'tiempo_cierre']
+
+
+def _estados() -> pd.DataFrame:
+    """
+    Estados de unos pocos servicios como los entrega extract_hecho_acumulado (fechas date y horas texto):
+    1 completo, 2 sin recogido/entregado/cerrado, 3 con novedades que cruzan la medianoche,
+    4 con la fecha de asignación nula, 5 con la entrega anterior a la recogida y 6 con estados
+    en el mismo instante; las filas de los servicios vienen intercaladas
+    """
+    filas = [
+        (1, 1, '08:00:00'), (1, 2, '08:10:30'), (2, 1, '09:00:00'), (1, 4, '08:40:00'),
+        (1, 5, '09:05:15'), (1, 6, '09:06:00'), (2, 2, '09:30:00'),
+        (3, 1, '22:00:00'), (3, 2, '22:15:00'), (3, 3, '23:50:00'), (3, 3, '00:20:00'),
+        (3, 3, '01:05:00'), (3, 4, '01:30:00'), (3, 5, '02:00:00'), (3, 6, '02:01:00'),
+        (4, 1, '10:00:00'), (4, 2, '10:20:00'), (4, 4, '10:45:00'),
+        (5, 1, '11:00:00'), (5, 2, '11:05:00'), (5, 4, '12:00:00'), (5, 5, '11:30:00'),
+        (6, 1, '13:00:00'), (6, 2, '13:00:00'), (6, 4, '13:30:00'), (6, 5, '13:30:00'),
+    ]
+    df = pd.DataFrame(filas, columns=['servicio_id', 'estado_id', 'hora_estado'])
+    df['fecha_estado'] = date(2024, 3, 1)
+    # Las novedades del servicio 3 después de medianoche y sus estados siguientes son del día 2
+    siguiente_dia = (df['servicio_id'] == 3) & df['hora_estado'].str.startswith(('00', '01', '02'))
+    df.loc[siguiente_dia, 'fecha_estado'] = date(2024, 3, 2)
+    df.loc[(df['servicio_id'] == 4) & (df['estado_id'] == 2), 'fecha_estado'] = None
+    df['cliente_id'] = df['servicio_id'] * 10
+    df['mensajero_inicial_id'] = df['servicio_id'] * 100
+    return df
+
+
+def _duraciones_por_fila(df_estados: pd.DataFrame) -> pd.DataFrame:
+    """
+    Duraciones calculadas fila por fila con calcular_tiempo_entre_estados, como antes de vectorizar
+    """
+    def tiempo(fila, inicio, fin):
+        return transform.calcular_tiempo_entre_estados(fila[f'fecha_{inicio}'], fila[f'hora_{inicio}'],
+                                                       fila[f'fecha_{fin}'], fila[f'hora_{fin}'])
+
+    def recogida(fila):
+        if pd.isna(fila['fecha_novedad']):
+            return tiempo(fila, 'asignado', 'recogido')
+        return tiempo(fila, 'ultima_novedad', 'recogido')
+
+    return pd.DataFrame({
+        'tiempo_asignacion': df_estados.apply(tiempo, axis=1, args=('iniciado', 'asignado')),
+        'tiempo_total_novedades': df_estados.apply(
+            lambda fila: tiempo(fila, 'novedad', 'ultima_novedad') if pd.notna(fila['fecha_novedad'])
+            else "00:00:00", axis=1),
+        'tiempo_recogida': df_estados.apply(recogida, axis=1),
+        'tiempo_entrega': df_estados.apply(tiempo, axis=1, args=('recogido', 'entregado')),
+        'tiempo_cierre': df_estados.apply(tiempo, axis=1, args=('entregado', 'cerrado')),
+    })
+
+
+def _segundos(hhmmss: str) -> int:
+    horas, minutos, segundos = map(int, hhmmss.split(':'))
+    return horas * 3600 + minutos * 60 + segundos
+
+
+def test_calcular_tiempos_estados_igual_al_calculo_por_fila():
+    df_estados = transform.pivotar_estados(_estados())
+    por_fila = _duraciones_por_fila(df_estados)
+    vectorizado = transform.calcular_tiempos_estados(df_estados.copy())
+
+    for columna in COLUMNAS_TIEMPO:
+        # El cálculo por fila escribe "00:00:00" cuando falta un estado; el vectorizado deja nulo
+        assert vectorizado[columna].fillna(0).tolist() == por_fila[columna].map(_segundos).tolist(), columna
+
+
+def test_calcular_tiempos_estados_casos_borde():
+    df_estados = transform.calcular_tiempos_estados(transform.pivotar_estados(_estados()))
+    tiempos = df_estados.set_index('servicio_id')[COLUMNAS_TIEMPO]
+
+    # Estados que faltan y fechas nulas dejan la duración nula, no en cero
+    assert tiempos.loc[2, ['tiempo_recogida', 'tiempo_entrega', 'tiempo_cierre']].isna().all()
+    assert pd.isna(tiempos.loc[4, 'tiempo_asignacion']) and pd.isna(tiempos.loc[4, 'tiempo_recogida'])
+    # Novedades que cruzan la medianoche: de la primera a la última y de la última a la recogida
+    assert tiempos.loc[3, 'tiempo_total_novedades'] == 75 * 60
+    assert tiempos.loc[3, 'tiempo_recogida'] == 25 * 60
+    # Una entrega anterior a la recogida da la duración absoluta
+    assert tiempos.loc[5, 'tiempo_entrega'] == 30 * 60
+    # Estados en el mismo instante dan cero
+    assert tiempos.loc[6, 'tiempo_asignacion'] == 0 and tiempos.loc[6, 'tiempo_entrega'] == 0
+    assert str(tiempos['tiempo_asignacion'].dtype) == 'Int64'
+
+
+# Horas de hora_estado: con fracción de segundo, time, nulas, mal formadas y fuera del día
+HORAS = ['08:15:30.123456', time(9, 0, 5, 999999), None, float('nan'), 'abc', '12:3O:00',
+         '10:61:00', '25:30:00', '24:00:00', '7:05:09', '23:59:59.5']
+
+
+def _limpiar_hora_por_fila(hora) -> str:
+    return str(hora).split('.')[0] if '.' in str(hora) else str(hora)
+
+
+def _instante_por_fila(fecha, hora):
+    """
+    Fecha y hora combinadas como antes de vectorizar: limpieza con split y pd.to_datetime fila por fila
+    """
+    if pd.isna(fecha):
+        return pd.NaT
+    try:
+        return pd.to_datetime(f"{fecha} {_limpiar_hora_por_fila(hora)}")
+    except ValueError:
+        return pd.NaT
+
+
+def _estados_horas() -> pd.DataFrame:
+    """
+    Un servicio por cada hora de HORAS, iniciado a esa hora y asignado a las 12:00:00;
+    el último servicio tiene la fecha de inicio nula
+    """
+    filas = []
+    for servicio_id, hora in enumerate(HORAS + ['08:00:00'], start=1):
+        filas.append((servicio_id, 1, date(2024, 3, 1), hora))
+        filas.append((servicio_id, 2, date(2024, 3, 1), '12:00:00'))
+    df = pd.DataFrame(filas, columns=['servicio_id', 'estado_id', 'fecha_estado', 'hora_estado'])
+    df.loc[(df['servicio_id'] == len(HORAS) + 1) & (df['estado_id'] == 1), 'fecha_estado'] = None
+    df['cliente_id'] = 1
+    df['mensajero_inicial_id'] = 1
+    return df
+
+
+def test_combinar_fecha_hora_igual_a_limpieza_por_fila():
+    horas = pd.Series(HORAS, dtype=object)
+    fechas = pd.Series([date(2024, 3, 1)] * (len(HORAS) - 1) + [None], dtype=object)
+    por_fila = [_instante_por_fila(fecha, hora) for fecha, hora in zip(fechas, horas)]
+
+    assert transform.combinar_fecha_hora(fechas, horas).tolist() == por_fila
+    # Las horas inválidas, nulas o fuera del día quedan nulas en lugar de pasar al día siguiente
+    normalizadas = transform.normalizar_hora(horas)
+    assert normalizadas[2:9].isna().all()
+    assert normalizadas[[0, 1, 9]].tolist() == [pd.Timedelta('08:15:30'), pd.Timedelta('09:00:05'),
+                                                 pd.Timedelta('07:05:09')]
+
+
+def test_normalizar_hora_tipada_fuera_del_dia():
+    horas = pd.Series(pd.to_timedelta(['01:00:00.5', '25:00:00', None]))
+    assert transform.normalizar_hora(horas).tolist()[0] == pd.Timedelta('01:00:00')
+    assert transform.normalizar_hora(horas)[1:].isna().all()
+
+
+def test_prepare_estados_igual_a_ruta_por_fila():
+    df = _estados_horas()
+    df_estados = transform.prepare_estados(df.copy()).set_index('servicio_id')
+
+    iniciado = df[df['estado_id'] == 1].set_index('servicio_id')
+    for servicio_id, fila in iniciado.iterrows():
+        instante = _instante_por_fila(fila['fecha_estado'], fila['hora_estado'])
+        # Antes: duración desde la hora limpiada con split, "00:00:00" si no se podía calcular
+        por_fila = transform.calcular_tiempo_entre_estados(
+            fila['fecha_estado'], _limpiar_hora_por_fila(fila['hora_estado']), date(2024, 3, 1), '12:00:00')
+        assert _segundos(por_fila) == (0 if pd.isna(instante) else abs(
+            pd.Timestamp('2024-03-01 12:00:00') - instante) // pd.Timedelta(seconds=1)), servicio_id
+
+        tiempo = df_estados.loc[servicio_id, 'tiempo_asignacion']
+        hora_del_dia = df_estados.loc[servicio_id, 'hora_del_dia']
+        if pd.isna(instante):
+            assert pd.isna(tiempo) and (pd.isna(hora_del_dia) or pd.isna(fila['fecha_estado'])), servicio_id
+        else:
+            assert tiempo == _segundos(por_fila), servicio_id
+            assert hora_del_dia == int(_limpiar_hora_por_fila(fila['hora_estado']).split(':')[0]), servicio_id
+            assert df_estados.loc[servicio_id, 'fecha_iniciado'] == instante.normalize(), servicio_id
+
+
+def test_transform_dim_mensajero_fechas_datetime64():
+    df = pd.DataFrame({
+        'mensajero_id': [1, 2],
+        'fecha_entrada': pd.to_datetime(['2024-03-01 08:30:00', None]),
+        'fecha_salida': pd.to_datetime([None, '2024-06-30']),
+        'ciudad_operacion': ['Cali', None],
+        'activo': [True, False],
+    })
+    mensajeros = transform.transform_dim_mensajero(extract.aplicar_tipos(df, extract.TIPOS_MENSAJERO))
+
+    for columna in ['fecha_entrada', 'fecha_salida', 'valido_desde', 'valido_hasta']:
+        assert pd.api.types.is_datetime64_dtype(mensajeros[columna]), columna
+    assert mensajeros['fecha_entrada'].tolist()[0] == pd.Timestamp('2024-03-01')
+    assert mensajeros['valido_hasta'].isna().all()